@@ -0,0 +1,251 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import timedelta
+import importlib
+import json
+import os
+import sys
+import time
+from typing import List
+
+from dialign_python.dialign_python_offline import INPUT_EXTENSIONS, dialign
+
+
+def _parse_window(value: str) -> int | timedelta:
+    """
+    A number of turns (e.g., 10) or a number of seconds followed by s (e.g., 30s).
+    """
+    if value.endswith('s'):
+        return timedelta(seconds=float(value[:-1]))
+    return int(value)
+
+
+def _parse_filter(value: str) -> tuple[str, List[str]]:
+    column, sep, values = value.partition('=')
+    if not sep:
+        raise argparse.ArgumentTypeError(f"Expected COLUMN=VALUE[,VALUE...], got {value}")
+    return column, values.split(',')
+
+
+def load_tokenizer(name: str):
+    """
+    Resolve a tokenizer by name.
+
+    Args:
+        name (str): spacy (tokenize in utils.py), whitespace (str.split), or module:function
+
+    Returns:
+        function: the tokenizer
+    """
+    if name == 'spacy':
+        from dialign_python.utils import tokenize
+        return tokenize
+    if name == 'whitespace':
+        return str.split
+    module, sep, function = name.partition(':')
+    if not sep:
+        raise ValueError(f"Unknown tokenizer {name}. Use spacy, whitespace, or module:function.")
+    return getattr(importlib.import_module(module), function)
+
+
+def find_inputs(paths: List[str]) -> List[str]:
+    """
+    Expand directories into the transcripts they contain (recursively, sorted).
+
+    Args:
+        paths (list): files and directories
+
+    Returns:
+        list: the files
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                dirs.sort()
+                files.extend(os.path.join(root, name) for name in sorted(names) if name.endswith(INPUT_EXTENSIONS))
+        else:
+            files.append(path)
+    return files
+
+
+def _run_file(input_file: str, options: dict, tokenizer_name: str, include: List[str]) -> tuple[dict, int]:
+    """
+    Run dialign on a file and build its output record.
+
+    Returns:
+        tuple: the record and the number of turns
+    """
+    tokenizer = load_tokenizer(tokenizer_name)
+    speaker_independent, speaker_dependent, shared_expressions, self_repetitions, online_metrics = \
+        dialign(input_file, tokenizer=tokenizer, **options)
+    record = {'file': input_file, 'speaker_independent': speaker_independent,
+              'speaker_dependent': speaker_dependent, 'self_repetitions': self_repetitions}
+    if 'shared_expressions' in include:
+        record['shared_expressions'] = shared_expressions
+    if 'online_metrics' in include:
+        record['online_metrics'] = online_metrics
+    return record, len(online_metrics)
+
+
+class JsonlSink:
+    def __init__(self, output):
+        """
+        Writes one JSON object per line and flushes after each record.
+
+        Args:
+            output (file): a text file
+        """
+        self.output = output
+
+    def write(self, record: dict):
+        self.output.write(json.dumps(record, default=str) + '\n')
+        self.output.flush()
+
+    def close(self):
+        if self.output is not sys.stdout:
+            self.output.close()
+
+
+class ParquetSink:
+    def __init__(self, path: str):
+        """
+        Writes the scores of each dialogue as a row group of a Parquet file in long format: one row per file, speaker
+        (empty for speaker-independent scores), metric, and value. Requires pyarrow.
+
+        Args:
+            path (str): the Parquet file
+        """
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("Parquet output requires pyarrow. Install it with pip install pyarrow.") from e
+        self._pa = pa
+        self.schema = pa.schema([('file', pa.string()), ('speaker', pa.string()), ('metric', pa.string()),
+                                 ('value', pa.float64())])
+        self.writer = pq.ParquetWriter(path, self.schema)
+
+    def write(self, record: dict):
+        rows = {'file': [], 'speaker': [], 'metric': [], 'value': []}
+
+        def add(speaker, scores):
+            for metric, value in scores.items():
+                rows['file'].append(record['file'])
+                rows['speaker'].append(speaker)
+                rows['metric'].append(metric)
+                rows['value'].append(float(value))
+
+        add('', record['speaker_independent'])
+        for scores in (record['speaker_dependent'], record['self_repetitions']):
+            for speaker, data in scores.items():
+                add(str(speaker), data)
+        self.writer.write_table(self._pa.table(rows, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='dialign', description="Run dialign on transcripts and write the scores of "
+                                                                 "each dialogue as soon as it is done.")
+    parser.add_argument('inputs', nargs='+', help=f"transcripts or directories of transcripts "
+                                                  f"({', '.join(INPUT_EXTENSIONS)})")
+    parser.add_argument('-o', '--output', default='-', help="output file. Defaults to stdout (JSONL only).")
+    parser.add_argument('--format', choices=['jsonl', 'parquet'], default='jsonl', help="output format")
+    parser.add_argument('-j', '--jobs', type=int, default=1, help="number of dialogues processed in parallel")
+    parser.add_argument('--speaker-col', default='Speaker', help="column of the speakers")
+    parser.add_argument('--message-col', default='Utterance', help="column of the messages")
+    parser.add_argument('--timestamp-col', default=None, help="column of the timestamps")
+    parser.add_argument('--time-format', default="%Y-%m-%d %H:%M:%S", help="format of the timestamps")
+    parser.add_argument('--sheet-name', default=None, help="sheet of .xlsx files")
+    parser.add_argument('--valid-speakers', nargs='+', default=None, help="speakers to include")
+    parser.add_argument('--filter', dest='filters', action='append', type=_parse_filter, default=None,
+                        metavar='COLUMN=VALUE[,VALUE...]', help="keep rows whose COLUMN is one of the values")
+    parser.add_argument('--window', type=_parse_window, default=None,
+                        help="number of turns (e.g., 10) or seconds (e.g., 30s) of history")
+    parser.add_argument('--exception-tokens', nargs='+', default=None, help="tokens to exclude")
+    parser.add_argument('--min-ngram', type=int, default=1, help="minimum n-gram length")
+    parser.add_argument('--max-ngram', type=int, default=None, help="maximum n-gram length")
+    parser.add_argument('--tokenizer', default='spacy',
+                        help="spacy (default), whitespace, or module:function taking a string and returning tokens")
+    parser.add_argument('--include', nargs='+', choices=['shared_expressions', 'online_metrics'], default=[],
+                        help="additional outputs in JSONL records")
+    parser.add_argument('-q', '--quiet', action='store_true', help="do not report progress")
+    return parser
+
+
+def main(argv: List[str] | None = None) -> int:
+    """
+    Entry point of the dialign command.
+
+    Returns:
+        int: the exit status. 1 if any dialogue failed.
+    """
+    args = build_parser().parse_args(argv)
+    inputs = find_inputs(args.inputs)
+    options = {'speaker_col': args.speaker_col, 'message_col': args.message_col, 'timestamp_col': args.timestamp_col,
+               'valid_speakers': args.valid_speakers, 'sheet_name': args.sheet_name,
+               'filters': dict(args.filters) if args.filters else None, 'window': args.window,
+               'exception_tokens': args.exception_tokens, 'min_ngram': args.min_ngram, 'max_ngram': args.max_ngram,
+               'time_format': args.time_format}
+
+    if args.format == 'parquet':
+        if args.output == '-':
+            print("Parquet output needs --output.", file=sys.stderr)
+            return 2
+        sink = ParquetSink(args.output)
+    elif args.output == '-':
+        sink = JsonlSink(sys.stdout)
+    else:
+        sink = JsonlSink(open(args.output, 'w', encoding='utf-8'))
+
+    start = time.perf_counter()
+    total_turns = 0
+    failures = 0
+
+    def report(done, input_file, turns=None, error=None):
+        if args.quiet:
+            return
+        elapsed = time.perf_counter() - start
+        if error is None:
+            status = f"{turns} turns"
+        else:
+            status = f"failed: {error!r}"
+        print(f"[{done}/{len(inputs)}] {input_file}: {status} ({total_turns / max(elapsed, 1e-9):.1f} turns/s)",
+              file=sys.stderr)
+
+    executor = ProcessPoolExecutor(max_workers=args.jobs) if args.jobs > 1 else None
+    try:
+        if executor is None:
+            results = ((input_file, lambda f=input_file: _run_file(f, options, args.tokenizer, args.include))
+                       for input_file in inputs)
+        else:
+            futures = {executor.submit(_run_file, input_file, options, args.tokenizer, args.include): input_file
+                       for input_file in inputs}
+            results = ((futures[future], future.result) for future in as_completed(futures))
+
+        for done, (input_file, result) in enumerate(results, start=1):
+            try:
+                record, turns = result()
+            except Exception as e:
+                failures += 1
+                report(done, input_file, error=e)
+                continue
+            sink.write(record)
+            total_turns += turns
+            report(done, input_file, turns)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        sink.close()
+
+    if not args.quiet:
+        elapsed = time.perf_counter() - start
+        print(f"{len(inputs) - failures} dialogues, {total_turns} turns in {elapsed:.2f}s "
+              f"({total_turns / max(elapsed, 1e-9):.1f} turns/s), {failures} failed", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
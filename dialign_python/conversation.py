@@ -1,9 +1,38 @@
+import csv
+import itertools
+import os
+import sys
 import time
-import copy
-from collections import Counter
+import weakref
+from collections import Counter, namedtuple
 from datetime import datetime, timedelta
-from typing import Dict, List, Any, Set
+from typing import Callable, Dict, List, Set
+from dialign_python.coverage import CoverageMatcher
+from dialign_python.events import ConversationEvents
+from dialign_python.expression import PendingExpression, SharedExpressionLexicon
+from dialign_python.history import History, Turn, Vocabulary
+from dialign_python.memory import deep_sizeof
+from dialign_python.ngrams import NGramStore
 from dialign_python.person import Person
+from dialign_python.transcript_writer import TranscriptWriter
+
+
+class ScoreResult(namedtuple('ScoreResult', ['der', 'dser', 'dee', 'established_expressions', 'repeated_expressions',
+                                             'personal_repetitions'])):
+    """
+    The scores and expressions of a message (see Conversation.score_message). It unpacks like a tuple. degraded tells
+    that the budget of the scoring was exceeded, so the past messages compared after the deadline were only compared
+    on their short n-grams (see Conversation.degraded_max_ngram).
+    """
+    degraded = False
+
+    def __new__(cls, der, dser, dee, established_expressions, repeated_expressions, personal_repetitions,
+                degraded: bool = False):
+        result = super().__new__(cls, der, dser, dee, established_expressions, repeated_expressions,
+                                 personal_repetitions)
+        if degraded:
+            result.degraded = True
+        return result
 
 
 class Conversation:
@@ -14,7 +43,10 @@ class Conversation:
                  exception_tokens: List[str] | None = None, 
                  min_ngram: int = 1, 
                  max_ngram: int | None = None,
-                 time_format: str = "%Y-%m-%d %H:%M:%S"
+                 time_format: str = "%Y-%m-%d %H:%M:%S",
+                 vocabulary: Vocabulary | None = None,
+                 ngram_store: NGramStore | None = None,
+                 history_store: History | None = None
                 ):
         """
         Initializes a conversation instance. min_ngram and max_ngram are constraints on the length of n_grams to
@@ -27,10 +59,25 @@ class Conversation:
         array of strings not to include in calculation. Defaults to an empty list. min_ngram (int, optional):
         constraints on the length of n_grams to check for. Defaults to 1. max_ngram (int, optional): constraints on
         the length of n_grams to check for. Defaults to None. time_format (str, optional): format of the timestamp.
-        Defaults to "%Y-%m-%d %H:%M:%S".
+        Defaults to "%Y-%m-%d %H:%M:%S". vocabulary (Vocabulary, optional): the vocabulary messages are encoded with.
+        Conversations that share a vocabulary can share n-gram artifacts (see prime_n_gram_artifacts). Use
+        Vocabulary.shared() to store the tokens of all the conversations of a process once. Defaults to the
+        vocabulary of ngram_store, or a new vocabulary. ngram_store (NGramStore, optional): the store the n-grams of
+        messages are shared through, e.g., NGramStore.shared(). It must use the vocabulary of the conversation.
+        Defaults to None (n-grams are cached per conversation). history_store (History, optional): the history the
+        messages are stored in, e.g., a SQLiteHistory for sessions that do not fit in memory. history is appended to
+        it. Defaults to a new History in memory.
         """
-        if history is None:
-            history = []
+        if history_store is not None:
+            if vocabulary is None:
+                vocabulary = history_store.vocabulary
+            elif vocabulary is not history_store.vocabulary:
+                raise ValueError("The history store uses another vocabulary than the conversation.")
+        if ngram_store is not None:
+            if vocabulary is None:
+                vocabulary = ngram_store.vocabulary
+            elif vocabulary is not ngram_store.vocabulary:
+                raise ValueError("The n-gram store uses another vocabulary than the conversation.")
         if persons is None:
             persons = {}
         if isinstance(persons, list):
@@ -38,8 +85,20 @@ class Conversation:
         if exception_tokens is None:
             exception_tokens = []
 
-        self.history = history
-        self.length = len(history)
+        self.time_format = time_format
+
+        # The history stores Turn records with interned token ids and parsed timestamps. It reads like a list of
+        # (timestamp, speaker, message) tuples.
+        if history_store is not None:
+            history_store.time_format = time_format
+            history_store.parse_times = isinstance(window, timedelta)
+            for turn in history if history is not None else ():
+                history_store.append(turn)
+            self.history = history_store
+        else:
+            self.history = History(history if history is not None else (), time_format=time_format,
+                                   vocabulary=vocabulary, parse_times=isinstance(window, timedelta))
+        self.length = len(self.history)
         self.window = window
 
         # speakers
@@ -47,41 +106,94 @@ class Conversation:
 
         # function words seem to be discarded by the tool as non-essential to tracking lexical alignment
         self.exception_tokens = exception_tokens
+        # Exception tokens are filtered out of the matches, not out of the cached n-grams, so that changing them does
+        # not invalidate the caches. Keep in sync with exception_tokens (see except_token and include_token).
+        self._exception_set = set(exception_tokens)
 
         # definitions for n_gram lengths, needed for potential optimization of n_gram calculation
         self.min_ngram = min_ngram
         self.max_ngram = max_ngram
 
-        self.time_format = time_format
-
         # Shared expressions. The key is a expression and the value is a dictionary of the speakers who initiated the
         # expression (initiator) and established the expression (establisher).
-        self.shared_expressions = {}
+        self.shared_expressions = SharedExpressionLexicon()
 
-        # output file
+        # output file. The writer is created on the first save so that conversations that are never saved do not
+        # touch the file system.
         self.output_file = "conversation_output.txt"
+        self._writer = None
 
-        # Cache n-gram generation by effective message/config tuple.
+        # Cache n-gram generation by n-gram lengths and then by encoded message (see Vocabulary.encode). The cached
+        # n-grams include exception tokens.
         self._ngram_cache = {}
-        # Cache derived artifacts to avoid rebuilding set/counter for repeated history messages.
+        # Cache derived artifacts to avoid rebuilding set/counter for repeated history messages. Same keys as
+        # _ngram_cache.
         self._ngram_artifact_cache = {}
-        # Cache parsed timestamps to avoid repeated datetime.strptime on identical strings.
-        self._timestamp_cache = {}
-        self._timestamp_cache_max_size = 10000
+        # Per n-gram configuration, the n-grams each speaker (by id) has produced in the history. It is a superset of
+        # the n-grams of the speaker's turns in the window and is built on first use.
+        self._speaker_n_grams = {}
+        # Speakers (by id) whose index lacks the n-grams of a turn, which are then not pruned by the index, and the
+        # encoded message being added whose n-grams a degraded analysis did not build (see score_message).
+        self._unindexed_speakers = set()
+        self._unindexed_tokens = None
+        # The artifacts acquired from the n-gram store are given back when they leave the caches or when the
+        # conversation is garbage collected.
+        self._ngram_store = ngram_store
+        self._store_keys = set()
+        if ngram_store is not None:
+            weakref.finalize(self, ngram_store.release_later, self._store_keys)
+        # With a window, the caches and the indexes are pruned to the window once they hold more than this many
+        # messages and four times the window (see _prune_caches).
+        self._cache_min_size = 4096
+
+        # Counts of past turns considered by the analysis, skipped by their token signature or by the speaker n-gram
+        # index, and compared (see stats)
+        self._turn_stats = Counter()
+
+        # Precomputed free-form flags of matches (see prime_free_form_flags)
+        self._free_form_flags = None
+
+        # Establishment, repetition, eviction, and score events (see ConversationEvents). Silent unless subscribed.
+        self.events = ConversationEvents()
+
+        # Per speaker, the tokens of the messages scored and added to the history, and how many of them were covered
+        # by shared expressions (ER), establishments (EE), and self-repetitions (SER) (see metrics)
+        self._token_counts: Dict[str, Counter] = {}
+
+        # Once the budget of score_message is exceeded, past messages are compared on their n-grams of at most this
+        # many words. _deadline is the perf_counter time the current scoring must end by, and _degraded tells that it
+        # was exceeded.
+        self.degraded_max_ngram = 2
+        self._deadline = None
+        self._degraded = False
+
+    def __getstate__(self):
+        # The n-gram caches are rebuilt on demand, so they are not pickled.
+        state = self.__dict__.copy()
+        state['_ngram_cache'] = {}
+        state['_ngram_artifact_cache'] = {}
+        # Copies get a private vocabulary, so they cannot use the store.
+        state['_ngram_store'] = None
+        state['_store_keys'] = set()
+        state['_speaker_n_grams'] = {}
+        state['_unindexed_speakers'] = set()
+        state['_free_form_flags'] = None
+        # Callbacks are often closures, which cannot be pickled.
+        state['events'] = ConversationEvents()
+        # Methods wrapped by a TraceRecorder
+        for name in ('add_message', 'score_message', 'request'):
+            state.pop(name, None)
+        return state
 
     def _parse_timestamp(self, timestamp: str) -> datetime:
-        cached = self._timestamp_cache.get(timestamp)
-        if cached is not None:
-            return cached
-
-        if len(self._timestamp_cache) >= self._timestamp_cache_max_size:
-            oldest_key = next(iter(self._timestamp_cache))
-            del self._timestamp_cache[oldest_key]
-
-        parsed = datetime.strptime(timestamp, self.time_format)
-        self._timestamp_cache[timestamp] = parsed
+        parsed = self.history.parse_timestamp(timestamp)
+        if parsed is None:
+            raise ValueError(f"Timestamp {timestamp} does not match the format {self.time_format}.")
         return parsed
 
+    def _speaker_bit(self, speaker: str) -> int:
+        return 1 << self.history.speaker_id(speaker)
+
     def add_message(self, 
                     speaker: str, 
                     message: str, 
@@ -106,15 +218,36 @@ class Conversation:
             timestamp = time.strftime(self.time_format)
 
         # Add the message to the conversation history and remove messages outside the window
-        self.history.append((timestamp, speaker, message))
+        turn = self.history.append((timestamp, speaker, message))
+        self._index_turn(turn)
         if self.window is not None:
+            evicted = []
             if isinstance(self.window, int):
                 if len(self.history) > self.window:
-                    self.history.pop(0)
+                    evicted = self.history.turns[:1]
+                    self.history.evict(1)
             elif isinstance(self.window, timedelta):
-                current_time = self._parse_timestamp(timestamp)
-                self.history = [(time, speaker, message) for time, speaker, message in self.history if
-                                current_time - self._parse_timestamp(time) <= self.window]
+                if turn.time is None:
+                    self._parse_timestamp(timestamp)
+                kept = []
+                oldest = True
+                for past_turn in self.history.turns:
+                    if turn.time - past_turn.time <= self.window:
+                        kept.append(past_turn)
+                    else:
+                        evicted.append(past_turn)
+                        oldest = oldest and not kept
+                if evicted:
+                    if oldest:
+                        # The turns left are the newest ones, so the history only drops its oldest turns, which
+                        # stores like SQLiteHistory do without rewriting the turns left.
+                        self.history.evict(len(evicted))
+                    else:
+                        self.history.turns = kept
+            if evicted and 'eviction' in self.events:
+                self.events.emit('eviction', turns=[self.history.as_tuple(past_turn) for past_turn in evicted])
+        if self.window is not None or not self.history.resident:
+            self._prune_caches()
         self.length = len(self.history)
 
     def score_message(self, 
@@ -122,8 +255,9 @@ class Conversation:
                       message: str, 
                       timestamp: str | None = None, 
                       add_message_to_history: bool = True, 
-                      focus_conversation: List[str] | None = None
-                      ) -> tuple[float, float, float, List[str], List[str], List[str]]:
+                      focus_conversation: List[str] | None = None,
+                      budget: float | None = None
+                      ) -> ScoreResult:
         """
         Function for scoring a message in relation to the conversation.
 
@@ -133,9 +267,15 @@ class Conversation:
             message (str): the utterance to be scored
             timestamp (str, optional): the string representation of the timestamp of the message. Defaults to None.
             focus_conversation (List[str], optional): The list of speakers to focus on. Defaults to None.
+            budget (float, optional): the number of seconds the analysis should take at most. Once it is exceeded, the
+            remaining past messages are compared only on their n-grams of at most degraded_max_ngram words, which
+            bounds the cost of long messages, and the result is flagged as degraded. The n-grams of the message are
+            built within the budget too. A degraded analysis is committed to the lexicon if the message is added, so
+            the lexicon can differ from an analysis without budget: longer expressions are missed, and their shorter
+            n-grams may be established instead. Defaults to None (no budget).
 
         Returns:
-            tuple: A tuple containing the following elements:
+            ScoreResult: A tuple containing the following elements:
                 - der (float): DER score
                 - dser (float): DSER score
                 - dee (float): DEE score
@@ -146,39 +286,77 @@ class Conversation:
         if speaker not in self.persons:
             self.persons[speaker] = Person(speaker)
 
-        if not add_message_to_history:
-            saved_shared_expressions = copy.deepcopy(self.shared_expressions)
-
         if focus_conversation is not None:
             for person in focus_conversation:
                 if person not in self.persons:
-                    return 0, 0, 0, [], [], []
-            der, dser, dee, established_expressions, repeated_expressions, personal_repetitions = self.sub_conversation(focus_conversation, speaker, message)
-        else:
-            if self.length == 0:
-                der, dser, dee = 0, 0, 0
-            self.analyze_conversation()
-            established_expressions, personal_repetitions, repeated_expressions, _ = self.analyze_message(speaker, message)
+                    return ScoreResult(0, 0, 0, [], [], [])
+
+        if not add_message_to_history:
+            saved_shared_expressions = self.shared_expressions
+            saved_shared_expressions.begin()
+
+        self._deadline = time.perf_counter() + budget if budget is not None else None
+        self._degraded = False
+        try:
+            if focus_conversation is not None:
+                der, dser, dee, established_expressions, repeated_expressions, personal_repetitions = self.sub_conversation(focus_conversation, speaker, message)
+            else:
+                if self.length == 0:
+                    der, dser, dee = 0, 0, 0
+                self.analyze_conversation()
+                established_expressions, personal_repetitions, repeated_expressions, _ = self.analyze_message(speaker, message)
 
-            dee = self.calculate_dee(established_expressions, message)
-            der, dser = self.create_scores(speaker, message)
+                dee = self.calculate_dee(established_expressions, message)
+                der, dser = self.create_scores(speaker, message)
+        finally:
+            self._deadline = None
+
+        if add_message_to_history and self._degraded:
+            tokens = self.history.vocabulary.encode(message)
+            if tokens not in self._ngram_artifact_cache.get(self._n_gram_config(), {}):
+                self._unindexed_tokens = tokens
 
         if not add_message_to_history:
             # removing shared expressions from array if the speaker and message are not to be added to conversation
             # history
+            saved_shared_expressions.rollback()
             self.shared_expressions = saved_shared_expressions
             for n_gram in personal_repetitions:
                 self.persons[speaker].remove_repetition(n_gram)
         else:
-            self.add_message(speaker, message, timestamp)
-
-        return der, dser, dee, established_expressions, repeated_expressions, personal_repetitions
+            if self.events:
+                self._emit_analysis(speaker, message, established_expressions, repeated_expressions,
+                                    personal_repetitions)
+            try:
+                self.add_message(speaker, message, timestamp)
+            finally:
+                self._unindexed_tokens = None
+            num_tokens = len(message.split())
+            counts = self._token_counts.setdefault(speaker, Counter())
+            counts['Total tokens'] += num_tokens
+            counts['ER'] += round(der * num_tokens)
+            counts['EE'] += round(dee * num_tokens)
+            counts['SER'] += round(dser * num_tokens)
+        if 'score' in self.events:
+            self.events.emit('score', speaker=speaker, message=message, der=der, dser=dser, dee=dee)
+
+        return ScoreResult(der, dser, dee, established_expressions, repeated_expressions, personal_repetitions,
+                           degraded=self._degraded)
+
+    def _emit_analysis(self, speaker: str, message: str, established_expressions: List[str],
+                       repeated_expressions: List[str], personal_repetitions: List[str]):
+        """
+        Emit the establishment, repetition, and self-repetition events of a message added to the history.
+        """
+        for event, expressions in (('establishment', established_expressions), ('repetition', repeated_expressions),
+                                   ('self_repetition', personal_repetitions)):
+            if expressions and event in self.events:
+                self.events.emit(event, speaker=speaker, message=message, expressions=list(expressions))
 
     def _score_sub_conversation(self, speaker: str, message: str) -> tuple[float, float, float, List[str], List[str], List[str]]:
         if self.length == 0:
             return 0, 0, 0, [], [], []
 
-        print(f'This is the history {self.history}')
         self.analyze_conversation()
 
         established_expressions, personal_repetitions, repeated_expressions, _ = self.analyze_message(speaker, message)
@@ -212,9 +390,9 @@ class Conversation:
 
         speakers = {s: self.persons[s] for s in focus_conversation if s in self.persons}
         count = 0
-        for timestamp, speaker, past_message in reversed(self.history):
-            if speaker in focus_conversation:
-                sub_history.append((timestamp, speaker, past_message))
+        for turn in reversed(self.history.turns):
+            if self.history.speaker(turn) in focus_conversation:
+                sub_history.append(self.history.as_tuple(turn))
                 count += 1
             # if count == self.window:
             #     break
@@ -229,14 +407,17 @@ class Conversation:
 
         sub_conversation = Conversation(sub_history, self.window, speakers, self.exception_tokens, self.min_ngram,
                                         self.max_ngram)
+        sub_conversation.degraded_max_ngram = self.degraded_max_ngram
+        sub_conversation._deadline = self._deadline
         der, dser, dee, established_expressions, repeated_expressions, personal_repetitions = sub_conversation._score_sub_conversation(speaker, message)
+        self._degraded = self._degraded or sub_conversation._degraded
         del sub_conversation
         return der, dser, dee, established_expressions, repeated_expressions, personal_repetitions
 
     def analyze_message(self,
                         current_speaker: str,
                         message: str,
-                        sub_window: List[tuple[str, str, str]] | None = None) -> tuple[List[str], List[str], List[str], Dict[str, Dict[str, Any]]]:
+                        sub_window: History | List[tuple[str, str, str]] | None = None) -> tuple[List[str], List[str], List[str], Dict[str, PendingExpression]]:
         """
         incorporates the message into the conversation sequence and recalculates measurements
 
@@ -250,91 +431,344 @@ class Conversation:
                 - additions (list): List of newly established shared expressions
                 - individual_repetitions (list): List of self-repeated expressions
                 - expression_repetitions (list): List of repeated expressions
-                - not_shared_expressions (dict): Expressions shared by 2 or more speakers but not shared by all speakers. The key is a expression and the value is a dict that contains the list of the speaker who used the expression and whether it's a free form.
+                - not_shared_expressions (dict): Expressions shared by 2 or more speakers but not shared by all speakers. The key is a expression and the value is a PendingExpression with the initiator, the bitmask of the speakers who used the expression (see _speaker_bit), and whether it's a free form.
         """
+        indexed = sub_window is None or sub_window is self.history
+        if indexed:
+            turns = self.history.turns
+        else:
+            turns = [turn if isinstance(turn, Turn) else self.history.make_turn(*turn) for turn in sub_window]
+        return self._analyze_turns(current_speaker, self.history.vocabulary.encode(message), turns, len(turns),
+                                   indexed)
+
+    def _speaker_n_gram_index(self, config: tuple) -> Dict[int, set[str]]:
+        index = self._speaker_n_grams.get(config)
+        if index is None:
+            index = self._speaker_n_grams[config] = {}
+            for turn in self.history.turns:
+                index.setdefault(turn.speaker_id, set()).update(self._get_n_gram_artifacts(turn.tokens, config)[1])
+        return index
+
+    def _index_turn(self, turn: Turn):
+        """
+        Add the n-grams of a turn appended to the history to the speaker n-gram indexes.
+        """
+        if self._speaker_n_grams and turn.tokens == self._unindexed_tokens:
+            # Building the n-grams of a long message is what the budget of score_message bounds, so they are not built
+            # to index it.
+            self._unindexed_speakers.add(turn.speaker_id)
+            return
+        for config, index in self._speaker_n_grams.items():
+            index.setdefault(turn.speaker_id, set()).update(self._get_n_gram_artifacts(turn.tokens, config)[1])
 
+    def _analyze_turns(self, current_speaker: str, tokens: bytes, turns: List[Turn], stop: int, indexed: bool = False) -> tuple[List[str], List[str], List[str], Dict[str, PendingExpression]]:
+        """
+        analyze_message on token ids against turns[:stop]. indexed tells that the turns were appended to the history,
+        so the speaker n-gram index covers them.
+        """
         punctuations = {'.', ',', '!', '?'}
 
-        n_gram_set, current_set, current_counts = self._get_n_gram_artifacts(message)
-
-        if sub_window is None:
-            sub_window = self.history
+        config = self._n_gram_config()
+        # Past the deadline of score_message, current_set is bounded to short n-grams (see degraded_max_ngram). The
+        # n-grams of the message are built before any comparison, so the deadline is checked while building them.
+        deadline = self._deadline
+        bounded = False
+        if deadline is None:
+            artifacts = self._get_n_gram_artifacts(tokens, config)
+        else:
+            artifacts = self._get_n_gram_artifacts(tokens, config, deadline)
+            if artifacts is None:
+                artifacts = self._degraded_n_gram_artifacts(tokens, config)
+                bounded = True
+        n_gram_set, current_set, current_counts = artifacts
+        artifact_cache = self._ngram_artifact_cache[config]
+        # Turns that have no token in common with the message cannot share an n-gram with it.
+        signature = Vocabulary.signature(tokens)
+        # Precomputed matches with past messages (see prime_free_form_flags)
+        flags = None
+        if self._free_form_flags is not None:
+            flag_config, flag_exceptions, all_flags = self._free_form_flags
+            if flag_config == config and flag_exceptions == self._exception_set:
+                flags = all_flags.get(tokens)
+        if self._exception_set:
+            # Matches are intersections with the current n-grams, so filtering them once filters every match.
+            current_set = current_set - self._exception_set
 
         additions = []
         individual_repetitions = []
         expression_repetitions = set()
-        sub_window_len = len(sub_window)
+        sub_window_len = stop
 
-        # Cache past n-grams/counters by message text for this scoring pass.
-        per_message_cache = {}
         # Tracks potential shared expressions until all speakers have used the expression.
         pending_shared_expressions = {}
-        repetitions = set(self.persons[current_speaker].repetitions)
-
-        for i, turn in enumerate(sub_window):
-            timestamp, speaker, past_message = turn[0], turn[1], turn[2]
-            cache_key = past_message
-            cached = per_message_cache.get(cache_key)
+        person = self.persons[current_speaker]
+        shared_expressions = self.shared_expressions
+        # Speakers are bits of an integer so that "used by all speakers" is a single comparison.
+        current_speaker_id = self.history.speaker_id(current_speaker)
+        current_speaker_bit = 1 << current_speaker_id
+        all_speakers = 0
+        for name in self.persons:
+            all_speakers |= self._speaker_bit(name)
+        speakers = self.history.speakers
+
+        # Only n-grams the current speaker has produced before can become self-repetitions. Same-speaker turns are
+        # compared only while such candidates remain and only if they contain one.
+        candidates = None
+        if indexed and self.history.resident and current_speaker_id not in self._unindexed_speakers:
+            produced = self._speaker_n_gram_index(config).get(current_speaker_id, ())
+            candidates = {n_gram for n_gram in current_set if n_gram in produced and n_gram not in punctuations and
+                          not person.has_repetition(n_gram)}
+
+        # The artifacts of turns read from a history store are cached only up to the limit of the caches.
+        cache_limit = None if self.history.resident else self._cache_limit()
+
+        # Expressions added by the same turn are added in the order they occur in the message, not in the order of
+        # the set of matches, which depends on string hashing. Ties of DER and DSER, and the order of the repeated
+        # expressions, are then the same in every process.
+        positions = {}
+
+        def message_order(n_gram: str) -> int:
+            if not positions:
+                for position, message_n_gram in enumerate(n_gram_set):
+                    positions.setdefault(message_n_gram, position)
+            return positions[n_gram]
+
+        signature_skips = 0
+        index_skips = 0
+        for i, turn in enumerate(itertools.islice(turns, stop)):
+            if not turn.signature & signature:
+                signature_skips += 1
+                continue
+            if candidates is not None and turn.speaker_id == current_speaker_id and not candidates:
+                index_skips += 1
+                continue
+            if flags is not None:
+                not_free = flags.get(turn.tokens)
+                if not_free is None:
+                    signature_skips += 1
+                    continue
+            cached = artifact_cache.get(turn.tokens)
             if cached is None:
-                past_n_grams, past_set, past_counts = self._get_n_gram_artifacts(past_message)
-                per_message_cache[cache_key] = (past_n_grams, past_set, past_counts)
+                if bounded:
+                    # Only the short n-grams of the past message can match the bounded ones of the message.
+                    cached = self._degraded_n_gram_artifacts(turn.tokens, config)
+                elif cache_limit is not None and len(artifact_cache) >= cache_limit:
+                    cached = self._build_n_gram_artifacts(turn.tokens, config, deadline)
+                else:
+                    cached = self._get_n_gram_artifacts(turn.tokens, config, deadline)
+                if cached is None:
+                    current_set = self._bound_n_grams(current_set)
+                    bounded = True
+                    cached = self._degraded_n_gram_artifacts(turn.tokens, config)
+            past_n_grams, past_set, past_counts = cached
+            if candidates is not None and turn.speaker_id == current_speaker_id and candidates.isdisjoint(past_set):
+                index_skips += 1
+                continue
+
+            if deadline is not None and not bounded and time.perf_counter() > deadline:
+                current_set = self._bound_n_grams(current_set)
+                bounded = True
+            if flags is not None:
+                matching_n_grams = {n_gram: n_gram not in not_free for n_gram in current_set & past_set}
             else:
-                past_n_grams, past_set, past_counts = cached
-
-            matching_n_grams = self._compare_precomputed(
-                n_gram_set,
-                past_n_grams,
-                current_counts,
-                past_counts,
-                current_set,
-                past_set,
-            )
-            if speaker == current_speaker:
-                for n_gram, free_form in matching_n_grams.items():
-                    if n_gram not in repetitions and n_gram not in punctuations and free_form:
-                        individual_repetitions.append(n_gram)
-                        self.persons[current_speaker].add_repetition(n_gram)
-                        repetitions.add(n_gram)
+                matching_n_grams = self._compare_precomputed(
+                    n_gram_set,
+                    past_n_grams,
+                    current_counts,
+                    past_counts,
+                    current_set,
+                    past_set,
+                    None if bounded else deadline,
+                )
+                if matching_n_grams is None:
+                    # The deadline passed during the comparison
+                    current_set = self._bound_n_grams(current_set)
+                    bounded = True
+                    matching_n_grams = self._compare_precomputed(n_gram_set, past_n_grams, current_counts,
+                                                                 past_counts, current_set, past_set)
+            if turn.speaker_id == current_speaker_id:
+                repeated = [n_gram for n_gram, free_form in matching_n_grams.items()
+                            if free_form and n_gram not in punctuations and not person.has_repetition(n_gram)]
+                if len(repeated) > 1:
+                    repeated.sort(key=message_order)
+                for n_gram in repeated:
+                    individual_repetitions.append(n_gram)
+                    person.add_repetition(n_gram)
+                    if candidates is not None:
+                        candidates.discard(n_gram)
             else:
+                speaker = speakers[turn.speaker_id]
+                speaker_bit = 1 << turn.speaker_id
+                established = []
                 for n_gram, free_form in matching_n_grams.items():
                     # Keep track of turns where shared expressions are used
-                    if n_gram in self.shared_expressions:
+                    if n_gram in shared_expressions:
                         expression_repetitions.add(n_gram)
-                        if i not in self.shared_expressions[n_gram]['turns']:
-                            self.shared_expressions[n_gram]['turns'].append(i)
-                        if sub_window_len not in self.shared_expressions[n_gram]['turns']:
-                            self.shared_expressions[n_gram]['turns'].append(sub_window_len)
+                        shared_expressions.add_turn(n_gram, i)
+                        shared_expressions.add_turn(n_gram, sub_window_len)
 
-                    if n_gram not in self.shared_expressions and n_gram not in punctuations:
-                        if n_gram not in pending_shared_expressions:
+                    elif n_gram not in punctuations:
+                        pending = pending_shared_expressions.get(n_gram)
+                        if pending is None:
                             if len(self.persons) == 2:  # not shared expressions are always empty in a two person
                                 # conversation
                                 if free_form:
-                                    additions.append(n_gram)
-                                    expression_repetitions.add(n_gram)
-                                    self.shared_expressions[n_gram] = {'initiator': speaker,
-                                                                       'establisher': current_speaker,
-                                                                       'establishmemt turn': sub_window_len,
-                                                                       'turns': [i, sub_window_len]}
+                                    established.append((n_gram, speaker))
                             else:
-                                pending_shared_expressions[n_gram] = {
-                                    'initiator': speaker,
-                                    'speakers': {speaker, current_speaker},
-                                    'free_form': free_form,
-                                }
+                                pending_shared_expressions[n_gram] = PendingExpression(
+                                    speaker, speaker_bit | current_speaker_bit, free_form)
                         else:
-                            pending = pending_shared_expressions[n_gram]
-                            pending['free_form'] = pending['free_form'] or free_form
-                            pending['speakers'].add(speaker)
-                            if len(pending['speakers']) == len(self.persons) and pending['free_form']:
-                                additions.append(n_gram)
-                                expression_repetitions.add(n_gram)
-                                self.shared_expressions[n_gram] = {
-                                    'initiator': pending['initiator'],
-                                    'establisher': current_speaker, 'establishmemt turn': sub_window_len,
-                                    'turns': [i, sub_window_len]}
+                            pending.free_form = pending.free_form or free_form
+                            pending.speakers |= speaker_bit
+                            if pending.speakers == all_speakers and pending.free_form:
+                                established.append((n_gram, pending.initiator))
                                 del pending_shared_expressions[n_gram]
-        return additions, individual_repetitions, list(expression_repetitions), pending_shared_expressions
+                if len(established) > 1:
+                    established.sort(key=lambda addition: message_order(addition[0]))
+                for n_gram, initiator in established:
+                    additions.append(n_gram)
+                    expression_repetitions.add(n_gram)
+                    shared_expressions.establish(n_gram, initiator, current_speaker, sub_window_len,
+                                                 (i, sub_window_len))
+
+        stats = self._turn_stats
+        stats['turns'] += stop
+        stats['skipped_by_signature'] += signature_skips
+        stats['skipped_by_speaker_index'] += index_skips
+        stats['compared'] += stop - signature_skips - index_skips
+        return (additions, individual_repetitions, sorted(expression_repetitions, key=message_order),
+                pending_shared_expressions)
+
+    def metrics(self) -> tuple[Dict[str, float], Dict[str, Dict[str, float]], Dict[str, Dict[str, float]]]:
+        """
+        The measures of dialign (see dialign_python_offline.dialign) for the messages scored and added to the history
+        so far, with tokens counted by splitting the messages on whitespace. They are computed from running counts in
+        O(speakers), so they can be polled during a session. With a window, the shared expressions are those of the
+        current window.
+
+        Returns:
+            tuple: A tuple containing the following elements:
+                - speaker_independent (dict): ER, SER, EE, Total tokens, Num. shared expressions, EV, ENTR, L, and LMAX
+                - speaker_dependent (dict): ER, EE, Total tokens, Initiated, and Established of each speaker
+                - self_repetitions (dict): SER, SEV, SENTR, SL, and SLMAX of each speaker
+        """
+        def ratio(numerator, denominator):
+            return numerator / denominator if denominator else 0.0
+
+        lexicon = self.shared_expressions
+        num_expressions = len(lexicon)
+        totals = Counter()
+        for counts in self._token_counts.values():
+            totals.update(counts)
+        total_tokens = totals['Total tokens']
+        speaker_independent = {'ER': ratio(totals['ER'], total_tokens), 'SER': ratio(totals['SER'], total_tokens),
+                               'EE': ratio(totals['EE'], total_tokens), 'Total tokens': total_tokens,
+                               'Num. shared expressions': num_expressions,
+                               'EV': ratio(num_expressions, total_tokens), 'ENTR': lexicon.lengths.entropy(),
+                               'L': lexicon.lengths.mean(), 'LMAX': lexicon.lengths.max}
+
+        speaker_dependent = {}
+        self_repetitions = {}
+        for speaker, person in self.persons.items():
+            counts = self._token_counts.get(speaker, Counter())
+            tokens = counts['Total tokens']
+            speaker_dependent[speaker] = {'ER': ratio(counts['ER'], tokens), 'EE': ratio(counts['EE'], tokens),
+                                          'Total tokens': tokens,
+                                          'Initiated': ratio(lexicon.initiated[speaker], num_expressions),
+                                          'Established': ratio(lexicon.established[speaker], num_expressions)}
+            self_repetitions[speaker] = {'SER': ratio(counts['SER'], tokens),
+                                         'SEV': ratio(person.lengths.count, tokens),
+                                         'SENTR': person.lengths.entropy(), 'SL': person.lengths.mean(),
+                                         'SLMAX': person.lengths.max}
+        return speaker_independent, speaker_dependent, self_repetitions
+
+    def stats(self) -> Dict[str, int | float]:
+        """
+        Statistics of the analysis since the conversation was created or reset_stats was called.
+
+        Returns:
+            dict: the number of past turns considered when analyzing messages (turns), skipped because they have no
+            token (or, with primed flags, no n-gram) in common with the message (skipped_by_signature), skipped
+            because they cannot contain a new self-repetition (skipped_by_speaker_index), and compared n-gram by n-gram
+            (compared), and the ratio of skipped turns (skip_ratio)
+        """
+        stats = self._turn_stats
+        skipped = stats['skipped_by_signature'] + stats['skipped_by_speaker_index']
+        return {'turns': stats['turns'], 'skipped_by_signature': stats['skipped_by_signature'],
+                'skipped_by_speaker_index': stats['skipped_by_speaker_index'], 'compared': stats['compared'],
+                'skip_ratio': skipped / stats['turns'] if stats['turns'] else 0.0}
+
+    def reset_stats(self):
+        """
+        Reset the statistics returned by stats.
+        """
+        self._turn_stats = Counter()
+
+    def memory_stats(self) -> Dict[str, int | Dict[str, int]]:
+        """
+        Approximate memory held by the conversation (see memory.deep_sizeof). Objects shared between structures, such
+        as n-gram strings, are counted in the first structure listed below that holds them. The pass is proportional
+        to the size of the state, so call it for monitoring, not on every message. A shared vocabulary is counted in full.
+
+        Returns:
+            dict: the bytes of the vocabulary, the history (turns, speakers, and parsed timestamps), the n-gram cache
+            (ngram_cache), the n-gram set and count cache (ngram_artifact_cache), the speaker n-gram indexes
+            (speaker_index), the shared expressions, the repetitions of each speaker, and the total
+        """
+        seen = set()
+        stats = {'vocabulary': deep_sizeof(self.history.vocabulary, seen),
+                 'history': deep_sizeof(self.history, seen),
+                 'ngram_cache': deep_sizeof(self._ngram_cache, seen),
+                 'ngram_artifact_cache': deep_sizeof(self._ngram_artifact_cache, seen),
+                 'speaker_index': deep_sizeof(self._speaker_n_grams, seen),
+                 'shared_expressions': deep_sizeof(self.shared_expressions, seen),
+                 'repetitions': {speaker: deep_sizeof(person, seen) for speaker, person in self.persons.items()}}
+        stats['total'] = sum(size for name, size in stats.items() if name != 'repetitions') + \
+            sum(stats['repetitions'].values())
+        return stats
+
+    def _prune_caches(self):
+        """
+        Drop the cached n-grams of the messages that left the window and rebuild the speaker n-gram indexes from the
+        window on first use, once the caches outgrow the window. Pruning is amortized over the messages added since
+        the last pruning, so windowed conversations use bounded memory however long they run.
+        """
+        limit = self._cache_limit()
+        if all(len(cache) <= limit for cache in self._ngram_artifact_cache.values()) and \
+                all(len(cache) <= limit for cache in self._ngram_cache.values()):
+            return
+        live = {turn.tokens for turn in self.history.working_set()}
+        for caches in (self._ngram_cache, self._ngram_artifact_cache):
+            for config, cache in caches.items():
+                # A new dictionary, since primed artifacts may be shared with other conversations
+                caches[config] = {tokens: value for tokens, value in cache.items() if tokens in live}
+        self._release_store_keys([key for key in self._store_keys if key[1] not in live])
+        self._speaker_n_grams = {}
+        self._unindexed_speakers = set()
+
+    def _cache_limit(self) -> int:
+        return max(self._cache_min_size, 4 * len(self.history.working_set()))
+
+    def _release_store_keys(self, keys: List[tuple]):
+        if keys:
+            self._store_keys.difference_update(keys)
+            self._ngram_store.release(keys)
+
+    def _bound_n_grams(self, n_grams: set[str]) -> set[str]:
+        """
+        The n-grams of at most degraded_max_ngram words, for analyses that exceeded their budget.
+        """
+        self._degraded = True
+        return {n_gram for n_gram in n_grams if n_gram.count(' ') < self.degraded_max_ngram}
+
+    def _degraded_n_gram_artifacts(self, tokens: bytes, config: tuple) -> tuple[List[str], set[str], Counter]:
+        """
+        The artifacts of the n-grams of at most degraded_max_ngram words of a message, which are not cached.
+        """
+        self._degraded = True
+        min_ngram, max_ngram = config
+        maximum = self.degraded_max_ngram if max_ngram is None else min(max_ngram, self.degraded_max_ngram)
+        return self._build_n_gram_artifacts(tokens, (min_ngram, maximum))
 
     def _compare_precomputed(self,
                              n_gram_set: List[str],
@@ -342,7 +776,12 @@ class Conversation:
                              current_counts: Counter | None = None,
                              past_counts: Counter | None = None,
                              current_set: set[str] | None = None,
-                             past_set: set[str] | None = None) -> Dict[str, bool]:
+                             past_set: set[str] | None = None,
+                             deadline: float | None = None) -> Dict[str, bool] | None:
+        """
+        The n-grams of a message that a past message has too, and whether they are free forms in the past message.
+        None if deadline (a perf_counter time) passes before the comparison is done.
+        """
         if current_counts is None:
             current_counts = Counter(n_gram_set)
         if past_counts is None:
@@ -356,6 +795,8 @@ class Conversation:
         free_form = [True] * len(matching_n_grams)
 
         for i, n_gram in enumerate(matching_n_grams):
+            if deadline is not None and not i & 63 and time.perf_counter() > deadline:
+                return None
             for another_n_gram in matching_n_grams:
                 if n_gram == another_n_gram:
                     continue
@@ -389,8 +830,7 @@ class Conversation:
             person = self.persons[speaker]
             der_score = self.calculate_der(message)
         else:
-            print(f"No such person: {speaker}")
-            raise NameError
+            raise NameError(f"No such person: {speaker}")
 
         dser_score = self.calculate_dser(message, person)
 
@@ -408,6 +848,8 @@ class Conversation:
             dee (float): DEE score
         """
         # message = ''.join([char for char in message if char.isalnum() or char.isspace()])
+        # Established expressions are reported longest first.
+        established_expressions.sort(key=lambda x: len(x.split()), reverse=True)
         dee = self._fraction_measurement(message, established_expressions, count_once=True)
 
         return dee
@@ -422,7 +864,7 @@ class Conversation:
         Returns:
             der (float): DER score
         """
-        der = self._fraction_measurement(message, list(self.shared_expressions.keys()))
+        der = self.shared_expressions.coverage(message)
 
         return der
 
@@ -437,8 +879,7 @@ class Conversation:
         Returns:
             dser (float): DSER score
         """
-        used_tokens = speaker.show_repetitions()
-        dser = self._fraction_measurement(message, used_tokens)
+        dser = speaker.repetition_coverage(message)
 
         return dser
 
@@ -447,111 +888,154 @@ class Conversation:
         Measures the amount of a word_set that is comprised of a set of tokens defined by used_tokens and 
         returns the percentage composition.
         """
+        return CoverageMatcher(used_tokens).fraction(message, count_once=count_once)
 
-        word_set = message.split()
-        if len(word_set) == 0:
-            return 0
-        tracking_arr = [0] * len(word_set)
+    def _n_gram_config(self) -> tuple:
+        return self.min_ngram, self.max_ngram
+
+    def _get_n_gram_artifacts(self,
+                              tokens: bytes | str,
+                              config: tuple | None = None,
+                              deadline: float | None = None) -> tuple[List[str], set[str], Counter] | None:
+        """
+        The n-grams of a message, their set, and their counts, cached. None if deadline (a perf_counter time) passes
+        before they are built, in which case nothing is cached.
+        """
+        if isinstance(tokens, str):
+            tokens = self.history.vocabulary.encode(tokens)
+        if config is None:
+            config = self._n_gram_config()
+        artifact_cache = self._ngram_artifact_cache.setdefault(config, {})
+        cached = artifact_cache.get(tokens)
+        if cached is not None:
+            return cached
 
-        # Index each token's positions once so each expression only checks viable starts.
-        word_positions = {}
-        for idx, token in enumerate(word_set):
-            if token in word_positions:
-                word_positions[token].append(idx)
+        # _create_n_grams caches the artifacts with the n-grams, unless the n-grams were cached before them
+        if deadline is not None and tokens not in self._ngram_cache.get(config, ()):
+            built = self._build_n_gram_artifacts(tokens, config, deadline)
+            if built is None:
+                return None
+            n_grams = self._create_n_grams(tokens, config, lambda: built)
+        else:
+            n_grams = self._create_n_grams(tokens, config)
+        cached = artifact_cache.get(tokens)
+        if cached is None:
+            cached = artifact_cache[tokens] = (n_grams, set(n_grams), Counter(n_grams))
+        return cached
+
+    def _create_n_grams(self,
+                        tokens: bytes | str,
+                        config: tuple | None = None,
+                        build: Callable[[], tuple[List[str], set[str], Counter]] | None = None) -> List[str]:
+        """
+        Factor a message (or its encoded tokens) into a list of n_grams. Exception tokens are not removed (see
+        create_n_grams). build computes the artifacts if they are not cached, _build_n_gram_artifacts by default.
+        """
+        if isinstance(tokens, str):
+            tokens = self.history.vocabulary.encode(tokens)
+        if config is None:
+            config = self._n_gram_config()
+        if build is None:
+            def build():
+                return self._build_n_gram_artifacts(tokens, config)
+        n_gram_cache = self._ngram_cache.setdefault(config, {})
+        if tokens in n_gram_cache:
+            return n_gram_cache[tokens]
+
+        if self._ngram_store is not None:
+            key = (config, tokens)
+            if key in self._store_keys:
+                artifacts = self._ngram_artifact_cache.setdefault(config, {})[tokens]
             else:
-                word_positions[token] = [idx]
-
-        # Avoid repeated sorting work if tokens are already in non-increasing n-gram length order.
-        needs_sort = False
-        for i in range(len(used_tokens) - 1):
-            if len(used_tokens[i].split()) < len(used_tokens[i + 1].split()):
-                needs_sort = True
-                break
-        if needs_sort:
-            used_tokens.sort(key=lambda x: len(x.split()), reverse=True)
-
-        expression_parts_cache = {}
-        for expression in used_tokens:
-            if expression not in message:
-                continue
-            words_in_expression = expression_parts_cache.get(expression)
-            if words_in_expression is None:
-                words_in_expression = expression.split()
-                expression_parts_cache[expression] = words_in_expression
-
-            candidate_positions = word_positions.get(words_in_expression[0], [])
-            for i in candidate_positions:
-                match = True
-                for offset, word_exp in enumerate(words_in_expression):
-                    if i + offset >= len(word_set) or word_set[i + offset] != word_exp:
-                        match = False
-                        break
-                if match and tracking_arr[i] == 0:
-                    for offset in range(len(words_in_expression)):
-                        tracking_arr[i + offset] = 1
-                    if count_once:
-                        break
+                artifacts = self._ngram_store.acquire(key, build)
+                self._store_keys.add(key)
+                self._ngram_artifact_cache.setdefault(config, {})[tokens] = artifacts
+            n_gram_cache[tokens] = artifacts[0]
+            return artifacts[0]
+
+        artifacts = build()
+        n_gram_cache[tokens] = artifacts[0]
+        self._ngram_artifact_cache.setdefault(config, {})[tokens] = artifacts
+        return artifacts[0]
+
+    def _build_n_gram_artifacts(self,
+                                tokens: bytes,
+                                config: tuple,
+                                deadline: float | None = None) -> tuple[List[str], set[str], Counter] | None:
+        """
+        The n-grams of a message, their set, and their counts, or None if deadline (a perf_counter time) passes
+        before they are built.
+        """
+        min_ngram, max_ngram = config
+        words = self.history.vocabulary.decode(tokens)
+        n_grams = []
 
-        count_ones = tracking_arr.count(1)
-        fraction = count_ones / len(tracking_arr)
-        return fraction
+        # checking against max_ngram value to apply appropriate constraints
+        if max_ngram is None:
+            maximum = len(words)
+        else:
+            maximum = max_ngram
+
+        # Generate n-grams of size minimum to size maximum (those being variable defined in __init__. N-grams are
+        # interned, so the messages and the conversations of the process that produce an n-gram share one string.
+        intern = sys.intern
+        for i in range(len(words)):
+            # The n-grams starting at a word cost up to the length of the message, so the deadline is checked per word.
+            if deadline is not None and time.perf_counter() > deadline:
+                return None
+            for n in range(min_ngram, maximum + 1):
+                if i + n <= len(words):
+                    n_gram = intern(' '.join(words[i:i + n]))
+                    n_grams.append(n_gram)
+        return n_grams, set(n_grams), Counter(n_grams)
+
+    def create_n_grams(self, message: str) -> List[str]:
+        """
+        Factor a string into a list of n_grams
 
-    def _get_n_gram_artifacts(self, message: str) -> tuple[List[str], set[str], Counter]:
-        cache_key = (message, self.min_ngram, self.max_ngram, tuple(self.exception_tokens))
-        cached = self._ngram_artifact_cache.get(cache_key)
-        if cached is not None:
-            return cached
+        Args:
+            message (str): the utterance
 
-        n_grams = self._create_n_grams(message)
-        artifacts = (n_grams, set(n_grams), Counter(n_grams))
-        self._ngram_artifact_cache[cache_key] = artifacts
-        return artifacts
+        Returns:
+            list: the n_grams of the message without exception tokens
+        """
+        exceptions = self._exception_set
+        return [n_gram for n_gram in self._create_n_grams(message) if n_gram not in exceptions]
 
-    def _create_n_grams(self, message: str) -> List[str]:
+    def prime_free_form_flags(self, flags: Dict[str, Dict[str, frozenset]] | None):
         """
-        Factor a string into a set of n_grams
+        Use precomputed matches instead of comparing messages n-gram by n-gram (see pipeline.free_form_flags). A
+        message in flags must have been compared with every message of its windows: it shares no n-gram with the past
+        messages that are not listed for it, and the n-grams it shares with a listed message are free unless they are
+        listed. The flags are used only while the n-gram lengths and the exception tokens are the same as when they
+        were primed.
+
+        Args:
+            flags (dict): for each message, the past messages that share an n-gram with it, and the shared n-grams
+            which are not free. None removes the flags.
         """
-        try:
-            cache_key = (message, self.min_ngram, self.max_ngram, tuple(self.exception_tokens))
-            if cache_key in self._ngram_cache:
-                return self._ngram_cache[cache_key]
-
-            # message = message.lower()
-            # message = ''.join([char for char in message if char.isalnum() or char.isspace()]) # strips punctuation
-            # message = message.replace('.', ' .')
-            # message = message.replace(',', ' ,')
-            words = message.split()
-            n_grams = []
-
-            # checking against max_ngram value to apply appropriate constraints
-            if self.max_ngram is None:
-                maximum = len(words)
-            else:
-                maximum = self.max_ngram
-
-            # Generate n-grams of size minimum to size maximum (those being variable defined in __init__
-            for i in range(len(words)):
-                for n in range(self.min_ngram, maximum + 1):
-                    if i + n <= len(words):
-                        n_gram = ' '.join(words[i:i + n])
-                        n_grams.append(n_gram)
-
-            # remove exception tokens
-            n_grams_without_exceptions = []
-            for h in n_grams:
-                if h not in self.exception_tokens:
-                    n_grams_without_exceptions.append(h)
-
-            self._ngram_cache[cache_key] = n_grams_without_exceptions
-            self._ngram_artifact_cache[cache_key] = (
-                n_grams_without_exceptions,
-                set(n_grams_without_exceptions),
-                Counter(n_grams_without_exceptions),
-            )
-            return n_grams_without_exceptions
-        except ValueError:
-            print("Invalid message argument provided to n_gram factoring")
-            return []
+        self._free_form_flags = None
+        if flags is None:
+            return
+        vocabulary = self.history.vocabulary
+        wide = len(vocabulary) > 0x10000
+        encoded = {vocabulary.encode(message): {vocabulary.encode(past): not_free for past, not_free in pasts.items()}
+                   for message, pasts in flags.items()}
+        # Encodings change width when the vocabulary outgrows two-byte ids, which would make the keys stale.
+        if wide or len(vocabulary) <= 0x10000:
+            self._free_form_flags = (self._n_gram_config(), frozenset(self._exception_set), encoded)
+
+    def prime_n_gram_artifacts(self, artifacts: Dict[bytes, tuple[List[str], set[str], Counter]]):
+        """
+        Use precomputed n-gram artifacts for the current n-gram lengths, e.g. derived from the n-grams of another
+        configuration. The dictionary is shared, not copied, so conversations with the same vocabulary and n-gram
+        lengths can share it, whatever their exception tokens.
+
+        Args:
+            artifacts (dict): maps encoded messages (see Vocabulary.encode) to the list of their n-grams (as returned
+            by _create_n_grams), the set of the n-grams, and the Counter of the n-grams.
+        """
+        self._ngram_artifact_cache[self._n_gram_config()] = artifacts
 
     def set_n_gram_length_characteristics(self, min_n: int | None = None, max_n: int | None = None):
         """
@@ -568,6 +1052,7 @@ class Conversation:
             self.max_ngram = max_n
         self._ngram_cache = {}
         self._ngram_artifact_cache = {}
+        self._release_store_keys(list(self._store_keys))
 
     def set_window(self, window: int | timedelta):
         """
@@ -581,7 +1066,7 @@ class Conversation:
         """
         if isinstance(window, int):
             # Count-based window: display the last window number of messages
-            windowed_content = self.history[-window:] if window > 0 else self.history
+            windowed_content = self.history[-window:] if window > 0 else list(self.history)
             print(f"Windowed Content (last {window} messages):")
         elif isinstance(window, timedelta):
             # Time-based window: filter messages within the window time frame
@@ -589,14 +1074,14 @@ class Conversation:
             windowed_content = []
 
             # Iterate through each message in self.history and filter based on the time window
-            for timestamp, speaker, message in self.history:
-                # Convert the timestamp string to a datetime object
-                message_time = self._parse_timestamp(timestamp)
+            for turn in self.history.turns:
+                # Timestamps are parsed when turns are added
+                message_time = turn.time if turn.time is not None else self._parse_timestamp(turn.timestamp)
                 time_difference = current_time - message_time
 
                 # Append to windowed_content only if within the time window
                 if time_difference <= window:
-                    windowed_content.append((timestamp, speaker, message))
+                    windowed_content.append(self.history.as_tuple(turn))
 
             if not windowed_content:
                 print(f"No messages found within the last {window.total_seconds()} seconds.")
@@ -623,8 +1108,7 @@ class Conversation:
         try:
             if isinstance(token, str):
                 self.exception_tokens.append(token)
-                self._ngram_cache = {}
-                self._ngram_artifact_cache = {}
+                self._exception_set.add(token)
         except ValueError:
             print("Invalid token argument provided")
 
@@ -638,8 +1122,8 @@ class Conversation:
         try:
             if isinstance(token, str):
                 self.exception_tokens.remove(token)
-                self._ngram_cache = {}
-                self._ngram_artifact_cache = {}
+                if token not in self.exception_tokens:
+                    self._exception_set.discard(token)
         except ValueError:
             print("Invalid token argument provided")
 
@@ -648,42 +1132,138 @@ class Conversation:
         recreate the shared expressions if a windowed history is updated
         """
         if self.window is not None:
-            self.shared_expressions = {}
-            count = 0
-            sub_window = []
-            for timestamp, speaker, message in self.history:
-                if count > 0:
-                    self.analyze_message(speaker, message, sub_window)
-                sub_window.append((timestamp, speaker, message))
-                count += 1
+            self.shared_expressions = SharedExpressionLexicon()
+            turns = self.history.turns
+            for count in range(1, len(turns)):
+                self._analyze_turns(self.history.speaker(turns[count]), turns[count].tokens, turns, count,
+                                    indexed=True)
 
     def load_conversation_from_file(self, input_file):
         """
-        Load a conversation from an input file.
+        Load a conversation from an input file. A .tsv file is read as written by save_conversation_message_to_file
+        (timestamp, speaker, and message). Any other file is read as lines of "speaker: message".
 
         Args:
-            input_file (_type_): _description_
+            input_file (str): path to the input file
         """
         try:
+            if str(input_file).endswith('.tsv'):
+                self.load_history(input_file)
+                return
             with open(input_file, 'r') as file:
+                rows = []
                 for line in file:
                     parts = line.strip().split(':', 1)
                     if len(parts) == 2:
                         speaker, message = parts
-                        self.add_message(speaker.strip(), message.strip())
+                        rows.append((None, speaker.strip(), message.strip()))
+            self.load_history(rows)
         except FileNotFoundError:
             print("Invalid input file provided")
 
+    def load_history(self,
+                     source,
+                     speaker_col: str | None = None,
+                     message_col: str | None = None,
+                     timestamp_col: str | None = None):
+        """
+        Ingest a whole transcript in one pass. The resulting history, shared expressions, and self-repetitions are the
+        same as scoring every message with add_message_to_history=True, but the window is maintained incrementally and
+        no scores are computed.
+
+        Args:
+            source (str | DataFrame | Iterable): a path to a tab separated file of timestamps, speakers, and messages
+            (the format of save_conversation_message_to_file), a DataFrame, or an iterable of (timestamp, speaker,
+            message) tuples. Timestamps may be None.
+            speaker_col (str, optional): name of the speaker column if source is a DataFrame. Defaults to None.
+            message_col (str, optional): name of the message column if source is a DataFrame. Defaults to None.
+            timestamp_col (str, optional): name of the timestamp column if source is a DataFrame. Defaults to None.
+        """
+        time_window = isinstance(self.window, timedelta)
+        turns = self.history.turns
+        # turns[start:] is the current window. Advancing start instead of evicting keeps eviction O(1).
+        start = 0
+        # Expired turns form a prefix of the window as long as the timestamps are in order.
+        times_in_order = True
+        last_time = None
+        default_timestamp = None
+
+        for timestamp, speaker, message in self._iter_transcript_rows(source, speaker_col, message_col, timestamp_col):
+            if speaker not in self.persons:
+                self.persons[speaker] = Person(speaker)
+            if timestamp is None:
+                if time_window:
+                    raise ValueError("Timestamp is required for time-based window.")
+                if default_timestamp is None:
+                    default_timestamp = time.strftime(self.time_format)
+                timestamp = default_timestamp
+
+            turn = self.history.make_turn(timestamp, speaker, message)
+            self._analyze_turns(speaker, turn.tokens, turns[start:] if start else turns, len(turns) - start,
+                                indexed=True)
+            turns.append(turn)
+            self._index_turn(turn)
+
+            if isinstance(self.window, int):
+                start = max(start, len(turns) - self.window)
+            elif time_window:
+                current_time = turn.time if turn.time is not None else self._parse_timestamp(timestamp)
+                if last_time is not None and current_time < last_time:
+                    times_in_order = False
+                last_time = current_time if last_time is None else max(last_time, current_time)
+                if times_in_order:
+                    while current_time - turns[start].time > self.window:
+                        start += 1
+                else:
+                    turns[:] = [past_turn for past_turn in turns[start:] if current_time - past_turn.time <= self.window]
+                    start = 0
+
+        self.history.evict(start)
+        self.length = len(self.history)
+        if self.window is not None or not self.history.resident:
+            self._prune_caches()
+        # Windowed scores are computed against the shared expressions of the current window.
+        self.analyze_conversation()
+
+    @staticmethod
+    def _iter_transcript_rows(source, speaker_col, message_col, timestamp_col):
+        if isinstance(source, (str, os.PathLike)):
+            with open(source, 'r', newline='') as file:
+                for row in csv.reader(file, delimiter='\t'):
+                    if len(row) == 3:
+                        yield row[0], row[1], row[2]
+        elif hasattr(source, 'itertuples'):
+            if speaker_col is None or message_col is None:
+                raise ValueError("speaker_col and message_col are required to load a DataFrame.")
+            timestamps = source[timestamp_col] if timestamp_col is not None else itertools.repeat(None)
+            yield from zip(timestamps, source[speaker_col], source[message_col])
+        else:
+            for timestamp, speaker, message in source:
+                yield timestamp, speaker, message
+
     def save_conversation_message_to_file(self, timestamp, speaker, message):
         """
-        Save a conversation message to the output file, with a timestamp, speaker, and message.
+        Save a conversation message to the output file, with a timestamp, speaker, and message. Each message is
+        written to the file immediately, as tab separated values that load_conversation_from_file reads back. Earlier
+        versions wrote "timestamp, $@#, speaker, message" lines, which could not be read back.
 
         Args:
-            speaker (_type_): _description_
-            message (_type_): _description_
+            timestamp (str): the string representation of the timestamp of the message
+            speaker (str): the speaker of the message
+            message (str): the utterance
+        """
+        if self._writer is None or self._writer.output_file != self.output_file:
+            if self._writer is not None:
+                self._writer.close()
+            self._writer = TranscriptWriter(self.output_file, flush_every=1)
+        self._writer.write(timestamp, speaker, message)
+
+    def flush(self):
+        """
+        Write all buffered messages to the output file.
         """
-        with open(self.output_file, 'a') as file:
-            file.write(f"{timestamp}, $@#, {speaker}, {message}\n")
+        if self._writer is not None:
+            self._writer.flush()
 
     def request(self, mode, speaker=None, message=None, add_message_to_history=True, focus_conversation=None):
         """
@@ -728,10 +1308,6 @@ class Conversation:
                     der, dser, dee, _, _, _ = self.score_message(speaker, message,
                                                                  focus_conversation=focus_conversation,
                                                                  add_message_to_history=add_message_to_history)
-                print(f'Shared Expressions : {self.shared_expressions}')
-                print(f'DER: {der}')
-                print(f'DSER: {dser}')
-                print(f'DEE: {dee}')
                 return der, dser, dee
             except ValueError:
                 print("Error scoring message.")
@@ -0,0 +1,107 @@
+from typing import Dict, Iterable
+
+
+class CoverageMatcher:
+    def __init__(self, expressions: Iterable[str] = ()):
+        """
+        Measures which part of a message is covered by a lexicon of expressions. The lexicon can be updated
+        incrementally, so a message is only matched against the expressions whose first word occurs in it.
+
+        Expressions are matched longest first. Expressions of the same length are matched in insertion order.
+
+        Args:
+            expressions (Iterable[str], optional): the initial lexicon. Defaults to an empty lexicon.
+        """
+        # expression -> (negative length, insertion sequence, words). The first two elements are the matching order.
+        self._entries: Dict[str, tuple[int, int, list[str]]] = {}
+        # first word -> expressions starting with the word (insertion-ordered set)
+        self._by_first_word: Dict[str, Dict[str, None]] = {}
+        self._sequence = 0
+        for expression in expressions:
+            self.add(expression)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, expression: str) -> bool:
+        return expression in self._entries
+
+    def add(self, expression: str):
+        """
+        Add an expression to the lexicon. Adding an expression that is already in the lexicon does nothing.
+
+        Args:
+            expression (str): the expression to add
+        """
+        if expression in self._entries:
+            return
+        words = expression.split()
+        if not words:
+            return
+        self._entries[expression] = (-len(words), self._sequence, words)
+        self._sequence += 1
+        self._by_first_word.setdefault(words[0], {})[expression] = None
+
+    def remove(self, expression: str):
+        """
+        Remove an expression from the lexicon. Removing an unknown expression does nothing.
+
+        Args:
+            expression (str): the expression to remove
+        """
+        entry = self._entries.pop(expression, None)
+        if entry is None:
+            return
+        first_word = entry[2][0]
+        expressions = self._by_first_word[first_word]
+        del expressions[expression]
+        if not expressions:
+            del self._by_first_word[first_word]
+
+    def fraction(self, message: str, count_once: bool = False) -> float:
+        """
+        Measures the fraction of the tokens of a message that are part of an instance of an expression in the lexicon.
+
+        Args:
+            message (str): the whitespace tokenized utterance
+            count_once (bool, optional): only count the first instance of each expression. Defaults to False.
+
+        Returns:
+            fraction (float): the fraction of covered tokens
+        """
+        word_set = message.split()
+        if len(word_set) == 0:
+            return 0
+        tracking_arr = [0] * len(word_set)
+
+        # Index each token's positions once so each expression only checks viable starts.
+        word_positions = {}
+        for idx, token in enumerate(word_set):
+            if token in word_positions:
+                word_positions[token].append(idx)
+            else:
+                word_positions[token] = [idx]
+
+        candidates = []
+        for token in word_positions:
+            expressions = self._by_first_word.get(token)
+            if expressions is not None:
+                candidates.extend(self._entries[expression] + (expression,) for expression in expressions)
+        candidates.sort()
+
+        for _, _, words_in_expression, expression in candidates:
+            if expression not in message:
+                continue
+            for i in word_positions[words_in_expression[0]]:
+                match = True
+                for offset, word_exp in enumerate(words_in_expression):
+                    if i + offset >= len(word_set) or word_set[i + offset] != word_exp:
+                        match = False
+                        break
+                if match and tracking_arr[i] == 0:
+                    for offset in range(len(words_in_expression)):
+                        tracking_arr[i + offset] = 1
+                    if count_once:
+                        break
+
+        return tracking_arr.count(1) / len(tracking_arr)
@@ -0,0 +1,329 @@
+import bisect
+import heapq
+import math
+from collections import deque
+from datetime import timedelta
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+from dialign_python.conversation import Conversation
+from dialign_python.coverage import CoverageMatcher
+from dialign_python.history import History, Vocabulary
+
+PUNCTUATIONS = frozenset({'.', ',', '!', '?'})
+CURVE_KEYS = ('First turn', 'Last turn', 'Total tokens', 'Num. shared expressions', 'EV', 'ER', 'EE')
+
+
+class _Use:
+    """
+    The use of an expression in a turn after other speakers used it: the past turns of other speakers that share it
+    (their index, the bit of their speaker, and whether it is a free form there), and the last window start from which
+    the expression is established by the turn (see AlignmentCurves).
+    """
+    __slots__ = ('turn', 'last_start', 'supporters', 'position')
+
+    def __init__(self, turn: int, last_start: int, supporters: List[tuple[int, int, bool]], position: int):
+        self.turn = turn
+        self.last_start = last_start
+        self.supporters = supporters
+        self.position = position
+
+
+class _Turn:
+    __slots__ = ('index', 'speaker_bit', 'tokens', 'signature', 'artifacts', 'message', 'num_tokens', 'time',
+                 'expressions', 'shared', 'repeated', 'established')
+
+    def __init__(self, index, speaker_bit, tokens, artifacts, message, num_tokens, time):
+        self.index = index
+        self.speaker_bit = speaker_bit
+        self.tokens = tokens
+        self.signature = Vocabulary.signature(tokens)
+        self.artifacts = artifacts
+        self.message = message
+        self.num_tokens = num_tokens
+        self.time = time
+        # Expressions of the message that other speakers used before, and the last window start from which they are
+        # shared expressions when the turn is scored
+        self.expressions: Dict[str, int] = {}
+        # The shared expressions of the message in the current window, in the order they were established, and those
+        # the message established, from which the counts were computed
+        self.shared: tuple[List[str], List[str]] | None = None
+        # Tokens counted by ER and EE for the current window start
+        self.repeated = 0
+        self.established = 0
+
+
+class AlignmentCurves:
+    def __init__(self, valid_speakers: Iterable[str], window: int | timedelta | None,
+                 exception_tokens: List[str] | None = None, min_ngram: int = 1, max_ngram: int | None = None,
+                 time_format: str = "%Y-%m-%d %H:%M:%S"):
+        """
+        EV, ER, and EE over a sliding window of a transcript: for each turn, the measures of dialign on the window that
+        ends with the turn, as if the window were the whole dialogue. Each window gives the same measures as calling
+        dialign on its rows, but the transcript is processed in one pass. A message is compared once with each
+        message of its window, and the scores of the turns of a window are updated incrementally when turns are added
+        and evicted.
+
+        The window start from which an expression is established by a turn only depends on the turn and the turns it
+        is compared with, so it is computed once per turn. Whether an expression is shared in a window is then a
+        comparison with the start of the window, and the scores of a turn are computed again only when the window
+        start passes a turn that changes them.
+
+        Args:
+            valid_speakers (Iterable[str]): the speakers of the dialogue. An expression is established once all of them
+            have used it, even in windows where some of them do not speak.
+            window (int | timedelta | None): the number of turns of each window, or the time range of each window (the
+            turns at most window before the last turn). None grows the window from the first turn.
+            exception_tokens, min_ngram, max_ngram, time_format: see Conversation
+        """
+        if isinstance(window, int) and window < 1:
+            raise ValueError("The window must contain at least one turn.")
+        self.window = window
+        self.time_format = time_format
+        # Compares messages like the conversations dialign scores windows with
+        self._conversation = Conversation(persons=list(valid_speakers), exception_tokens=exception_tokens,
+                                          min_ngram=min_ngram, max_ngram=max_ngram, time_format=time_format)
+        self._config = self._conversation._n_gram_config()
+        self._speaker_bits = {speaker: 1 << i for i, speaker in enumerate(self._conversation.persons)}
+        self._all_speakers = sum(self._speaker_bits.values())
+        self._time_parser = History(time_format=time_format)
+
+        self._turns: deque[_Turn] = deque()
+        # Start of the current window
+        self._start = 0
+        self._last_time = None
+        # Uses of each expression in the window by turn, and the last window start from which each expression is a
+        # shared expression of the window (the maximum last_start of its uses)
+        self._uses: Dict[str, deque[_Use]] = {}
+        self._last_starts: Dict[str, int] = {}
+        # Expressions by last window start, to count the shared expressions of the window
+        self._by_last_start: Dict[int, List[str]] = {}
+        self._num_expressions = 0
+        # Turns by the window start from which their scores must be computed again
+        self._updates: List[tuple[int, int]] = []
+        self._tokens = 0
+        self._repeated = 0
+        self._established = 0
+        self._curves = {key: [] for key in CURVE_KEYS}
+
+    def add(self, speaker: str, message: str, num_tokens: int | None = None, timestamp=None) -> Dict[str, float]:
+        """
+        Add the next turn of the transcript and measure the window that ends with it.
+
+        Args:
+            speaker (str): the speaker of the turn
+            message (str): the whitespace tokenized message
+            num_tokens (int, optional): the number of tokens of the message, as counted by dialign. Defaults to the
+            number of words of the message.
+            timestamp (str | datetime, optional): the time of the turn. Required for a time window.
+
+        Returns:
+            dict: First turn and Last turn (the indices of the turns of the window), Total tokens,
+            Num. shared expressions, EV, ER, and EE of the window
+        """
+        if speaker not in self._speaker_bits:
+            raise ValueError(f"{speaker} is not a valid speaker.")
+        words = message.split()
+        if num_tokens is None:
+            num_tokens = len(words)
+        time = None
+        if isinstance(self.window, timedelta):
+            if timestamp is None:
+                raise ValueError("Timestamp is required for time-based window.")
+            time = self._time_parser.parse_timestamp(timestamp)
+            if time is None:
+                raise ValueError(f"Invalid timestamp: {timestamp}")
+            if self._last_time is not None and time < self._last_time:
+                raise ValueError("The timestamps of a time-based window must be in order.")
+            self._last_time = time
+
+        index = self._start + len(self._turns)
+        conversation = self._conversation
+        tokens = conversation.history.vocabulary.encode(message)
+        artifacts = conversation._build_n_gram_artifacts(tokens, self._config)
+        turn = _Turn(index, self._speaker_bits[speaker], tokens, artifacts, message, num_tokens, time)
+
+        # Evict the turns that are not in the window of the new turn
+        start = self._start
+        if isinstance(self.window, int):
+            start = max(start, index - self.window + 1)
+        elif isinstance(self.window, timedelta):
+            while start < index and time - self._turns[start - self._start].time > self.window:
+                start += 1
+        self._advance(start)
+
+        self._compare(turn)
+        self._turns.append(turn)
+        self._tokens += num_tokens
+        self._score(turn)
+
+        tokens = self._tokens
+
+        def ratio(numerator):
+            return numerator / tokens if tokens else 0.0
+
+        measures = {'First turn': self._start, 'Last turn': index, 'Total tokens': tokens,
+                    'Num. shared expressions': self._num_expressions, 'EV': ratio(self._num_expressions),
+                    'ER': ratio(self._repeated), 'EE': ratio(self._established)}
+        for key, value in measures.items():
+            self._curves[key].append(value)
+        return measures
+
+    def curves(self) -> Dict[str, np.ndarray]:
+        """
+        The measures of the windows of the turns added so far (see add), one array per measure.
+        """
+        return {key: np.array(values, dtype=float if key in ('EV', 'ER', 'EE') else int)
+                for key, values in self._curves.items()}
+
+    def _advance(self, start: int):
+        """
+        Move the window start to start: evict the turns before it, drop the expressions that are no longer shared in
+        the window, and score again the turns whose scores depend on the evicted turns.
+        """
+        while self._start < start:
+            turn = self._turns.popleft()
+            self._tokens -= turn.num_tokens
+            self._repeated -= turn.repeated
+            self._established -= turn.established
+            # Expressions whose last window start is the evicted turn are not shared from the next start on.
+            for n_gram in self._by_last_start.pop(self._start, ()):
+                if self._last_starts.get(n_gram) == self._start:
+                    del self._last_starts[n_gram]
+                    self._uses.pop(n_gram, None)
+                    self._num_expressions -= 1
+            self._start += 1
+
+        updates = self._updates
+        while updates and updates[0][0] <= self._start:
+            _, index = heapq.heappop(updates)
+            if index >= self._start:
+                turn = self._turns[index - self._start]
+                self._repeated -= turn.repeated
+                self._established -= turn.established
+                self._score(turn)
+
+    def _compare(self, turn: _Turn):
+        """
+        Compare a new turn with the turns of other speakers in its window and record the uses of the expressions they
+        share (see _Use).
+        """
+        conversation = self._conversation
+        n_grams, current_set, current_counts = turn.artifacts
+        if conversation._exception_set:
+            current_set = current_set - conversation._exception_set
+        supporters: Dict[str, List[tuple[int, int, bool]]] = {}
+        for past in self._turns:
+            if past.speaker_bit == turn.speaker_bit or not past.signature & turn.signature:
+                continue
+            past_n_grams, past_set, past_counts = past.artifacts
+            matches = conversation._compare_precomputed(n_grams, past_n_grams, current_counts, past_counts,
+                                                        current_set, past_set)
+            for n_gram, free_form in matches.items():
+                if n_gram not in PUNCTUATIONS:
+                    supporters.setdefault(n_gram, []).append((past.index, past.speaker_bit, free_form))
+        if not supporters:
+            return
+
+        positions = {}
+        for position, n_gram in enumerate(n_grams):
+            positions.setdefault(n_gram, position)
+        required = self._all_speakers & ~turn.speaker_bit
+        for n_gram, uses in supporters.items():
+            # The expression is established by the turn in the windows that start at or before the last free use
+            # and the last use of every other speaker.
+            last_start = max((index for index, _, free_form in uses if free_form), default=-1)
+            for speaker_bit in self._speaker_bits.values():
+                if required & speaker_bit:
+                    last_start = min(last_start, max((index for index, bit, _ in uses if bit == speaker_bit),
+                                                     default=-1))
+            if last_start >= self._start:
+                self._uses.setdefault(n_gram, deque()).append(_Use(turn.index, last_start, uses, positions[n_gram]))
+                previous = self._last_starts.get(n_gram, -1)
+                if last_start > previous:
+                    if previous < self._start:
+                        self._num_expressions += 1
+                    self._last_starts[n_gram] = last_start
+                    self._by_last_start.setdefault(last_start, []).append(n_gram)
+            # The expressions shared in the window when the turn is scored
+            last_start = self._last_starts.get(n_gram, -1)
+            if last_start >= self._start:
+                turn.expressions[n_gram] = last_start
+
+    def _establishment(self, n_gram: str) -> tuple[_Use, int, int]:
+        """
+        The use that establishes a shared expression in the current window, the past turn from which it is established
+        (the order of the expressions established by the same turn), and the last window start from which both are
+        the same.
+        """
+        start = self._start
+        uses = self._uses[n_gram]
+        while uses[0].last_start < start:
+            uses.popleft()
+        use = uses[0]
+        speakers = 0
+        last_free = -1
+        last_uses = {}
+        required = self._all_speakers & ~self._turns[use.turn - start].speaker_bit
+        for index, speaker_bit, free_form in use.supporters[bisect.bisect_left(use.supporters, (start,)):]:
+            speakers |= speaker_bit
+            last_uses[speaker_bit] = index
+            if free_form:
+                last_free = index
+            if last_free >= 0 and speakers & required == required:
+                return use, index, min(last_free, min(last_uses.values()))
+        raise AssertionError("The use does not establish the expression in the window.")
+
+    def _score(self, turn: _Turn):
+        """
+        Count the tokens of a turn covered by the shared expressions (ER) and by the expressions it establishes (EE)
+        in the current window, and schedule the next update of the counts.
+        """
+        start = self._start
+        expressions = turn.expressions
+        for n_gram in [n_gram for n_gram, last_start in expressions.items() if last_start < start]:
+            del expressions[n_gram]
+        if not expressions:
+            turn.repeated = turn.established = 0
+            return
+
+        # Shared expressions are matched in the order they were established in the window (see CoverageMatcher).
+        order = {}
+        next_update = math.inf
+        for n_gram in expressions:
+            use, index, last_start = self._establishment(n_gram)
+            order[n_gram] = (use.turn, index, use.position)
+            next_update = min(next_update, last_start + 1)
+        shared = sorted(expressions, key=order.__getitem__)
+        established = [n_gram for n_gram in shared if order[n_gram][0] == turn.index]
+        if (shared, established) != turn.shared:
+            turn.shared = shared, established
+            der = CoverageMatcher(shared).fraction(turn.message)
+            turn.repeated = round(der * turn.num_tokens)
+            dee = CoverageMatcher(established).fraction(turn.message, count_once=True) if established else 0
+            turn.established = round(dee * turn.num_tokens)
+        self._repeated += turn.repeated
+        self._established += turn.established
+        heapq.heappush(self._updates, (next_update, turn.index))
+
+
+def alignment_curves(rows: Iterable[tuple], valid_speakers: Iterable[str], window: int | timedelta | None,
+                     exception_tokens: List[str] | None = None, min_ngram: int = 1, max_ngram: int | None = None,
+                     time_format: str = "%Y-%m-%d %H:%M:%S") -> Dict[str, np.ndarray]:
+    """
+    EV, ER, and EE of the sliding windows of a transcript (see AlignmentCurves).
+
+    Args:
+        rows (Iterable): (speaker, message, num_tokens, timestamp) tuples, as returned by
+        dialign_python_offline._tokenize_transcript. num_tokens and timestamp can be None.
+        valid_speakers, window, exception_tokens, min_ngram, max_ngram, time_format: see AlignmentCurves
+
+    Returns:
+        dict: for each measure (First turn, Last turn, Total tokens, Num. shared expressions, EV, ER, and EE), an array
+        with the measure of the window ending with each row
+    """
+    curves = AlignmentCurves(valid_speakers, window, exception_tokens, min_ngram, max_ngram, time_format)
+    for speaker, message, num_tokens, timestamp in rows:
+        curves.add(speaker, message, num_tokens, timestamp)
+    return curves.curves()
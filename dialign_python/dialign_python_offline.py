@@ -1,47 +1,120 @@
 from collections import Counter
-from typing import List
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import itertools
+import pickle
+from typing import Generator, Iterable, List
 import pprint
 import pandas as pd
 import numpy as np
 from scipy.stats import entropy
 from dialign_python.person import Person
 from dialign_python.conversation import Conversation
+from dialign_python.curves import alignment_curves
+from dialign_python.history import Vocabulary
+from dialign_python.pipeline import free_form_flags, tokenize_texts, window_indices
+
+# File extensions read_transcript understands
+INPUT_EXTENSIONS = ('.xlsx', '.csv', '.jsonl', '.parquet', '.feather', '.arrow')
 
 
 def read_transcript(input_file: str, speaker_col: str, message_col: str, sheet_name=None, valid_speakers=None,
-                    filters=None):
+                    filters=None, columns=None, chunksize=100000):
     """
     Function to read a conversation transcript from a file.
 
     Args:
-        input_file (str): Path to the input file containing the conversation data.
+        input_file (str): Path to the input file containing the conversation data (.xlsx, .csv, .jsonl with one
+        object per line, or .parquet and .feather/.arrow, which require pyarrow).
         speaker_col (str): Name of the column containing the speaker data.
         message_col (str): Name of the column containing the message data.
-        timestamp_col (str, optional): Name of the column containing the timestamp data. Defaults to None.
         valid_speakers (list, optional): List of valid speakers to include in the analysis. Defaults to None.
         sheet_name (str, optional): Name of the sheet to read from the input file. Defaults to None.
         filters (dict, optional): Dictionary of filters to apply to the conversation data. Defaults to None.
+        columns (list, optional): Columns to read besides speaker_col, message_col, and the columns of filters.
+        Defaults to None (all columns).
+        chunksize (int, optional): Number of rows of .csv and .jsonl files parsed at a time. The rows of each chunk
+        are filtered before the next chunk is parsed. Defaults to 100000. .xlsx files cannot be read in chunks, so
+        all their rows are loaded (only the selected columns) before they are filtered.
 
     Returns:
         df (pd.DataFrame): DataFrame containing the conversation data.
     """
+    if filters is None:
+        filters = {}
+    if columns is not None:
+        columns = list(dict.fromkeys([speaker_col, message_col, *columns, *filters]))
+
+    chunks = None
     if input_file.endswith('.xlsx'):
         if sheet_name is None:
-            df = pd.read_excel(input_file)
+            df = pd.read_excel(input_file, usecols=columns)
+        else:
+            df = pd.read_excel(input_file, sheet_name=sheet_name, usecols=columns)
+    elif input_file.endswith(('.csv', '.jsonl')):
+        # Filter each chunk so that rows which are filtered out are never accumulated
+        if input_file.endswith('.csv'):
+            reader = pd.read_csv(input_file, usecols=columns, chunksize=chunksize)
         else:
-            df = pd.read_excel(input_file, sheet_name=sheet_name)
-    elif input_file.endswith('.csv'):
-        df = pd.read_csv(input_file)
+            reader = pd.read_json(input_file, lines=True, chunksize=chunksize, convert_dates=False,
+                                  keep_default_dates=False)
+        with reader:
+            chunks = [_filter_transcript(chunk if columns is None else chunk[columns], speaker_col, message_col,
+                                         valid_speakers, filters)
+                      for chunk in reader]
+        df = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=columns)
+    elif input_file.endswith(('.parquet', '.feather', '.arrow')):
+        df = _read_arrow_transcript(input_file, speaker_col, message_col, valid_speakers, filters, columns)
     else:
-        raise ValueError("Invalid input file format. Please provide a .xlsx or .csv file.")
+        raise ValueError(f"Invalid input file format. Please provide a file with one of the extensions "
+                         f"{', '.join(INPUT_EXTENSIONS)}.")
+    if chunks is None:
+        df = _filter_transcript(df if columns is None else df[columns], speaker_col, message_col, valid_speakers,
+                                filters)
+    return df.dropna(subset=[speaker_col]).reset_index(drop=True)
+
+
+def _filter_transcript(df: pd.DataFrame, speaker_col: str, message_col: str, valid_speakers, filters: dict):
+    """
+    Clean the speakers and messages, then keep the rows of valid speakers that pass the filters.
+    """
     df[speaker_col] = df[speaker_col].str.replace(':', '')
     df[message_col] = df[message_col].str.replace(r'\\[.+\\]', '', regex=True)
     if valid_speakers is not None:
         df = df[df[speaker_col].isin(valid_speakers)]
-    if filters is not None:
-        for col, vals in filters.items():
-            df = df[df[col].isin(vals)]
-    return df.dropna(subset=[speaker_col]).reset_index(drop=True)
+    for col, vals in filters.items():
+        df = df[df[col].isin(vals)]
+    return df
+
+
+def _read_arrow_transcript(input_file: str, speaker_col: str, message_col: str, valid_speakers, filters: dict,
+                           columns) -> pd.DataFrame:
+    """
+    Read a Parquet or Feather file with the valid speakers and the filters pushed down into the reader, so that only
+    the selected columns of the matching rows are materialized. The result still needs _filter_transcript.
+    """
+    try:
+        import pyarrow.dataset as ds
+    except ImportError as e:
+        raise ImportError("Reading .parquet and .feather files requires pyarrow. Install it with pip install "
+                          "pyarrow.") from e
+    dataset = ds.dataset(input_file, format='parquet' if input_file.endswith('.parquet') else 'feather')
+
+    expression = None
+    if valid_speakers is not None:
+        # Speakers are compared after removing ':', so find the raw values that match by reading only the speakers.
+        valid_speakers = set(valid_speakers)
+        raw_speakers = dataset.to_table(columns=[speaker_col]).column(speaker_col).unique().to_pylist()
+        expression = ds.field(speaker_col).isin([speaker for speaker in raw_speakers
+                                                 if isinstance(speaker, str) and speaker.replace(':', '') in
+                                                 valid_speakers])
+    for col, vals in filters.items():
+        # Filters on the speakers and the messages compare cleaned values and are applied after reading.
+        if col in (speaker_col, message_col):
+            continue
+        condition = ds.field(col).isin(list(vals))
+        expression = condition if expression is None else expression & condition
+    return dataset.to_table(columns=columns, filter=expression).to_pandas()
 
 
 def _get_ev(expressions: List[str], total_tokens: int) -> float:
@@ -49,6 +122,8 @@ def _get_ev(expressions: List[str], total_tokens: int) -> float:
 
 
 def _get_entr(expressions: List[str]) -> float:
+    if len(expressions) == 0:
+        return 0.0
     expression_lengths = [len(expression.split()) for expression in expressions]
     counter = Counter(expression_lengths)
     _, counts = zip(*counter.items())
@@ -58,7 +133,7 @@ def _get_entr(expressions: List[str]) -> float:
 
 def dialign(input_file: str, speaker_col: str, message_col: str, timestamp_col=None, valid_speakers=None,
             sheet_name=None, filters=None, window=None, exception_tokens=None, min_ngram=1, max_ngram=None,
-            time_format="%Y-%m-%d %H:%M:%S", tokenizer=None):
+            time_format="%Y-%m-%d %H:%M:%S", tokenizer=None, checkpoint=None, return_checkpoint=False, n_jobs=1):
     """
     Function to run the Dialign algorithm on a conversation dataset.
 
@@ -73,7 +148,14 @@ def dialign(input_file: str, speaker_col: str, message_col: str, timestamp_col=N
     Defaults to 1. max_ngram (int, optional): Maximum n-gram length for the analysis. Defaults to None. time_format (
     str, optional): format of the timestamp. Defaults to "%Y-%m-%d %H:%M:%S". tokenizer (function, optional):
     Tokenizer function to use for the analysis. It must take a string to tokenize as the only argument and return a
-    list of tokens. Defaults to tokenize in utils.py.
+    list of tokens. Defaults to tokenize in utils.py. checkpoint (DialignCheckpoint, optional): the state returned by
+    an earlier call on a prefix of the same transcript with the same parameters. Only the rows appended since are
+    scored, and the checkpoint is updated in place. If valid_speakers is None and the appended rows have new speakers,
+    the whole transcript is scored again because the speakers affect the analysis of earlier rows. Defaults to None.
+    return_checkpoint (bool, optional): also return the checkpoint to resume from. Defaults to False. n_jobs (int,
+    optional): number of processes. With more than one, the messages are tokenized and compared with the messages of
+    their windows in parallel, then the comparisons are replayed in order to build the lexicons and the scores. The
+    results are the same. The tokenizer must be picklable. Defaults to 1.
 
     Returns: tuple: A tuple containing the following elements: - speaker_independent (dict): Dictionary containing
     the speaker-independent scores (EV, ER, ENTR, L, LMAX, SER, EE, Total tokens, Num. shared expressions) for the
@@ -83,99 +165,411 @@ def dialign(input_file: str, speaker_col: str, message_col: str, timestamp_col=N
     the initiator, establisher, establishment turn, and turns in which the expression appeared. - self_repetitions (
     dict): Dictionary containing the self-repetition scores (SEV, SER, SENTR, SL, SLMAX) for each speaker for the
     conversation. - online_metrics (list): List of dictionaries containing the online metrics for each message in the
-    conversation.
+    conversation. - checkpoint (DialignCheckpoint): Only if return_checkpoint is True. The state after the last row.
     """
 
+    df = read_transcript(input_file, speaker_col, message_col, sheet_name, valid_speakers, filters,
+                         columns=[] if timestamp_col is None else [timestamp_col])
+    config = {'valid_speakers': None if valid_speakers is None else list(valid_speakers), 'window': window,
+              'exception_tokens': list(exception_tokens or []), 'min_ngram': min_ngram, 'max_ngram': max_ngram,
+              'time_format': time_format, 'speaker_col': speaker_col, 'message_col': message_col,
+              'timestamp_col': timestamp_col, 'sheet_name': sheet_name,
+              'filters': {col: list(vals) for col, vals in (filters or {}).items()},
+              'tokenizer': _tokenizer_name(tokenizer)}
+
+    start = 0
+    if checkpoint is not None:
+        if checkpoint.config != config:
+            raise ValueError("The checkpoint was created with different parameters.")
+        if len(df) < checkpoint.num_rows or \
+                _transcript_digest(df, speaker_col, message_col, timestamp_col, checkpoint.num_rows) != checkpoint.digest:
+            raise ValueError("The transcript does not extend the transcript of the checkpoint.")
+        if valid_speakers is None and not set(df[speaker_col].unique()) <= set(checkpoint.valid_speakers):
+            checkpoint = None
+        else:
+            start = checkpoint.num_rows
+
+    if checkpoint is None:
+        # Initialize the conversation instance
+        if valid_speakers is None:
+            valid_speakers = df[speaker_col].unique()
+        persons = {speaker: Person(speaker) for speaker in valid_speakers}
+        conversation = Conversation(persons=persons, window=window, exception_tokens=exception_tokens,
+                                    min_ngram=min_ngram, max_ngram=max_ngram, time_format=time_format)
+        checkpoint = DialignCheckpoint(conversation, valid_speakers, config)
+
+    if n_jobs > 1:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            rows = _tokenize_transcript(df.iloc[start:], speaker_col, message_col, timestamp_col, tokenizer,
+                                        executor=executor, n_jobs=n_jobs)
+            timestamps = list(df[timestamp_col]) if timestamp_col is not None else [None] * len(df)
+            windows = window_indices(timestamps, window, time_format)
+            if windows is not None and start < len(df):
+                # Windowed conversations analyze the turns of the window again, so compare them too.
+                first = min(start, windows[start][0]) if len(windows[start]) else start
+                messages = [metrics['Message'] for metrics in checkpoint.online_metrics] + [row[1] for row in rows]
+                checkpoint.conversation.prime_free_form_flags(free_form_flags(
+                    messages, windows, first, executor, n_jobs, min_ngram, max_ngram, exception_tokens))
+        checkpoint.update(rows)
+        checkpoint.conversation.prime_free_form_flags(None)
+    else:
+        rows = _tokenize_transcript(df.iloc[start:], speaker_col, message_col, timestamp_col, tokenizer)
+        checkpoint.update(rows)
+    checkpoint.num_rows = len(df)
+    checkpoint.digest = _transcript_digest(df, speaker_col, message_col, timestamp_col, len(df))
+    results = checkpoint.results()
+    if return_checkpoint:
+        return results + (checkpoint,)
+    return results
+
+
+def iter_dialign(rows: Iterable[tuple], valid_speakers, window=None, exception_tokens=None, min_ngram=1,
+                 max_ngram=None, time_format="%Y-%m-%d %H:%M:%S", tokenizer=None) -> Generator[dict, None, tuple]:
+    """
+    Run the Dialign algorithm lazily: rows are read and scored one at a time, and the online metrics of each row are
+    yielded as soon as it is scored. Only the conversation is kept in memory, not the online metrics.
+
+    Args:
+        rows (Iterable): (speaker, message, timestamp) tuples. timestamp can be None. Rows of other speakers than
+        valid_speakers are skipped.
+        valid_speakers (list): the speakers of the dialogue. They must be known in advance because an expression is
+        established once all of them have used it.
+        window, exception_tokens, min_ngram, max_ngram, time_format, tokenizer: see dialign
+
+    Yields:
+        dict: the online metrics of each row (see dialign)
+
+    Returns:
+        tuple: speaker_independent, speaker_dependent, shared_expressions, and self_repetitions (see dialign), as the
+        value of the StopIteration raised when the rows are exhausted (e.g., results = yield from iter_dialign(...))
+    """
     if tokenizer is None:
         from dialign_python.utils import tokenize
         tokenizer = tokenize
+    valid_speakers = list(valid_speakers)
+    persons = {speaker: Person(speaker) for speaker in valid_speakers}
+    conversation = Conversation(persons=persons, window=window, exception_tokens=exception_tokens,
+                                min_ngram=min_ngram, max_ngram=max_ngram, time_format=time_format)
+    checkpoint = DialignCheckpoint(conversation, valid_speakers)
+    for speaker, message, timestamp in rows:
+        if speaker not in persons:
+            continue
+        (message, num_tokens), = tokenize_texts([message], tokenizer)
+        yield checkpoint.score_row(speaker, message, num_tokens, timestamp)
+    return checkpoint.results()[:4]
 
-    df = read_transcript(input_file, speaker_col, message_col, sheet_name, valid_speakers, filters)
 
-    # Initialize the conversation instance
-    if valid_speakers is None:
-        valid_speakers = df[speaker_col].unique()
-    persons = {speaker: Person(speaker) for speaker in valid_speakers}
-    conversation = Conversation(persons=persons, window=window, exception_tokens=exception_tokens, min_ngram=min_ngram,
-                                max_ngram=max_ngram, time_format=time_format)
-
-    # Iterate through each row in the conversation data
-    repetition_num = 0
-    self_repetition_num = 0
-    establishment_num = 0
-    total_tokens = 0
-    speaker_dependent = {speaker: {"ER": 0.0, "EE": 0.0, "Total tokens": 0, "Initiated": 0, "Established": 0} for speaker in
-                         valid_speakers}
-    self_repetitions = {speaker: {"SER": 0.0} for speaker in valid_speakers}
-    online_metrics = []
-    for _, row in df.iterrows():
-        speaker = row[speaker_col]
-        tokens = tokenizer(row[message_col])
-        message = ' '.join(tokens).lower()
-        if timestamp_col is not None:
-            timestamp = row[timestamp_col]
-            der, dser, dee, established_expression, repeated_expression, self_repetition = conversation.score_message(
-                speaker, message, timestamp, add_message_to_history=True)
-        else:
-            der, dser, dee, established_expression, repeated_expression, self_repetition = conversation.score_message(
-                speaker, message, add_message_to_history=True)
-        speaker_dependent[speaker]["ER"] += round(der * len(tokens))
-        self_repetitions[speaker]["SER"] += round(dser * len(tokens))
-        speaker_dependent[speaker]["EE"] += round(dee * len(tokens))
-        speaker_dependent[speaker]["Total tokens"] += len(tokens)
-        repetition_num += round(der * len(tokens))
-        self_repetition_num += round(dser * len(tokens))
-        establishment_num += round(dee * len(tokens))
-        total_tokens += len(tokens)
-        online_metrics.append({'Speaker': speaker, 'Message': message, 'DER': der, 'DSER': dser, 'DEE': dee,
-                               'Established Expression': established_expression,
-                               'Repeated Expression': repeated_expression, 'Self Repetition': self_repetition})
-
-    # Compute the final speaker-dependent scores
-    for speaker in valid_speakers:
-        if speaker_dependent[speaker]["Total tokens"] > 0:
-            speaker_dependent[speaker]["ER"] /= speaker_dependent[speaker]["Total tokens"]
-            self_repetitions[speaker]["SER"] /= speaker_dependent[speaker]["Total tokens"]
-            speaker_dependent[speaker]["EE"] /= speaker_dependent[speaker]["Total tokens"]
+def _tokenizer_name(tokenizer) -> str:
+    """
+    The qualified name of a tokenizer (module:name), which identifies it in checkpoints.
+    """
+    if tokenizer is None:
+        return 'dialign_python.utils:tokenize'
+    module = getattr(tokenizer, '__module__', None) or \
+        getattr(getattr(tokenizer, '__objclass__', None), '__module__', None)
+    name = getattr(tokenizer, '__qualname__', None) or type(tokenizer).__qualname__
+    return f"{module}:{name}"
+
+
+def _transcript_digest(df: pd.DataFrame, speaker_col: str, message_col: str, timestamp_col, stop: int) -> str:
+    """
+    A digest of the speakers, messages, and timestamps of the first stop rows of a transcript.
+    """
+    digest = hashlib.sha256()
+    timestamps = df[timestamp_col] if timestamp_col is not None else itertools.repeat(None)
+    for speaker, message, timestamp in itertools.islice(zip(df[speaker_col], df[message_col], timestamps), stop):
+        digest.update(f'{speaker}\t{message}\t{timestamp}\n'.encode())
+    return digest.hexdigest()
+
+
+def _tokenize_transcript(df: pd.DataFrame, speaker_col: str, message_col: str, timestamp_col=None,
+                         tokenizer=None, executor=None, n_jobs=1) -> List[tuple]:
+    """
+    Tokenize the messages of a transcript, in chunks over executor if it is given.
+
+    Returns:
+        list: (speaker, message, number of tokens, timestamp) tuples. message is the lowercased tokens joined by
+        spaces. timestamp is None if timestamp_col is None.
+    """
+    texts = list(df[message_col])
+    if executor is None:
+        tokenized = tokenize_texts(texts, tokenizer)
+    else:
+        chunk_size = max(1, -(-len(texts) // (n_jobs * 4)))
+        chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+        tokenized = [row for chunk in executor.map(tokenize_texts, chunks, itertools.repeat(tokenizer))
+                     for row in chunk]
+    timestamps = df[timestamp_col] if timestamp_col is not None else itertools.repeat(None)
+    return [(speaker, message, num_tokens, timestamp)
+            for speaker, (message, num_tokens), timestamp in zip(df[speaker_col], tokenized, timestamps)]
+
+
+def _score_rows(conversation: Conversation, rows: List[tuple], valid_speakers) -> tuple:
+    """
+    Score tokenized rows (see _tokenize_transcript) one by one and compute the metrics returned by dialign.
+    """
+    checkpoint = DialignCheckpoint(conversation, valid_speakers)
+    checkpoint.update(rows)
+    return checkpoint.results()
+
+
+class DialignCheckpoint:
+    def __init__(self, conversation: Conversation, valid_speakers, config=None):
+        """
+        The state of dialign after scoring a prefix of a transcript: the conversation, the running token counts, and
+        the online metrics so far. dialign can resume from a checkpoint and only score the rows appended since.
+
+        Args:
+            conversation (Conversation): the conversation the rows are scored with
+            valid_speakers (list): the speakers of the transcript
+            config (dict, optional): the parameters of dialign that the state depends on. Defaults to None.
+        """
+        self.conversation = conversation
+        self.valid_speakers = list(valid_speakers)
+        self.config = config
+        # Number of transcript rows scored and a digest of them, to check that a transcript extends them
+        self.num_rows = 0
+        self.digest = None
+
+        self.repetition_num = 0
+        self.self_repetition_num = 0
+        self.establishment_num = 0
+        self.total_tokens = 0
+        # Token counts (not yet normalized)
+        self.speaker_dependent = {speaker: {"ER": 0.0, "EE": 0.0, "Total tokens": 0} for speaker in valid_speakers}
+        self.self_repetitions = {speaker: {"SER": 0.0} for speaker in valid_speakers}
+        self.online_metrics = []
+
+    def save(self, path: str):
+        """
+        Save the checkpoint with pickle.
+
+        Args:
+            path (str): the file to write
+        """
+        with open(path, 'wb') as f:
+            pickle.dump(self, f)
+
+    @staticmethod
+    def load(path: str) -> 'DialignCheckpoint':
+        """
+        Load a checkpoint saved with save(). Only load files you trust (see the pickle documentation).
+
+        Args:
+            path (str): the file to read
+
+        Returns:
+            DialignCheckpoint: the checkpoint
+        """
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+    def update(self, rows: List[tuple]):
+        """
+        Score tokenized rows (see _tokenize_transcript) one by one and add them to the running counts.
+        """
+        online_metrics = self.online_metrics
+        for row in rows:
+            online_metrics.append(self.score_row(*row))
+
+    def score_row(self, speaker: str, message: str, num_tokens: int, timestamp=None) -> dict:
+        """
+        Score a tokenized row and add it to the running counts without keeping its online metrics.
+
+        Returns:
+            dict: the online metrics of the row
+        """
+        der, dser, dee, established_expression, repeated_expression, self_repetition = self.conversation.score_message(
+            speaker, message, timestamp, add_message_to_history=True)
+        speaker_dependent = self.speaker_dependent[speaker]
+        speaker_dependent["ER"] += round(der * num_tokens)
+        self.self_repetitions[speaker]["SER"] += round(dser * num_tokens)
+        speaker_dependent["EE"] += round(dee * num_tokens)
+        speaker_dependent["Total tokens"] += num_tokens
+        self.repetition_num += round(der * num_tokens)
+        self.self_repetition_num += round(dser * num_tokens)
+        self.establishment_num += round(dee * num_tokens)
+        self.total_tokens += num_tokens
+        return {'Speaker': speaker, 'Message': message, 'DER': der, 'DSER': dser, 'DEE': dee,
+                'Established Expression': established_expression, 'Repeated Expression': repeated_expression,
+                'Self Repetition': self_repetition}
+
+    def results(self) -> tuple:
+        """
+        Compute the metrics returned by dialign from the running counts. The checkpoint is not modified.
+        """
+        conversation = self.conversation
+        valid_speakers = self.valid_speakers
+        total_tokens = self.total_tokens
+        speaker_dependent = {speaker: {"ER": data["ER"], "EE": data["EE"], "Total tokens": data["Total tokens"],
+                                       "Initiated": 0, "Established": 0}
+                             for speaker, data in self.speaker_dependent.items()}
+        self_repetitions = {speaker: dict(data) for speaker, data in self.self_repetitions.items()}
+
+        # Compute the final speaker-dependent scores
+        for speaker in valid_speakers:
+            if speaker_dependent[speaker]["Total tokens"] > 0:
+                speaker_dependent[speaker]["ER"] /= speaker_dependent[speaker]["Total tokens"]
+                self_repetitions[speaker]["SER"] /= speaker_dependent[speaker]["Total tokens"]
+                speaker_dependent[speaker]["EE"] /= speaker_dependent[speaker]["Total tokens"]
+            else:
+                speaker_dependent[speaker]["ER"] = 0
+                self_repetitions[speaker]["SER"] = 0
+                speaker_dependent[speaker]["EE"] = 0
+        for data in conversation.shared_expressions.values():
+            speaker_dependent[data['initiator']]["Initiated"] += 1 / len(conversation.shared_expressions)
+            speaker_dependent[data['establisher']]["Established"] += 1 / len(conversation.shared_expressions)
+
+        # Compute the final speaker-independent scores
+        if total_tokens > 0:
+            speaker_independent = {
+                "ER": self.repetition_num / total_tokens,
+                "SER": self.self_repetition_num / total_tokens,
+                "EE": self.establishment_num / total_tokens
+            }
         else:
-            speaker_dependent[speaker]["ER"] = 0
-            self_repetitions[speaker]["SER"] = 0
-            speaker_dependent[speaker]["EE"] = 0
-    for data in conversation.shared_expressions.values():
-        speaker_dependent[data['initiator']]["Initiated"] += 1 / len(conversation.shared_expressions)
-        speaker_dependent[data['establisher']]["Established"] += 1 / len(conversation.shared_expressions)
-
-    # Compute the final speaker-independent scores
-    if total_tokens > 0:
-        speaker_independent = {
-            "ER": repetition_num / total_tokens,
-            "SER": self_repetition_num / total_tokens,
-            "EE": establishment_num / total_tokens
-        }
+            speaker_independent = {
+                "ER": 0.0,
+                "SER": 0.0,
+                "EE": 0.0
+            }
+        speaker_independent["Total tokens"] = total_tokens
+        speaker_independent["Num. shared expressions"] = len(conversation.shared_expressions)
+        speaker_independent['EV'] = _get_ev(list(conversation.shared_expressions.keys()), total_tokens)
+        expression_lengths = [len(expression.split()) for expression in conversation.shared_expressions]
+        speaker_independent['ENTR'] = _get_entr(list(conversation.shared_expressions.keys()))
+        speaker_independent['L'] = float(np.mean(expression_lengths)) if expression_lengths else 0.0
+        speaker_independent['LMAX'] = int(np.max(expression_lengths)) if expression_lengths else 0
+
+        # Compute the self-repetitions
+        for speaker, person in conversation.persons.items():
+            self_repetitions[speaker]["SEV"] = _get_ev(person.show_repetitions(),
+                                                       speaker_dependent[speaker]["Total tokens"])
+            expression_lengths = [len(expression.split()) for expression in person.show_repetitions()]
+            self_repetitions[speaker]["SENTR"] = _get_entr(person.show_repetitions())
+            self_repetitions[speaker]["SL"] = float(np.mean(expression_lengths)) if expression_lengths else 0.0
+            self_repetitions[speaker]["SLMAX"] = int(np.max(expression_lengths)) if expression_lengths else 0
+
+        return speaker_independent, speaker_dependent, conversation.shared_expressions.as_dict(), self_repetitions, \
+            list(self.online_metrics)
+
+
+def dialign_sweep(input_file: str, speaker_col: str, message_col: str, timestamp_col=None, valid_speakers=None,
+                  sheet_name=None, filters=None, windows=(None,), exception_tokens=(None,), min_ngrams=(1,),
+                  max_ngrams=(None,), time_format="%Y-%m-%d %H:%M:%S", tokenizer=None, n_jobs=1) -> pd.DataFrame:
+    """
+    Function to run the Dialign algorithm on a conversation dataset for every combination of windows, exception tokens,
+    and n-gram lengths. The transcript is read and tokenized once, and the n-grams of each message are generated once
+    for the widest n-gram range. The n-grams of every configuration are derived from them.
+
+    Args: input_file, speaker_col, message_col, timestamp_col, valid_speakers, sheet_name, filters, time_format, and
+    tokenizer are the same as in dialign. windows (list, optional): the windows to try (see dialign). Defaults to
+    (None,). exception_tokens (list, optional): the lists of exception tokens to try. Defaults to (None,).
+    min_ngrams (list, optional): the minimum n-gram lengths to try. Defaults to (1,). max_ngrams (list, optional): the
+    maximum n-gram lengths to try. Defaults to (None,). n_jobs (int, optional): number of processes the
+    configurations are distributed over. Defaults to 1 (no subprocess).
+
+    Returns: df (pd.DataFrame): one row per configuration with the columns min_ngram, max_ngram, window,
+    exception_tokens, the speaker-independent scores, and the speaker-dependent scores and self-repetition scores of
+    each speaker S as <score>_<S> (e.g., ER_S, SER_S, Initiated_S).
+    """
+    df = read_transcript(input_file, speaker_col, message_col, sheet_name, valid_speakers, filters,
+                         columns=[] if timestamp_col is None else [timestamp_col])
+    rows = _tokenize_transcript(df, speaker_col, message_col, timestamp_col, tokenizer)
+    if valid_speakers is None:
+        valid_speakers = list(df[speaker_col].unique())
+
+    configs = [(min_ngram, max_ngram, window, exceptions)
+               for min_ngram, max_ngram, window, exceptions
+               in itertools.product(min_ngrams, max_ngrams, windows, exception_tokens)]
+    if n_jobs <= 1 or len(configs) <= 1:
+        results = _sweep_configs(rows, valid_speakers, configs, time_format)
     else:
-        speaker_independent = {
-            "ER": 0.0,
-            "SER": 0.0,
-            "EE": 0.0
-        }
-    speaker_independent["Total tokens"] = total_tokens
-    speaker_independent["Num. shared expressions"] = len(conversation.shared_expressions)
-    speaker_independent['EV'] = _get_ev(list(conversation.shared_expressions.keys()), total_tokens)
-    expression_lengths = [len(expression.split()) for expression in conversation.shared_expressions]
-    speaker_independent['ENTR'] = _get_entr(list(conversation.shared_expressions.keys()))
-    speaker_independent['L'] = float(np.mean(expression_lengths))
-    speaker_independent['LMAX'] = int(np.max(expression_lengths))
-
-    # Compute the self-repetitions
-    for speaker, person in conversation.persons.items():
-        self_repetitions[speaker]["SEV"] = _get_ev(person.show_repetitions(),
-                                                   speaker_dependent[speaker]["Total tokens"])
-        expression_lengths = [len(expression.split()) for expression in person.show_repetitions()]
-        self_repetitions[speaker]["SENTR"] = _get_entr(person.show_repetitions())
-        self_repetitions[speaker]["SL"] = float(np.mean(expression_lengths))
-        self_repetitions[speaker]["SLMAX"] = int(np.max(expression_lengths))
-
-    return speaker_independent, speaker_dependent, conversation.shared_expressions, self_repetitions, online_metrics
+        # Configurations with the same n-gram lengths share derived n-grams, so keep them in the same process.
+        order = sorted(range(len(configs)), key=lambda i: (configs[i][0], configs[i][1] is None, configs[i][1] or 0))
+        chunk_size = -(-len(order) // n_jobs)
+        chunks = [order[i:i + chunk_size] for i in range(0, len(order), chunk_size)]
+        results = [None] * len(configs)
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            futures = [executor.submit(_sweep_configs, rows, valid_speakers, [configs[i] for i in chunk], time_format)
+                       for chunk in chunks]
+            for chunk, future in zip(chunks, futures):
+                for i, result in zip(chunk, future.result()):
+                    results[i] = result
+    return pd.DataFrame(results)
+
+
+def _sweep_configs(rows: List[tuple], valid_speakers, configs: List[tuple], time_format: str) -> List[dict]:
+    """
+    Score tokenized rows for each (min_ngram, max_ngram, window, exception_tokens) configuration and flatten the
+    scores into a dictionary per configuration.
+    """
+    # Encode every distinct message once and generate its n-grams for the widest n-gram range.
+    vocabulary = Vocabulary()
+    lowest = min(config[0] for config in configs)
+    highest = None if any(config[1] is None for config in configs) else max(config[1] for config in configs)
+    superset = {}
+    for _, message, _, _ in rows:
+        tokens = vocabulary.encode(message)
+        if tokens not in superset:
+            words = message.split()
+            maximum = len(words) if highest is None else highest
+            superset[tokens] = [(' '.join(words[i:i + n]), n) for i in range(len(words))
+                                for n in range(lowest, maximum + 1) if i + n <= len(words)]
+
+    artifacts_by_config = {}
+    results = []
+    for min_ngram, max_ngram, window, exceptions in configs:
+        key = (min_ngram, max_ngram)
+        artifacts = artifacts_by_config.get(key)
+        if artifacts is None:
+            # Filtering keeps the order in which Conversation generates n-grams
+            maximum = float('inf') if max_ngram is None else max_ngram
+            artifacts = {}
+            for tokens, n_grams in superset.items():
+                derived = [n_gram for n_gram, n in n_grams if min_ngram <= n <= maximum]
+                artifacts[tokens] = (derived, set(derived), Counter(derived))
+            artifacts_by_config[key] = artifacts
+
+        persons = {speaker: Person(speaker) for speaker in valid_speakers}
+        conversation = Conversation(persons=persons, window=window, exception_tokens=exceptions, min_ngram=min_ngram,
+                                    max_ngram=max_ngram, time_format=time_format, vocabulary=vocabulary)
+        conversation.prime_n_gram_artifacts(artifacts)
+        speaker_independent, speaker_dependent, _, self_repetitions, _ = _score_rows(conversation, rows,
+                                                                                     valid_speakers)
+
+        result = {'min_ngram': min_ngram, 'max_ngram': max_ngram, 'window': window, 'exception_tokens': exceptions}
+        result.update(speaker_independent)
+        for scores in (speaker_dependent, self_repetitions):
+            for speaker, data in scores.items():
+                for name, value in data.items():
+                    result[f'{name}_{speaker}'] = value
+        results.append(result)
+    return results
+
+
+def dialign_curves(input_file: str, speaker_col: str, message_col: str, timestamp_col=None, valid_speakers=None,
+                   sheet_name=None, filters=None, window=None, exception_tokens=None, min_ngram=1, max_ngram=None,
+                   time_format="%Y-%m-%d %H:%M:%S", tokenizer=None) -> dict:
+    """
+    Function to compute EV, ER, and EE over the sliding windows of a conversation dataset: the measures of dialign on
+    the window that ends with each turn. The transcript is processed in one pass (see curves.AlignmentCurves) instead
+    of calling dialign on each window.
+
+    Args: input_file, speaker_col, message_col, timestamp_col, valid_speakers, sheet_name, filters, exception_tokens,
+    min_ngram, max_ngram, time_format, and tokenizer are the same as in dialign. window (int | timedelta, optional):
+    the number of turns of each window, or the time range of each window (requires timestamp_col). Defaults to None
+    (each window starts with the first turn).
+
+    Returns: curves (dict): for each measure (First turn, Last turn, Total tokens, Num. shared expressions, EV, ER, and
+    EE), a numpy array with the measure of the window ending with each turn.
+    """
+    df = read_transcript(input_file, speaker_col, message_col, sheet_name, valid_speakers, filters,
+                         columns=[] if timestamp_col is None else [timestamp_col])
+    rows = _tokenize_transcript(df, speaker_col, message_col, timestamp_col, tokenizer)
+    if valid_speakers is None:
+        valid_speakers = list(df[speaker_col].unique())
+    return alignment_curves(rows, valid_speakers, window, exception_tokens, min_ngram, max_ngram, time_format)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,273 @@
+import argparse
+import random
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from dialign_python.conversation import Conversation
+from dialign_python.ngrams import NGramStore
+from dialign_python.pipeline import free_form_flags, window_indices
+from dialign_python.reference import ReferenceConversation
+from dialign_python.sqlite_history import SQLiteHistory
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+# Engines that score every operation of a scenario
+ONLINE_ENGINES = ('memory', 'ngram_store', 'sqlite')
+# Engines that only apply to transcripts scored from the start, compared on the scoring operations of a scenario
+REPLAY_ENGINES = ('parallel', 'load_history')
+ENGINES = ONLINE_ENGINES + REPLAY_ENGINES
+
+
+def random_scenario(seed: int, n_turns: int = 40) -> dict:
+    """
+    A randomized multi-party dialogue and the configuration it is scored with. The vocabulary is small so that
+    messages share many n-grams, and punctuation, exception tokens, repeated timestamps, and gaps longer than the
+    window are frequent.
+
+    Args:
+        seed (int): the seed of the scenario
+        n_turns (int, optional): the number of operations. Defaults to 40.
+
+    Returns:
+        dict: the configuration (persons, window, exception_tokens, min_ngram, max_ngram, and the cache_size of the
+        sqlite engine) and the operations, each a
+        tuple of the kind of operation ('score', 'add', 'probe' to score without adding the message, or 'focus'), the
+        timestamp, the speaker, the message, and the focus conversation
+    """
+    rng = random.Random(seed)
+    speakers = [f"s{i}" for i in range(rng.randint(2, 4))]
+    vocabulary = rng.sample("so we have two over three i think you re right yes no the a it . , ? !".split(),
+                            rng.randint(4, 12))
+    min_ngram = rng.choice([1, 1, 1, 2])
+    max_ngram = rng.choice([None, None, min_ngram, min_ngram + 1, min_ngram + 3])
+    exception_tokens = rng.sample(vocabulary, rng.randint(0, 2))
+    if rng.random() < 0.3:
+        exception_tokens.append(' '.join(rng.sample(vocabulary, 2)))
+    window = rng.choice([None, None, rng.randint(1, 8), timedelta(seconds=rng.randint(5, 60))])
+
+    operations = []
+    time = datetime(2025, 1, 1)
+    for _ in range(n_turns):
+        time += timedelta(seconds=rng.choice([0, 1, 3, 10, 30]))
+        kind = rng.choices(['score', 'add', 'probe', 'focus'], weights=[6, 1, 1, 1])[0]
+        focus = rng.sample(speakers, rng.randint(1, len(speakers))) if kind == 'focus' else None
+        message = ' '.join(rng.choice(vocabulary) for _ in range(rng.randint(1, 8)))
+        operations.append((kind, time.strftime(TIME_FORMAT), rng.choice(speakers), message, focus))
+    # Drawn last so that the other draws of a seed do not change
+    cache_size = rng.choice([2, 4, 4096])
+    return {'persons': list(speakers) if rng.random() < 0.5 else [], 'window': window,
+            'exception_tokens': exception_tokens, 'min_ngram': min_ngram, 'max_ngram': max_ngram,
+            'cache_size': cache_size, 'operations': operations}
+
+
+def scoring_operations(scenario: dict) -> dict:
+    """
+    The scenario restricted to its 'score' operations: a transcript scored from the start.
+    """
+    return dict(scenario, operations=[operation for operation in scenario['operations'] if operation[0] == 'score'])
+
+
+def _configuration(scenario: dict) -> dict:
+    return {'window': scenario['window'], 'persons': list(scenario['persons']),
+            'exception_tokens': list(scenario['exception_tokens']), 'min_ngram': scenario['min_ngram'],
+            'max_ngram': scenario['max_ngram'], 'time_format': TIME_FORMAT}
+
+
+def _normalize_scores(scores) -> tuple:
+    der, dser, dee, established, repeated, personal = scores
+    return der, dser, dee, sorted(established), sorted(repeated), sorted(personal)
+
+
+def conversation_state(conversation) -> dict:
+    """
+    The state of a Conversation or a ReferenceConversation that the engines must agree on: the history, the shared
+    expressions with their initiators, establishers, establishment turns, and turns, and the self-repetitions of each
+    speaker.
+    """
+    repetitions = conversation.persons.items()
+    return {'history': [tuple(turn) for turn in conversation.history],
+            'shared_expressions': {n_gram: (expression['initiator'], expression['establisher'],
+                                            expression['establishmemt turn'], sorted(expression['turns']))
+                                   for n_gram, expression in conversation.shared_expressions.items()},
+            'repetitions': {speaker: sorted(person if isinstance(person, list) else person.repetitions)
+                            for speaker, person in repetitions}}
+
+
+def run_operations(conversation, operations: List[tuple]) -> List[tuple]:
+    """
+    Apply operations (see random_scenario) to a conversation.
+
+    Returns:
+        list: the normalized scores of each operation (expression lists are sorted), None for additions, or the name
+        of the exception an operation raised
+    """
+    results = []
+    for kind, timestamp, speaker, message, focus in operations:
+        try:
+            if kind == 'add':
+                conversation.add_message(speaker, message, timestamp)
+                results.append(None)
+            else:
+                results.append(_normalize_scores(conversation.score_message(
+                    speaker, message, timestamp, add_message_to_history=kind != 'probe', focus_conversation=focus)))
+        except Exception as error:
+            results.append(type(error).__name__)
+    return results
+
+
+def run_engine(engine: str, scenario: dict) -> tuple[List[tuple], dict]:
+    """
+    Run a scenario on one of the engines of Conversation:
+
+    - memory: the default, in memory history with per-conversation caches
+    - ngram_store: n-grams shared through an NGramStore already filled by another conversation
+    - sqlite: a SQLiteHistory that keeps cache_size turns in memory. Since the timestamps of scenarios are in order,
+      windows only evict the oldest turns, and a rewrite of the turn table is reported as an error.
+    - parallel: matches precomputed by pipeline.free_form_flags (scoring operations only)
+    - load_history: each message scored after the messages before it are ingested with load_history (scoring
+      operations only)
+
+    Returns:
+        tuple: the results of the operations (see run_operations) and the final state (see conversation_state)
+    """
+    configuration = _configuration(scenario)
+    operations = scenario['operations']
+    if engine in REPLAY_ENGINES and any(operation[0] != 'score' for operation in operations):
+        raise ValueError(f"The {engine} engine only replays scoring operations (see scoring_operations).")
+
+    if engine == 'memory':
+        conversation = Conversation(**configuration)
+    elif engine == 'ngram_store':
+        store = NGramStore()
+        neighbour = Conversation(ngram_store=store, **_configuration(scenario))
+        run_operations(neighbour, operations)
+        conversation = Conversation(ngram_store=store, **configuration)
+    elif engine == 'sqlite':
+        conversation = Conversation(history_store=SQLiteHistory(':memory:', cache_size=scenario['cache_size']),
+                                    **configuration)
+    elif engine == 'parallel':
+        conversation = Conversation(**configuration)
+        messages = [operation[3] for operation in operations]
+        windows = window_indices([operation[1] for operation in operations], scenario['window'], TIME_FORMAT)
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            conversation.prime_free_form_flags(free_form_flags(
+                messages, windows, 0, executor, 2, scenario['min_ngram'], scenario['max_ngram'],
+                scenario['exception_tokens']))
+    elif engine == 'load_history':
+        # Each message is scored by a conversation that ingested the messages before it, so that the scores of every
+        # turn check the state load_history builds. Windowed conversations rebuild the shared expressions of the
+        # window when they score a message, so the final state is that of the conversation that scored the last one.
+        results = []
+        conversation = Conversation(**configuration)
+        for count in range(len(operations)):
+            conversation = Conversation(**configuration)
+            conversation.load_history([(timestamp, speaker, message)
+                                       for _, timestamp, speaker, message, _ in operations[:count]])
+            results += run_operations(conversation, operations[count:count + 1])
+        return results, conversation_state(conversation)
+    else:
+        raise ValueError(f"Unknown engine: {engine}")
+
+    results = run_operations(conversation, operations)
+    state = conversation_state(conversation)
+    if engine == 'sqlite':
+        conversation.history.close()
+        if conversation.history.turns.rewrites:
+            raise AssertionError(f"The turn table was rewritten {conversation.history.turns.rewrites} times.")
+    return results, state
+
+
+def run_reference(scenario: dict) -> tuple[List[tuple], dict]:
+    """
+    Run a scenario on ReferenceConversation, like run_engine.
+    """
+    configuration = _configuration(scenario)
+    reference = ReferenceConversation(**configuration)
+    return run_operations(reference, scenario['operations']), conversation_state(reference)
+
+
+def _first_difference(expected, actual) -> str:
+    if isinstance(expected, dict):
+        for key in expected.keys() | actual.keys():
+            if expected.get(key) != actual.get(key):
+                return f"{key}: expected {expected.get(key)!r}, got {actual.get(key)!r}"
+    return f"expected {expected!r}, got {actual!r}"
+
+
+def check_scenario(scenario: dict, engines=ENGINES) -> List[str]:
+    """
+    Run a scenario on the reference and on engines and compare the per-operation scores, the expressions established,
+    repeated, and self-repeated by each operation, and the final states.
+
+    Args:
+        scenario (dict): see random_scenario
+        engines (Iterable[str], optional): the engines to check (see run_engine). Defaults to all of them.
+
+    Returns:
+        list: a description of the first difference of each engine that differs from the reference
+    """
+    references = {}
+    differences = []
+    for engine in engines:
+        engine_scenario = scoring_operations(scenario) if engine in REPLAY_ENGINES else scenario
+        key = engine in REPLAY_ENGINES
+        if key not in references:
+            references[key] = run_reference(engine_scenario)
+        expected_results, expected_state = references[key]
+        try:
+            results, state = run_engine(engine, engine_scenario)
+        except AssertionError as error:
+            differences.append(f"{engine}: {error}")
+            continue
+        if results != expected_results:
+            row = next(i for i, (a, b) in enumerate(zip(expected_results, results)) if a != b)
+            operation = engine_scenario['operations'][row]
+            differences.append(f"{engine}: operation {row} {operation}: "
+                               f"{_first_difference(expected_results[row], results[row])}")
+        elif state != expected_state:
+            differences.append(f"{engine}: final state: {_first_difference(expected_state, state)}")
+    return differences
+
+
+def check_seeds(seeds, engines=ENGINES, n_turns: int = 40) -> Dict[int, List[str]]:
+    """
+    Check the scenarios of seeds (see random_scenario and check_scenario).
+
+    Returns:
+        dict: the differences of each seed that has any
+    """
+    failures = {}
+    for seed in seeds:
+        differences = check_scenario(random_scenario(seed, n_turns), engines)
+        if differences:
+            failures[seed] = differences
+    return failures
+
+
+def main(argv: List[str] | None = None) -> int:
+    """
+    Check randomized scenarios against the reference, e.g., python -m dialign_python.differential --seeds 1000.
+
+    Returns:
+        int: the exit status, 1 if an engine differs from the reference
+    """
+    parser = argparse.ArgumentParser(prog='python -m dialign_python.differential',
+                                     description="Compare the engines of Conversation with the reference "
+                                                 "implementation on randomized dialogues.")
+    parser.add_argument('--seeds', type=int, default=200, help="number of scenarios")
+    parser.add_argument('--first-seed', type=int, default=0, help="seed of the first scenario")
+    parser.add_argument('--turns', type=int, default=40, help="number of operations per scenario")
+    parser.add_argument('--engines', nargs='+', choices=ENGINES, default=list(ENGINES), help="engines to check")
+    args = parser.parse_args(argv)
+
+    failures = check_seeds(range(args.first_seed, args.first_seed + args.seeds), args.engines, args.turns)
+    for seed, differences in failures.items():
+        for difference in differences:
+            print(f"seed {seed}: {difference}")
+    print(f"{args.seeds - len(failures)}/{args.seeds} scenarios match the reference")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
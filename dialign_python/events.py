@@ -0,0 +1,59 @@
+from typing import Callable, Dict, List
+
+
+class ConversationEvents:
+    """
+    What happens in a conversation, for subscribers. Callbacks are called synchronously with the keyword arguments of
+    the event:
+
+    - establishment: speaker, message, and expressions, the shared expressions the message established
+    - repetition: speaker, message, and expressions, the shared expressions the message repeated
+    - self_repetition: speaker, message, and expressions, the new self-repetitions of the speaker
+    - eviction: turns, the (timestamp, speaker, message) tuples that left the window
+    - score: speaker, message, der, dser, and dee, after a message is scored
+
+    The analysis events are emitted for messages scored and added to the history with score_message, not for messages
+    scored without being added or ingested with load_history. Nothing is computed for an event without subscribers,
+    so events cost a dictionary lookup by default.
+    """
+    EVENTS = ('establishment', 'repetition', 'self_repetition', 'eviction', 'score')
+
+    def __init__(self):
+        self._subscribers: Dict[str, List[Callable]] = {}
+
+    def subscribe(self, event: str, callback: Callable) -> Callable:
+        """
+        Call callback on every event of a type.
+
+        Args:
+            event (str): one of EVENTS
+            callback (function): called with the keyword arguments of the event
+
+        Returns:
+            function: callback
+        """
+        if event not in self.EVENTS:
+            raise ValueError(f"Unknown event {event}. Use one of {', '.join(self.EVENTS)}.")
+        self._subscribers.setdefault(event, []).append(callback)
+        return callback
+
+    def unsubscribe(self, event: str, callback: Callable):
+        """
+        Stop calling a callback subscribed with subscribe.
+        """
+        callbacks = self._subscribers.get(event, [])
+        if callback not in callbacks:
+            raise ValueError(f"{callback} is not subscribed to {event}")
+        callbacks.remove(callback)
+        if not callbacks:
+            del self._subscribers[event]
+
+    def __contains__(self, event: str) -> bool:
+        return event in self._subscribers
+
+    def __bool__(self) -> bool:
+        return bool(self._subscribers)
+
+    def emit(self, event: str, **data):
+        for callback in self._subscribers.get(event, ()):
+            callback(**data)
@@ -0,0 +1,189 @@
+from array import array
+from collections import Counter
+from collections.abc import Mapping
+from typing import Dict, Iterator, List
+
+from dialign_python.coverage import CoverageMatcher
+from dialign_python.metrics import LengthStats
+
+
+class SharedExpression(Mapping):
+    """
+    A shared expression: who initiated and established it, in which turn it was established, and the turns it was
+    used in. It can be read like the dictionaries returned by earlier versions ('initiator', 'establisher',
+    'establishmemt turn', and 'turns').
+    """
+    __slots__ = ('initiator', 'establisher', 'establishment_turn', '_turns', '_turn_bits')
+
+    _KEYS = ('initiator', 'establisher', 'establishmemt turn', 'turns')
+
+    def __init__(self, initiator: str, establisher: str, establishment_turn: int, turns=()):
+        self.initiator = initiator
+        self.establisher = establisher
+        self.establishment_turn = establishment_turn
+        # Turns in the order they were recorded, and a bitmap of the same turns for O(1) membership tests
+        self._turns = array('l')
+        self._turn_bits = bytearray()
+        for turn in turns:
+            self.add_turn(turn)
+
+    @property
+    def turns(self) -> List[int]:
+        return self._turns.tolist()
+
+    def has_turn(self, turn: int) -> bool:
+        byte = turn >> 3
+        return byte < len(self._turn_bits) and bool(self._turn_bits[byte] & (1 << (turn & 7)))
+
+    def add_turn(self, turn: int) -> bool:
+        """
+        Record a turn in which the expression was used.
+
+        Args:
+            turn (int): the index of the turn
+
+        Returns:
+            bool: True if the turn was not recorded yet
+        """
+        byte = turn >> 3
+        if byte >= len(self._turn_bits):
+            self._turn_bits.extend(bytes(byte + 1 - len(self._turn_bits)))
+        elif self._turn_bits[byte] & (1 << (turn & 7)):
+            return False
+        self._turn_bits[byte] |= 1 << (turn & 7)
+        self._turns.append(turn)
+        return True
+
+    def _pop_turn(self):
+        turn = self._turns.pop()
+        self._turn_bits[turn >> 3] &= ~(1 << (turn & 7))
+
+    def __getitem__(self, key: str):
+        if key == 'initiator':
+            return self.initiator
+        if key == 'establisher':
+            return self.establisher
+        if key == 'establishmemt turn':
+            return self.establishment_turn
+        if key == 'turns':
+            return self.turns
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._KEYS)
+
+    def __len__(self) -> int:
+        return len(self._KEYS)
+
+    def as_dict(self) -> Dict[str, object]:
+        return {'initiator': self.initiator, 'establisher': self.establisher,
+                'establishmemt turn': self.establishment_turn, 'turns': self.turns}
+
+    def __repr__(self) -> str:
+        return repr(self.as_dict())
+
+
+class PendingExpression:
+    """
+    An expression used by two or more speakers but not by all of them yet. Speakers are stored as a bitmask of the
+    speaker bits assigned by the conversation.
+    """
+    __slots__ = ('initiator', 'speakers', 'free_form')
+
+    def __init__(self, initiator: str, speakers: int, free_form: bool):
+        self.initiator = initiator
+        self.speakers = speakers
+        self.free_form = free_form
+
+
+class SharedExpressionLexicon(dict):
+    """
+    The shared expressions of a conversation. Keys are expressions and values are SharedExpression records. Besides
+    the dictionary interface, it keeps a CoverageMatcher of the expressions for DER, running statistics of the
+    expressions (their lengths and the number of expressions each speaker initiated and established), and can roll
+    back the changes made since begin().
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._matcher = CoverageMatcher()
+        self._journal = None
+        self.lengths = LengthStats()
+        self.initiated = Counter()
+        self.established = Counter()
+
+    def establish(self, n_gram: str, initiator: str, establisher: str, establishment_turn: int, turns=()):
+        """
+        Add a newly established shared expression.
+
+        Args:
+            n_gram (str): the expression
+            initiator (str): the speaker who first used the expression
+            establisher (str): the speaker who established the expression
+            establishment_turn (int): the turn in which the expression was established
+            turns (Iterable[int], optional): the turns in which the expression was used. Defaults to no turns.
+
+        Returns:
+            SharedExpression: the new record
+        """
+        record = SharedExpression(initiator, establisher, establishment_turn, turns)
+        super().__setitem__(n_gram, record)
+        self._matcher.add(n_gram)
+        self.lengths.add(n_gram)
+        self.initiated[initiator] += 1
+        self.established[establisher] += 1
+        if self._journal is not None:
+            self._journal.append((n_gram, None))
+        return record
+
+    def add_turn(self, n_gram: str, turn: int):
+        """
+        Record a turn in which a shared expression was used.
+
+        Args:
+            n_gram (str): the expression
+            turn (int): the index of the turn
+        """
+        record = self[n_gram]
+        if record.add_turn(turn) and self._journal is not None:
+            self._journal.append((n_gram, record))
+
+    def coverage(self, message: str) -> float:
+        """
+        Fraction of the tokens of a message that belong to an instance of a shared expression.
+
+        Args:
+            message (str): the whitespace tokenized utterance
+
+        Returns:
+            float: the fraction of covered tokens
+        """
+        return self._matcher.fraction(message)
+
+    def begin(self):
+        """
+        Start recording changes so that they can be undone with rollback().
+        """
+        self._journal = []
+
+    def rollback(self):
+        """
+        Undo the changes made since begin() and stop recording.
+        """
+        journal, self._journal = self._journal or [], None
+        for n_gram, record in reversed(journal):
+            if record is None:
+                removed = self[n_gram]
+                super().__delitem__(n_gram)
+                self._matcher.remove(n_gram)
+                self.lengths.remove(n_gram)
+                self.initiated[removed.initiator] -= 1
+                self.established[removed.establisher] -= 1
+            else:
+                record._pop_turn()
+
+    def as_dict(self) -> Dict[str, Dict[str, object]]:
+        """
+        The shared expressions as plain dictionaries.
+        """
+        return {n_gram: record.as_dict() for n_gram, record in self.items()}
@@ -0,0 +1,242 @@
+from array import array
+from collections.abc import Sequence
+from datetime import datetime
+import threading
+from typing import Dict, Iterable, List
+
+
+class Vocabulary:
+    _shared = None
+
+    def __init__(self, thread_safe: bool = False):
+        """
+        Interns tokens as integer ids so that messages can be stored as compact arrays of ids.
+
+        Args:
+            thread_safe (bool, optional): assign ids under a lock, for vocabularies shared between threads. Defaults to
+            False.
+        """
+        self.ids: Dict[str, int] = {}
+        self.tokens: List[str] = []
+        self._lock = threading.Lock() if thread_safe else None
+
+    @classmethod
+    def shared(cls) -> 'Vocabulary':
+        """
+        The process-wide vocabulary. Conversations created with it store each distinct token once however many
+        sessions use it, encode equal messages to equal bytes, and can share n-gram artifacts (see
+        Conversation.prime_n_gram_artifacts). It grows with the distinct tokens of all sessions and is thread-safe.
+        Pickled conversations get a private copy.
+        """
+        if cls._shared is None:
+            cls._shared = cls(thread_safe=True)
+        return cls._shared
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_lock'] = None
+        return state
+
+    def __len__(self) -> int:
+        return len(self.tokens)
+
+    def token_id(self, token: str) -> int:
+        token_id = self.ids.get(token)
+        if token_id is None:
+            if self._lock is not None:
+                with self._lock:
+                    return self._add_token(token)
+            return self._add_token(token)
+        return token_id
+
+    def _add_token(self, token: str) -> int:
+        token_id = self.ids.get(token)
+        if token_id is None:
+            token_id = len(self.tokens)
+            self.tokens.append(token)
+            self.ids[token] = token_id
+        return token_id
+
+    def encode(self, message: str) -> bytes:
+        """
+        Split a whitespace tokenized message and intern its tokens.
+
+        Args:
+            message (str): the utterance
+
+        Returns:
+            bytes: the token ids of the message packed as an array. The first byte is the width of the ids: two bytes
+            while the vocabulary has at most 65536 tokens and four bytes afterwards. Equal messages are encoded to equal
+            bytes, which are hashable and cache their hash.
+        """
+        ids = self.ids
+        encoded = []
+        for token in message.split():
+            token_id = ids.get(token)
+            if token_id is None:
+                token_id = self.token_id(token)
+            encoded.append(token_id)
+        if len(self.tokens) <= 0x10000:
+            return b'\x02' + array('H', encoded).tobytes()
+        return b'\x04' + array('I', encoded).tobytes()
+
+    @staticmethod
+    def token_ids(tokens: bytes) -> memoryview:
+        """
+        The token ids of an encoded message, without copying.
+        """
+        return memoryview(tokens)[1:].cast('H' if tokens[0] == 2 else 'I')
+
+    @staticmethod
+    def signature(tokens: bytes) -> int:
+        """
+        A 64-bit token presence signature of an encoded message: bit (id mod 64) is set for each token id. Messages
+        whose signatures do not intersect have no token in common.
+        """
+        signature = 0
+        for token_id in Vocabulary.token_ids(tokens):
+            signature |= 1 << (token_id & 63)
+        return signature
+
+    def decode(self, tokens: bytes) -> List[str]:
+        vocabulary = self.tokens
+        return [vocabulary[token_id] for token_id in self.token_ids(tokens)]
+
+
+class Turn:
+    """
+    A message in the conversation history. The message is stored as packed token ids of the vocabulary of the history
+    (see Vocabulary.encode) and the speaker as an id of its speaker table, so they are split and parsed only once.
+    signature is the token presence signature of the message (see Vocabulary.signature).
+    """
+    __slots__ = ('timestamp', 'time', 'speaker_id', 'tokens', 'signature')
+
+    def __init__(self, timestamp, time: datetime | None, speaker_id: int, tokens: bytes, signature: int | None = None):
+        self.timestamp = timestamp
+        self.time = time
+        self.speaker_id = speaker_id
+        self.tokens = tokens
+        self.signature = Vocabulary.signature(tokens) if signature is None else signature
+
+
+class History(Sequence):
+    # Whether every turn is kept in memory. Histories that keep only a working set (see working_set) are scanned
+    # from their store and get no speaker n-gram index.
+    resident = True
+
+    def __init__(self, turns: Iterable[tuple[str, str, str]] = (), time_format: str = "%Y-%m-%d %H:%M:%S",
+                 vocabulary: Vocabulary | None = None, parse_times: bool = True):
+        """
+        The conversation history. It reads like a list of (timestamp, speaker, message) tuples but stores Turn
+        records. Messages are whitespace normalized on ingestion.
+
+        Args:
+            turns (Iterable, optional): (timestamp, speaker, message) tuples. Defaults to an empty history.
+            time_format (str, optional): format of the timestamps. Defaults to "%Y-%m-%d %H:%M:%S".
+            vocabulary (Vocabulary, optional): the vocabulary the tokens are interned in. Defaults to a new vocabulary.
+            parse_times (bool, optional): parse the timestamps of new turns. Turns keep time None otherwise. Defaults
+            to True.
+        """
+        self.time_format = time_format
+        self.parse_times = parse_times
+        self.vocabulary = vocabulary if vocabulary is not None else Vocabulary()
+        self.speaker_ids: Dict[str, int] = {}
+        self.speakers: List[str] = []
+        self.turns: List[Turn] = []
+        # Parsed timestamps by string, bounded so that unique timestamps do not accumulate.
+        self._timestamp_cache = {}
+        self._timestamp_cache_max_size = 10000
+        for turn in turns:
+            self.append(turn)
+
+    def speaker_id(self, speaker: str) -> int:
+        speaker_id = self.speaker_ids.get(speaker)
+        if speaker_id is None:
+            speaker_id = len(self.speakers)
+            self.speaker_ids[speaker] = speaker_id
+            self.speakers.append(speaker)
+        return speaker_id
+
+    def parse_timestamp(self, timestamp) -> datetime | None:
+        """
+        Parse a timestamp with the time format of the history.
+
+        Args:
+            timestamp (str | datetime): the timestamp
+
+        Returns:
+            datetime: the parsed timestamp, or None if it cannot be parsed
+        """
+        if isinstance(timestamp, datetime):
+            return timestamp
+        if not isinstance(timestamp, str):
+            return None
+        cached = self._timestamp_cache.get(timestamp)
+        if cached is not None:
+            return cached
+        try:
+            parsed = datetime.strptime(timestamp, self.time_format)
+        except ValueError:
+            return None
+        if len(self._timestamp_cache) >= self._timestamp_cache_max_size:
+            del self._timestamp_cache[next(iter(self._timestamp_cache))]
+        self._timestamp_cache[timestamp] = parsed
+        return parsed
+
+    def make_turn(self, timestamp, speaker: str, message: str) -> Turn:
+        """
+        Create a turn that uses the vocabulary and the speaker table of this history without appending it.
+        """
+        return Turn(timestamp, self.parse_timestamp(timestamp) if self.parse_times else None,
+                    self.speaker_id(speaker), self.vocabulary.encode(message))
+
+    def append(self, turn: Turn | tuple[str, str, str]) -> Turn:
+        if not isinstance(turn, Turn):
+            turn = self.make_turn(*turn)
+        self.turns.append(turn)
+        return turn
+
+    def evict(self, count: int):
+        """
+        Remove the oldest turns.
+
+        Args:
+            count (int): the number of turns to remove
+        """
+        if count > 0:
+            del self.turns[:count]
+
+    def working_set(self) -> List[Turn]:
+        """
+        The turns held in memory. Caches derived from the turns are bounded by it.
+        """
+        return self.turns
+
+    def speaker(self, turn: Turn) -> str:
+        return self.speakers[turn.speaker_id]
+
+    def message(self, turn: Turn) -> str:
+        return ' '.join(self.vocabulary.decode(turn.tokens))
+
+    def as_tuple(self, turn: Turn) -> tuple[str, str, str]:
+        return turn.timestamp, self.speakers[turn.speaker_id], self.message(turn)
+
+    def __len__(self) -> int:
+        return len(self.turns)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.as_tuple(turn) for turn in self.turns[index]]
+        return self.as_tuple(self.turns[index])
+
+    def __iter__(self):
+        for turn in self.turns:
+            yield self.as_tuple(turn)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (History, list, tuple)):
+            return len(self) == len(other) and all(a == tuple(b) for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return repr(list(self))
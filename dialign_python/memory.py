@@ -0,0 +1,42 @@
+import sys
+from typing import Set
+
+
+def deep_sizeof(obj, seen: Set[int] | None = None) -> int:
+    """
+    Approximate number of bytes of an object and of everything it references: containers, __dict__ and __slots__
+    attributes. Objects in seen are not counted again, and the objects counted are added to it, so sharing a seen set
+    across calls counts shared objects once. Types, functions, and modules are not counted.
+
+    Args:
+        obj: the object
+        seen (set, optional): ids of the objects already counted. Defaults to an empty set.
+
+    Returns:
+        int: the number of bytes
+    """
+    if seen is None:
+        seen = set()
+    size = 0
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, (type, type(deep_sizeof), type(sys))):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, (str, bytes, bytearray, int, float, bool, memoryview)) or obj is None:
+            continue
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        if hasattr(obj, '__dict__'):
+            stack.append(obj.__dict__)
+        for cls in type(obj).__mro__:
+            slots = getattr(cls, '__slots__', ())
+            for slot in (slots,) if isinstance(slots, str) else slots:
+                if slot not in ('__dict__', '__weakref__') and hasattr(obj, slot):
+                    stack.append(getattr(obj, slot))
+    return size
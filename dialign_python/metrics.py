@@ -0,0 +1,43 @@
+import math
+from collections import Counter
+
+
+class LengthStats:
+    def __init__(self):
+        """
+        Running statistics of the lengths (in words) of the expressions of a lexicon. The lengths are kept as a
+        histogram, so the mean, the maximum, and the entropy of the lengths are computed in O(distinct lengths)
+        however large the lexicon is.
+        """
+        self.histogram = Counter()
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, expression: str):
+        length = expression.count(' ') + 1
+        self.histogram[length] += 1
+        self.count += 1
+        self.total += length
+        if length > self.max:
+            self.max = length
+
+    def remove(self, expression: str):
+        length = expression.count(' ') + 1
+        self.histogram[length] -= 1
+        if not self.histogram[length]:
+            del self.histogram[length]
+            if length == self.max:
+                self.max = max(self.histogram, default=0)
+        self.count -= 1
+        self.total -= length
+
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def entropy(self) -> float:
+        """
+        The entropy (in nats) of the distribution of the lengths, like scipy.stats.entropy.
+        """
+        count = self.count
+        return sum(n / count * math.log(count / n) for n in self.histogram.values()) if count else 0.0
@@ -0,0 +1,100 @@
+import threading
+from collections import Counter
+from typing import Callable, Dict, Iterable, List
+
+from dialign_python.history import Vocabulary
+
+
+class NGramStore:
+    _shared = None
+
+    def __init__(self, vocabulary: Vocabulary | None = None):
+        """
+        N-gram artifacts (the n-grams of a message, their set, and their Counter) shared by the conversations of a
+        process that use the same vocabulary, so that a message said in many sessions is factored and stored once.
+        Artifacts are reference counted by conversation and dropped when the last conversation that uses them prunes
+        them or is garbage collected, so memory grows with distinct content instead of with the number of sessions.
+
+        Args:
+            vocabulary (Vocabulary, optional): the vocabulary of the conversations. Defaults to a new thread-safe
+            vocabulary.
+        """
+        self.vocabulary = vocabulary if vocabulary is not None else Vocabulary(thread_safe=True)
+        # (n-gram lengths, encoded message) -> artifacts, and the number of conversations that hold them
+        self._artifacts: Dict[tuple, tuple[List[str], set[str], Counter]] = {}
+        self._users: Dict[tuple, int] = {}
+        self._lock = threading.Lock()
+        # Keys given back by finalizers, released by the next call that takes the lock (see release_later)
+        self._pending: List[Iterable[tuple]] = []
+
+    @classmethod
+    def shared(cls) -> 'NGramStore':
+        """
+        The process-wide store. It uses the process-wide vocabulary (see Vocabulary.shared).
+        """
+        if cls._shared is None:
+            cls._shared = cls(Vocabulary.shared())
+        return cls._shared
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._release_pending()
+            return len(self._artifacts)
+
+    def acquire(self, key: tuple, build: Callable[[], tuple[List[str], set[str], Counter]]
+                ) -> tuple[List[str], set[str], Counter]:
+        """
+        The artifacts of a message for a conversation that did not hold them yet.
+
+        Args:
+            key (tuple): the n-gram lengths and the encoded message
+            build (function): computes the artifacts if no conversation holds them. It is called without the lock, so
+            two threads can build the same artifacts; the first ones stored are kept.
+
+        Returns:
+            tuple: the n-grams, their set, and their Counter. They must not be modified.
+        """
+        artifacts = self._artifacts.get(key)
+        if artifacts is None:
+            artifacts = build()
+        with self._lock:
+            self._release_pending()
+            artifacts = self._artifacts.setdefault(key, artifacts)
+            self._users[key] = self._users.get(key, 0) + 1
+            return artifacts
+
+    def release(self, keys: Iterable[tuple]):
+        """
+        Give back artifacts acquired by a conversation.
+
+        Args:
+            keys (Iterable): the keys passed to acquire
+        """
+        with self._lock:
+            self._release_pending()
+            self._release(keys)
+
+    def release_later(self, keys: Iterable[tuple]):
+        """
+        Give back the artifacts of a conversation from its finalizer. The keys are released by the next call to the
+        store: a garbage collection can run a finalizer while the same thread holds the lock, so finalizers must not
+        take it.
+
+        Args:
+            keys (Iterable): the keys passed to acquire. The conversation must not modify them anymore.
+        """
+        self._pending.append(keys)
+
+    def _release_pending(self):
+        pending = self._pending
+        while pending:
+            self._release(pending.pop())
+
+    def _release(self, keys: Iterable[tuple]):
+        for key in keys:
+            users = self._users[key] - 1
+            if users:
+                self._users[key] = users
+            else:
+                del self._users[key]
+                del self._artifacts[key]
@@ -1,38 +1,86 @@
+from dialign_python.coverage import CoverageMatcher
+from dialign_python.metrics import LengthStats
+
+
 class Person:
     def __init__(self, name):
         """
         Initializes a person in the conversation
 
         Args:
-            name (_type_): _description_
+            name (str): the name of the speaker
         """
         self.name = name
-        self.repetitions = []  # Store personal repetitions
+        # Personal repetitions as an insertion-ordered set
+        self._repetitions = {}
+        # Kept in sync with the repetitions so DSER does not re-process an unchanged lexicon
+        self._matcher = CoverageMatcher()
+        # Lengths of the repetitions, for the SENTR, SL, and SLMAX measures
+        self.lengths = LengthStats()
+
+    @property
+    def repetitions(self):
+        """
+        A copy of the personal repetitions, longest first. Repetitions of the same length are in the order they were
+        added.
+        """
+        return sorted(self._repetitions, key=lambda x: len(x.split()), reverse=True)
 
     def add_repetition(self, n_gram):
         """
         Add a n_gram that is repeated within Person's conversation history (contributing to DSER score)
 
         Args:
-            n_gram (_type_): _description_
+            n_gram (str): the repeated expression
         """
-        self.repetitions.append(n_gram)
+        if n_gram not in self._repetitions:
+            self._repetitions[n_gram] = None
+            self._matcher.add(n_gram)
+            self.lengths.add(n_gram)
 
     def remove_repetition(self, n_gram):
         """
         removes an n_gram from the Person's expression library
 
         Args:
-            n_gram (_type_): _description_
+            n_gram (str): the expression to remove
+        """
+        if n_gram not in self._repetitions:
+            raise ValueError(f"{n_gram} is not a repetition of {self.name}")
+        del self._repetitions[n_gram]
+        self._matcher.remove(n_gram)
+        self.lengths.remove(n_gram)
+
+    def has_repetition(self, n_gram):
+        """
+        Check whether an n_gram is one of Person's repetitions
+
+        Args:
+            n_gram (str): the expression
+
+        Returns:
+            bool: True if the n_gram is a repetition
+        """
+        return n_gram in self._repetitions
+
+    def repetition_coverage(self, message):
+        """
+        Fraction of the tokens of a message that belong to one of Person's repetitions
+
+        Args:
+            message (str): the whitespace tokenized utterance
+
+        Returns:
+            float: the fraction of covered tokens
         """
-        self.repetitions.remove(n_gram)
+        return self._matcher.fraction(message)
 
     def show_repetitions(self):
         """
         Show all repetitions of Person
 
         Returns:
-            _type_: _description_
+            list: the repetitions, longest first
         """
         return self.repetitions
 
@@ -44,6 +92,6 @@ class Person:
         Get the name of the person
 
         Returns:
-            _type_: _description_
+            str: the name of the speaker
         """
         return self.name
@@ -0,0 +1,143 @@
+from datetime import timedelta
+from typing import Dict, List
+
+from dialign_python.conversation import Conversation
+from dialign_python.history import History, Vocabulary
+
+
+def tokenize_texts(texts: List[str], tokenizer=None) -> List[tuple[str, int]]:
+    """
+    Tokenize messages the way dialign does.
+
+    Args:
+        texts (list): the raw messages
+        tokenizer (function, optional): see dialign. Defaults to tokenize in utils.py.
+
+    Returns:
+        list: (message, number of tokens) tuples. message is the lowercased tokens joined by spaces.
+    """
+    if tokenizer is None:
+        from dialign_python.utils import tokenize
+        tokenizer = tokenize
+    tokenized = []
+    for text in texts:
+        tokens = tokenizer(text)
+        tokenized.append((' '.join(tokens).lower(), len(tokens)))
+    return tokenized
+
+
+def window_indices(timestamps: List, window: int | timedelta | None, time_format: str) -> List[range | List[int]] | None:
+    """
+    Replay the eviction of Conversation.add_message over a transcript scored from the start.
+
+    Args:
+        timestamps (list): the timestamps of the rows
+        window (int | timedelta | None): the window of the conversation
+        time_format (str): format of the timestamps
+
+    Returns:
+        list: for each row, the indices of the rows in the history when it is scored, or None if a timestamp cannot be
+        parsed for a time window
+    """
+    if window is None:
+        return [range(j) for j in range(len(timestamps))]
+    if isinstance(window, int):
+        return [range(max(0, j - window), j) for j in range(len(timestamps))]
+
+    parser = History(time_format=time_format)
+    times = [parser.parse_timestamp(timestamp) for timestamp in timestamps]
+    if any(time is None for time in times):
+        return None
+    windows = []
+    history = []
+    for j, time in enumerate(times):
+        windows.append(history)
+        history = [i for i in history if time - times[i] <= window] + [j]
+    return windows
+
+
+def free_form_flags(messages: List[str], windows: List[range | List[int]], first: int, executor, n_jobs: int,
+                    min_ngram: int = 1, max_ngram: int | None = None,
+                    exception_tokens: List[str] | None = None) -> Dict[str, Dict[str, frozenset]]:
+    """
+    Compute the n-gram matches between each message from first on and the messages of its window in parallel (see
+    Conversation.prime_free_form_flags).
+
+    Args:
+        messages (list): the tokenized messages of the transcript
+        windows (list): the window of each message (see window_indices)
+        first (int): the first message to compute the matches of
+        executor (Executor): the executor the work is distributed over
+        n_jobs (int): the number of workers of the executor
+        min_ngram, max_ngram, exception_tokens: the n-gram configuration of the conversation
+
+    Returns:
+        dict: for each message, the messages of its windows that share an n-gram with it, and the shared n-grams which
+        are not free
+    """
+    # Split the rows into chunks of about the same number of pairs, a few per worker to balance the load.
+    total = sum(len(windows[j]) for j in range(first, len(messages)))
+    chunk_pairs = max(1, total // (n_jobs * 4))
+    chunks = []
+    chunk = []
+    pairs = 0
+    for j in range(first, len(messages)):
+        chunk.append(j)
+        pairs += len(windows[j])
+        if pairs >= chunk_pairs:
+            chunks.append(chunk)
+            chunk = []
+            pairs = 0
+    if chunk:
+        chunks.append(chunk)
+
+    futures = []
+    for chunk in chunks:
+        # Only ship the messages the chunk needs
+        low = min([chunk[0]] + [windows[j][0] for j in chunk if len(windows[j])])
+        jobs = [(j - low, [i - low for i in windows[j]]) for j in chunk]
+        futures.append(executor.submit(_free_form_chunk, messages[low:chunk[-1] + 1], jobs, min_ngram, max_ngram,
+                                       exception_tokens))
+
+    flags = {}
+    for future in futures:
+        for message, past in future.result().items():
+            flags.setdefault(message, {}).update(past)
+    return flags
+
+
+def _free_form_chunk(messages: List[str], jobs: List[tuple[int, List[int]]], min_ngram: int, max_ngram: int | None,
+                     exception_tokens: List[str] | None) -> Dict[str, Dict[str, frozenset]]:
+    conversation = Conversation(exception_tokens=list(exception_tokens or []), min_ngram=min_ngram,
+                                max_ngram=max_ngram)
+    exceptions = conversation._exception_set
+    vocabulary = conversation.history.vocabulary
+    artifacts = []
+    signatures = []
+    for message in messages:
+        tokens = vocabulary.encode(message)
+        artifacts.append(conversation._get_n_gram_artifacts(tokens))
+        signatures.append(Vocabulary.signature(tokens))
+    flags = {}
+    for j, window in jobs:
+        past_flags = flags.setdefault(messages[j], {})
+        n_gram_set, current_set, current_counts = artifacts[j]
+        if exceptions:
+            current_set = current_set - exceptions
+        signature = signatures[j]
+        for i in window:
+            past = messages[i]
+            if past in past_flags or not signature & signatures[i]:
+                continue
+            past_n_grams, past_set, past_counts = artifacts[i]
+            shared = len(current_set & past_set)
+            if not shared:
+                continue
+            if shared == 1:
+                # A match is only not free if another match contains it.
+                past_flags[past] = frozenset()
+                continue
+            matches = conversation._compare_precomputed(n_gram_set, past_n_grams, current_counts, past_counts,
+                                                        current_set, past_set)
+            past_flags[past] = frozenset(n_gram for n_gram, free_form in matches.items() if not free_form)
+    return flags
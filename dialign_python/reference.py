@@ -0,0 +1,182 @@
+import copy
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+
+class ReferenceConversation:
+    def __init__(self, history: List[tuple[str, str, str]] | None = None, window: timedelta | int | None = None,
+                 persons: List[str] | None = None, exception_tokens: List[str] | None = None, min_ngram: int = 1,
+                 max_ngram: int | None = None, time_format: str = "%Y-%m-%d %H:%M:%S"):
+        """
+        A direct implementation of the scoring of Conversation without caches, indexes, or incremental structures. It
+        is slow and only meant as the oracle of the differential tests (see differential.py): every optimized engine
+        must produce the same scores and lexicons. Messages are compared as strings, the shared expressions are plain
+        dictionaries, and the repetitions of each speaker are plain lists.
+
+        Args:
+            history, window, persons, exception_tokens, min_ngram, max_ngram, time_format: see Conversation
+        """
+        self.history = list(history or [])
+        self.window = window
+        self.persons: Dict[str, List[str]] = {person: [] for person in persons or []}
+        self.exception_tokens = list(exception_tokens or [])
+        self.min_ngram = min_ngram
+        self.max_ngram = max_ngram
+        self.time_format = time_format
+        self.shared_expressions: Dict[str, dict] = {}
+
+    def add_message(self, speaker: str, message: str, timestamp: str | None = None):
+        if speaker not in self.persons:
+            self.persons[speaker] = []
+        if timestamp is None and isinstance(self.window, timedelta):
+            raise ValueError("Timestamp is required for time-based window.")
+        self.history.append((timestamp, speaker, message))
+        if isinstance(self.window, int):
+            if len(self.history) > self.window:
+                self.history.pop(0)
+        elif isinstance(self.window, timedelta):
+            now = datetime.strptime(timestamp, self.time_format)
+            self.history = [turn for turn in self.history
+                            if now - datetime.strptime(turn[0], self.time_format) <= self.window]
+
+    def score_message(self, speaker: str, message: str, timestamp: str | None = None,
+                      add_message_to_history: bool = True,
+                      focus_conversation: List[str] | None = None
+                      ) -> tuple[float, float, float, List[str], List[str], List[str]]:
+        """
+        See Conversation.score_message.
+        """
+        if speaker not in self.persons:
+            self.persons[speaker] = []
+        if focus_conversation is not None and any(person not in self.persons for person in focus_conversation):
+            return 0, 0, 0, [], [], []
+        saved_shared_expressions = copy.deepcopy(self.shared_expressions)
+
+        if focus_conversation is not None:
+            scores = self.sub_conversation(focus_conversation, speaker, message)
+        else:
+            self.analyze_conversation()
+            established, personal, repeated = self.analyze_message(speaker, message, self.history)
+            dee = self.fraction(message, established, count_once=True)
+            der = self.fraction(message, list(self.shared_expressions))
+            dser = self.fraction(message, self.persons[speaker])
+            scores = der, dser, dee, established, repeated, personal
+
+        if add_message_to_history:
+            self.add_message(speaker, message, timestamp)
+        else:
+            self.shared_expressions = saved_shared_expressions
+            for n_gram in scores[5]:
+                self.persons[speaker].remove(n_gram)
+        return scores
+
+    def sub_conversation(self, focus_conversation: List[str], new_speaker: str, new_message: str):
+        sub_history = [turn for turn in reversed(self.history) if turn[1] in focus_conversation]
+        if len(sub_history) == 1:
+            return 0, 0, 0, [], [], []
+        if new_speaker in focus_conversation:
+            speaker, message = new_speaker, new_message
+        else:
+            _, speaker, message = sub_history.pop()
+        sub_conversation = ReferenceConversation(sub_history, self.window, [], self.exception_tokens,
+                                                 self.min_ngram, self.max_ngram, self.time_format)
+        # The speakers share their repetitions with the conversation, like the Person objects of Conversation.
+        sub_conversation.persons = {person: self.persons[person] for person in focus_conversation
+                                    if person in self.persons}
+        if not sub_conversation.history:
+            return 0, 0, 0, [], [], []
+        sub_conversation.analyze_conversation()
+        established, personal, repeated = sub_conversation.analyze_message(speaker, message, sub_conversation.history)
+        dee = sub_conversation.fraction(message, established, count_once=True)
+        der = sub_conversation.fraction(message, list(sub_conversation.shared_expressions))
+        dser = sub_conversation.fraction(message, sub_conversation.persons[speaker])
+        return der, dser, dee, established, repeated, personal
+
+    def analyze_conversation(self):
+        if self.window is not None:
+            self.shared_expressions = {}
+            for count in range(1, len(self.history)):
+                _, speaker, message = self.history[count]
+                self.analyze_message(speaker, message, self.history[:count])
+
+    def n_grams(self, message: str) -> List[str]:
+        words = message.split()
+        maximum = len(words) if self.max_ngram is None else self.max_ngram
+        n_grams = [' '.join(words[i:i + n]) for i in range(len(words)) for n in range(self.min_ngram, maximum + 1)
+                   if i + n <= len(words)]
+        return [n_gram for n_gram in n_grams if n_gram not in self.exception_tokens]
+
+    def matches(self, message: str, past_message: str) -> Dict[str, bool]:
+        """
+        The n-grams of message that past_message has too, and whether each of them is a free form: no other match
+        contains it as many times in both messages. The matches are in the order of the intersection of the n-gram
+        sets, like Conversation, since the order decides which expressions are established first.
+        """
+        current, past = self.n_grams(message), self.n_grams(past_message)
+        shared = list(set(current) & set(past))
+        return {n_gram: not any(n_gram != other and n_gram in other and
+                                current.count(n_gram) == current.count(other) and
+                                past.count(n_gram) == past.count(other) for other in shared)
+                for n_gram in shared}
+
+    def analyze_message(self, current_speaker: str, message: str, window: List[tuple[str, str, str]]):
+        punctuations = {'.', ',', '!', '?'}
+        n_grams = self.n_grams(message)
+        repetitions = self.persons[current_speaker]
+        established = []
+        personal = []
+        repeated = set()
+        pending = {}
+        for i, (_, speaker, past_message) in enumerate(window):
+            # The expressions a turn adds are added in the order they occur in the message.
+            additions = []
+            for n_gram, free_form in self.matches(message, past_message).items():
+                if speaker == current_speaker:
+                    if free_form and n_gram not in punctuations and n_gram not in repetitions:
+                        additions.append((n_gram, None))
+                elif n_gram in self.shared_expressions:
+                    repeated.add(n_gram)
+                    for turn in (i, len(window)):
+                        if turn not in self.shared_expressions[n_gram]['turns']:
+                            self.shared_expressions[n_gram]['turns'].append(turn)
+                elif n_gram not in punctuations:
+                    if n_gram in pending:
+                        pending[n_gram]['speakers'].add(speaker)
+                        pending[n_gram]['free_form'] = pending[n_gram]['free_form'] or free_form
+                        if len(pending[n_gram]['speakers']) == len(self.persons) and pending[n_gram]['free_form']:
+                            additions.append((n_gram, pending.pop(n_gram)['initiator']))
+                    elif len(self.persons) == 2:
+                        # Two speakers establish an expression as soon as the other speaker used it as a free form.
+                        if free_form:
+                            additions.append((n_gram, speaker))
+                    else:
+                        pending[n_gram] = {'initiator': speaker, 'speakers': {speaker, current_speaker},
+                                           'free_form': free_form}
+            for n_gram, initiator in sorted(additions, key=lambda addition: n_grams.index(addition[0])):
+                if speaker == current_speaker:
+                    personal.append(n_gram)
+                    repetitions.append(n_gram)
+                else:
+                    established.append(n_gram)
+                    repeated.add(n_gram)
+                    self.shared_expressions[n_gram] = {'initiator': initiator, 'establisher': current_speaker,
+                                                       'establishmemt turn': len(window), 'turns': [i, len(window)]}
+        return established, personal, sorted(repeated, key=n_grams.index)
+
+    @staticmethod
+    def fraction(message: str, expressions: List[str], count_once: bool = False) -> float:
+        """
+        The fraction of the words of message covered by expressions, matched longest first.
+        """
+        words = message.split()
+        if not words:
+            return 0
+        covered = [False] * len(words)
+        for expression in sorted(expressions, key=lambda expression: len(expression.split()), reverse=True):
+            expression_words = expression.split()
+            for i in range(len(words) - len(expression_words) + 1):
+                if words[i:i + len(expression_words)] == expression_words and not covered[i]:
+                    covered[i:i + len(expression_words)] = [True] * len(expression_words)
+                    if count_once:
+                        break
+        return covered.count(True) / len(words)
@@ -0,0 +1,292 @@
+from array import array
+import argparse
+from collections import Counter
+from datetime import datetime, timedelta
+from hashlib import blake2b
+import math
+import random
+import sys
+from typing import Dict, Iterable, List
+
+from dialign_python.conversation import Conversation
+from dialign_python.expression import PendingExpression
+from dialign_python.memory import deep_sizeof
+from dialign_python.person import Person
+
+
+class CountMinSketch:
+    def __init__(self, width: int = 1 << 14, depth: int = 4):
+        """
+        Approximate counts of strings in fixed memory (width * depth counters). An estimate is never below the true
+        count. With total the sum of all the counts added, an estimate exceeds the true count by more than
+        e / width * total with probability at most exp(-depth). A string that was never added is estimated above zero
+        only if each of its depth counters was hit by another string.
+
+        Args:
+            width (int, optional): number of counters per row. Defaults to 16384.
+            depth (int, optional): number of rows. Defaults to 4.
+        """
+        self.width = width
+        self.depth = depth
+        self.total = 0
+        self._counts = array('I', bytes(4 * width * depth))
+
+    @classmethod
+    def from_error(cls, epsilon: float, delta: float) -> 'CountMinSketch':
+        """
+        The smallest sketch whose estimates exceed the true counts by more than epsilon * total with probability at
+        most delta.
+        """
+        return cls(math.ceil(math.e / epsilon), math.ceil(math.log(1 / delta)))
+
+    def _indices(self, key: str) -> List[int]:
+        digest = blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        width = self.width
+        return [row * width + (first + row * second) % width for row in range(self.depth)]
+
+    def add(self, key: str, count: int = 1):
+        counts = self._counts
+        for index in self._indices(key):
+            counts[index] += count
+        self.total += count
+
+    def estimate(self, key: str) -> int:
+        counts = self._counts
+        return min(counts[index] for index in self._indices(key))
+
+
+class SketchConversation(Conversation):
+    def __init__(self, persons: Dict[str, Person] | List[str] | None = None, exception_tokens: List[str] | None = None,
+                 min_ngram: int = 1, max_ngram: int | None = None, width: int = 1 << 16, depth: int = 6):
+        """
+        An approximate conversation for dialogues without a window that run too long to keep exactly. Messages are
+        not kept: the n-grams each speaker has used are counted in a CountMinSketch per speaker, and only the shared
+        expressions and the self-repetitions are kept exactly. Memory grows with the number of distinct shared
+        expressions and self-repetitions, not with the length of the dialogue.
+
+        The approximations, compared with Conversation:
+        - A speaker is considered to have used an n-gram if their sketch estimates it above zero. Sketches have no
+          false negatives, and a false positive needs every counter of the n-gram to be hit by other n-grams, which
+          happens with probability about p = (1 - exp(-n / width)) ** depth after the speaker used n distinct
+          n-grams. The estimate of an n-gram is bounded by those of its shorter n-grams, so a false positive for an
+          n-gram of k words needs false positives for its shorter n-grams too, and has a probability closer to p ** k.
+          A message of m words has about m * m / 2 n-grams without max_ngram, so width should exceed the number of
+          messages of a speaker times m * m / 2. Past that, false positives establish spurious expressions quickly.
+        - An n-gram is free unless a longer n-gram of the message contains it as many times in the message and as
+          many times (by estimate) in the past messages of the speaker, instead of in a single past message.
+        - The initiator of an expression is the other speaker who used it most often, not the first one.
+        - Shared expressions record the turn they were established in, not the turns they were used in.
+        - focus_conversation is not supported because it needs the history.
+
+        Args:
+            persons, exception_tokens, min_ngram, max_ngram: see Conversation
+            width (int, optional): width of the sketches (see CountMinSketch). Defaults to 65536.
+            depth (int, optional): depth of the sketches. Each sketch takes 4 * width * depth bytes. Defaults to 6.
+        """
+        super().__init__(persons=persons, exception_tokens=exception_tokens, min_ngram=min_ngram,
+                         max_ngram=max_ngram)
+        self.width = width
+        self.depth = depth
+        self.sketches: Dict[str, CountMinSketch] = {}
+
+    def _sketch(self, speaker: str) -> CountMinSketch:
+        sketch = self.sketches.get(speaker)
+        if sketch is None:
+            sketch = self.sketches[speaker] = CountMinSketch(self.width, self.depth)
+        return sketch
+
+    def _message_n_grams(self, message: str) -> Counter:
+        words = message.split()
+        maximum = len(words) if self.max_ngram is None else self.max_ngram
+        return Counter(' '.join(words[i:i + n]) for i in range(len(words))
+                       for n in range(self.min_ngram, maximum + 1) if i + n <= len(words))
+
+    def _estimates(self, sketch: CountMinSketch, counts: Counter) -> Dict[str, int]:
+        """
+        The estimates of the n-grams of a message in a sketch. An n-gram is used at most as often as the n-grams
+        without its first or last word, so its estimate is bounded by theirs. This makes a false positive for a long
+        n-gram need false positives for all its shorter n-grams.
+        """
+        estimates = {}
+        for n_gram in sorted(counts, key=lambda n_gram: n_gram.count(' ')):
+            if n_gram.count(' ') + 1 > self.min_ngram:
+                first, rest = n_gram.split(' ', 1)
+                bound = min(estimates[rest], estimates[n_gram.rsplit(' ', 1)[0]])
+                estimates[n_gram] = min(bound, sketch.estimate(n_gram)) if bound else 0
+            else:
+                estimates[n_gram] = sketch.estimate(n_gram)
+        return estimates
+
+    def _free_n_grams(self, n_grams: set[str], counts: Counter, estimates: Dict[str, int]) -> set[str]:
+        """
+        The n-grams among n_grams with a positive estimate that no longer one of them with a positive estimate
+        contains as many times in the message and in the sketch.
+        """
+        used = [n_gram for n_gram, estimate in estimates.items() if estimate > 0 and n_gram in n_grams]
+        # Containment is word-aligned: across many past messages, n-grams that only overlap by characters rarely
+        # come from the same message.
+        padded = {n_gram: f' {n_gram} ' for n_gram in used}
+        free = set()
+        for n_gram in used:
+            for another_n_gram in used:
+                if n_gram != another_n_gram and padded[n_gram] in padded[another_n_gram] and \
+                        counts[n_gram] == counts[another_n_gram] and estimates[n_gram] == estimates[another_n_gram]:
+                    break
+            else:
+                free.add(n_gram)
+        return free
+
+    def sub_conversation(self, focus_conversation, new_speaker, new_message):
+        raise ValueError("SketchConversation does not keep the history that focus_conversation needs.")
+
+    def analyze_message(self, current_speaker: str, message: str, sub_window=None
+                        ) -> tuple[List[str], List[str], List[str], Dict[str, PendingExpression]]:
+        """
+        Find the shared expressions the message establishes or repeats and the self-repetitions it adds (see
+        Conversation.analyze_message) from the sketches of the speakers.
+        """
+        punctuations = {'.', ',', '!', '?'}
+        counts = self._message_n_grams(message)
+        n_grams = [n_gram for n_gram in counts if n_gram not in self._exception_set and n_gram not in punctuations]
+        n_gram_set = set(n_grams)
+        person = self.persons[current_speaker]
+        shared_expressions = self.shared_expressions
+        turn = self.length
+
+        additions = []
+        individual_repetitions = []
+        expression_repetitions = []
+        # The estimates of the n-grams of the message in the sketch of each speaker and the n-grams free against them
+        estimates = {}
+        free = {}
+        for speaker in self.persons:
+            sketch = self.sketches.get(speaker)
+            speaker_estimates = self._estimates(sketch, counts) if sketch is not None else {}
+            estimates[speaker] = speaker_estimates
+            free[speaker] = self._free_n_grams(n_gram_set, counts, speaker_estimates)
+
+        others = [speaker for speaker in self.persons if speaker != current_speaker]
+        for n_gram in n_grams:
+            if n_gram in free[current_speaker] and not person.has_repetition(n_gram):
+                individual_repetitions.append(n_gram)
+                person.add_repetition(n_gram)
+            users = [speaker for speaker in others if estimates[speaker].get(n_gram, 0) > 0]
+            if not users:
+                continue
+            if n_gram in shared_expressions:
+                expression_repetitions.append(n_gram)
+            elif len(users) == len(others) and any(n_gram in free[speaker] for speaker in users):
+                initiator = max(users, key=lambda speaker: estimates[speaker][n_gram])
+                shared_expressions.establish(n_gram, initiator, current_speaker, turn, (turn,))
+                additions.append(n_gram)
+                expression_repetitions.append(n_gram)
+        return additions, individual_repetitions, expression_repetitions, {}
+
+    def add_message(self, speaker: str, message: str, timestamp: str | None = None):
+        """
+        Count the n-grams of a message in the sketch of its speaker. The message itself is not kept.
+        """
+        if speaker not in self.persons:
+            self.persons[speaker] = Person(speaker)
+        sketch = self._sketch(speaker)
+        for n_gram, count in self._message_n_grams(message).items():
+            sketch.add(n_gram, count)
+        self.length += 1
+
+    def memory_stats(self) -> Dict[str, int | Dict[str, int]]:
+        """
+        Approximate memory held by the conversation (see Conversation.memory_stats), with the sketches.
+        """
+        stats = super().memory_stats()
+        stats['sketches'] = deep_sizeof(self.sketches)
+        stats['total'] += stats['sketches']
+        return stats
+
+    def load_history(self, source: Iterable[tuple], speaker_col=None, message_col=None, timestamp_col=None):
+        """
+        Score and add every (timestamp, speaker, message) row of source (see Conversation.load_history).
+        """
+        for timestamp, speaker, message in self._iter_transcript_rows(source, speaker_col, message_col,
+                                                                      timestamp_col):
+            self.score_message(speaker, message, timestamp)
+
+
+def synthetic_session(seed: int, hours: float, seconds_per_turn: float = 10, speakers=('a', 'b')) -> Iterable[tuple]:
+    """
+    A synthetic dialogue of messages of 1 to 12 words drawn from a vocabulary of 300 words.
+
+    Args:
+        seed (int): the seed of the dialogue
+        hours (float): the duration of the dialogue
+        seconds_per_turn (float, optional): the time between two messages. Defaults to 10.
+        speakers (tuple, optional): the speakers, each message is said by one of them at random. Defaults to ('a', 'b').
+
+    Returns:
+        Iterable: (timestamp, speaker, message) tuples
+    """
+    rng = random.Random(seed)
+    vocabulary = [f"w{i}" for i in range(300)]
+    start = datetime(2025, 1, 1)
+    for turn in range(int(hours * 3600 / seconds_per_turn)):
+        timestamp = (start + timedelta(seconds=seconds_per_turn * turn)).strftime("%Y-%m-%d %H:%M:%S")
+        message = ' '.join(rng.choice(vocabulary) for _ in range(rng.randint(1, 12)))
+        yield timestamp, rng.choice(speakers), message
+
+
+def benchmark_sketch(hours: float, width: int = 1 << 16, depth: int = 6, seconds_per_turn: float = 10,
+                     speakers=('a', 'b'), seed: int = 0) -> Dict[str, float]:
+    """
+    Score a synthetic dialogue (see synthetic_session) with a SketchConversation and an exact Conversation and compare
+    the scores of each message.
+
+    Args:
+        hours (float): the duration of the dialogue
+        width (int, optional): width of the sketches. Defaults to 65536.
+        depth (int, optional): depth of the sketches. Defaults to 6.
+        seconds_per_turn, speakers, seed: see synthetic_session
+
+    Returns:
+        dict: the number of messages (turns) and the mean absolute differences of DER, DSER, and DEE
+    """
+    exact = Conversation(persons=list(speakers))
+    approximate = SketchConversation(persons=list(speakers), width=width, depth=depth)
+    errors = [0.0, 0.0, 0.0]
+    turns = 0
+    for timestamp, speaker, message in synthetic_session(seed, hours, seconds_per_turn, speakers):
+        expected = exact.score_message(speaker, message, timestamp)
+        scores = approximate.score_message(speaker, message, timestamp)
+        for i in range(3):
+            errors[i] += abs(expected[i] - scores[i])
+        turns += 1
+    der, dser, dee = (error / turns if turns else 0.0 for error in errors)
+    return {'turns': turns, 'DER': der, 'DSER': dser, 'DEE': dee}
+
+
+def main(argv: List[str] | None = None) -> int:
+    """
+    Print the mean absolute differences between a SketchConversation and the exact scores on a synthetic dialogue,
+    e.g., python -m dialign_python.sketch --hours 8 --width 16384 --depth 4.
+
+    Returns:
+        int: the exit status
+    """
+    parser = argparse.ArgumentParser(prog='python -m dialign_python.sketch',
+                                     description="Compare SketchConversation with the exact scores on a synthetic "
+                                                 "dialogue of two speakers.")
+    parser.add_argument('--hours', type=float, default=2, help="duration of the dialogue")
+    parser.add_argument('--width', type=int, default=1 << 16, help="width of the sketches")
+    parser.add_argument('--depth', type=int, default=6, help="depth of the sketches")
+    parser.add_argument('--seconds-per-turn', type=float, default=10, help="time between two messages")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the dialogue")
+    args = parser.parse_args(argv)
+
+    result = benchmark_sketch(args.hours, args.width, args.depth, args.seconds_per_turn, seed=args.seed)
+    print(f"{args.hours:g} hours, width {args.width}, depth {args.depth}, {result['turns']} turns: "
+          f"DER {result['DER']:.4f}, DSER {result['DSER']:.4f}, DEE {result['DEE']:.4f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,203 @@
+import os
+import pickle
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+
+from dialign_python.conversation import Conversation
+
+
+class ConversationSnapshot:
+    def __init__(self, version: int, state: bytes):
+        """
+        An immutable version of a conversation that any number of threads can score against. Each thread scores with
+        its own copy of the conversation, restored from the state on first use and reused for the next messages, so
+        readers never wait for each other or for the writer. Snapshots can be pickled to score in other processes.
+
+        Args:
+            version (int): the number of writes the snapshot includes
+            state (bytes): the pickled conversation
+        """
+        self.version = version
+        self.state = state
+        self._local = threading.local()
+
+    def __getstate__(self):
+        return {'version': self.version, 'state': self.state}
+
+    def __setstate__(self, state):
+        self.__init__(state['version'], state['state'])
+
+    def conversation(self) -> Conversation:
+        """
+        The copy of the conversation of the calling thread. Scoring it without adding messages keeps it at the
+        version of the snapshot.
+        """
+        conversation = getattr(self._local, 'conversation', None)
+        if conversation is None:
+            conversation = self._local.conversation = pickle.loads(self.state)
+        return conversation
+
+    def score_message(self, speaker: str, message: str, focus_conversation: List[str] | None = None
+                      ) -> tuple[float, float, float, List[str], List[str], List[str]]:
+        """
+        Score a message against the snapshot without adding it (see Conversation.score_message).
+
+        Returns:
+            tuple: the scores and expressions returned by Conversation.score_message
+        """
+        conversation = self.conversation()
+        new_speaker = speaker not in conversation.persons
+        try:
+            return conversation.score_message(speaker, message, add_message_to_history=False,
+                                              focus_conversation=focus_conversation)
+        finally:
+            if new_speaker:
+                # An unknown speaker must not count as a participant in the next scores.
+                conversation.persons.pop(speaker, None)
+
+
+class SharedConversation:
+    def __init__(self, conversation: Conversation | None = None):
+        """
+        A conversation shared between threads: a single writer appends messages while readers score candidate
+        messages against snapshots (see ConversationSnapshot). Writes are serialized by a lock. A snapshot is taken
+        at most once per version, by pickling the conversation, and each reader thread unpickles it once, so every
+        version costs time proportional to the state for the writer and for each reader.
+
+        This is a consistency mechanism, not a throughput one: readers never see a partial write, but scoring in
+        threads is limited by the GIL. To score many candidates per version on several cores, use a SnapshotPool.
+
+        Args:
+            conversation (Conversation, optional): the conversation to share. Defaults to a new conversation.
+        """
+        self._conversation = conversation if conversation is not None else Conversation()
+        self._lock = threading.Lock()
+        self.version = 0
+        self._snapshot = None
+
+    def add_message(self, speaker: str, message: str, timestamp: str | None = None):
+        """
+        Add a message to the history (see Conversation.add_message).
+        """
+        with self._lock:
+            self._conversation.add_message(speaker, message, timestamp)
+            self._advance()
+
+    def score_message(self, speaker: str, message: str, timestamp: str | None = None,
+                      focus_conversation: List[str] | None = None
+                      ) -> tuple[float, float, float, List[str], List[str], List[str]]:
+        """
+        Score a message and add it to the history (see Conversation.score_message).
+
+        Returns:
+            tuple: the scores and expressions returned by Conversation.score_message
+        """
+        with self._lock:
+            try:
+                return self._conversation.score_message(speaker, message, timestamp, add_message_to_history=True,
+                                                        focus_conversation=focus_conversation)
+            finally:
+                self._advance()
+
+    def _advance(self):
+        self.version += 1
+        self._snapshot = None
+
+    def snapshot(self) -> ConversationSnapshot:
+        """
+        The snapshot of the current version.
+        """
+        with self._lock:
+            if self._snapshot is None:
+                self._snapshot = ConversationSnapshot(self.version, pickle.dumps(self._conversation))
+            return self._snapshot
+
+
+# The snapshot a worker process of a SnapshotPool scores against, by the path of its state and its version. Both are
+# compared because the path of a removed state can be reused for the state of another version.
+_worker_snapshot: tuple[tuple[str, int], ConversationSnapshot] | None = None
+
+
+def _score_candidates(path: str, version: int, candidates: List[tuple[str, str]],
+                      focus_conversation: List[str] | None) -> List[tuple]:
+    global _worker_snapshot
+    if _worker_snapshot is None or _worker_snapshot[0] != (path, version):
+        with open(path, 'rb') as file:
+            _worker_snapshot = (path, version), ConversationSnapshot(version, file.read())
+    snapshot = _worker_snapshot[1]
+    return [snapshot.score_message(speaker, message, focus_conversation) for speaker, message in candidates]
+
+
+class SnapshotPool:
+    def __init__(self, n_jobs: int):
+        """
+        Worker processes that score candidate messages against snapshots (see ConversationSnapshot). The state of a
+        snapshot is written once per version to a temporary file, and each worker restores it once and reuses it
+        until the next version, so a version costs one pickle for the writer and one unpickle per worker, however
+        many candidates are scored. Batches of candidates are split evenly over the workers.
+
+        Args:
+            n_jobs (int): the number of worker processes
+        """
+        if n_jobs < 1:
+            raise ValueError("n_jobs must be a positive integer.")
+        self.n_jobs = n_jobs
+        self._executor = ProcessPoolExecutor(max_workers=n_jobs)
+        self._snapshot = None
+        self._path = None
+
+    def score_messages(self, snapshot: ConversationSnapshot, candidates: List[tuple[str, str]],
+                       focus_conversation: List[str] | None = None) -> List[tuple]:
+        """
+        Score candidate messages against a snapshot without adding them (see ConversationSnapshot.score_message).
+
+        Args:
+            snapshot (ConversationSnapshot): the snapshot, e.g., SharedConversation.snapshot()
+            candidates (list): (speaker, message) tuples
+            focus_conversation (list, optional): see Conversation.score_message. Defaults to None.
+
+        Returns:
+            list: the scores of each candidate, in order
+        """
+        if self._executor is None:
+            raise ValueError("Cannot score with a closed SnapshotPool.")
+        if snapshot is not self._snapshot:
+            self._publish(snapshot)
+        candidates = list(candidates)
+        chunk_size = max(1, -(-len(candidates) // self.n_jobs))
+        futures = [self._executor.submit(_score_candidates, self._path, snapshot.version,
+                                         candidates[i:i + chunk_size], focus_conversation)
+                   for i in range(0, len(candidates), chunk_size)]
+        return [scores for future in futures for scores in future.result()]
+
+    def _publish(self, snapshot: ConversationSnapshot):
+        # The new state is written before the previous one is removed, so that it does not reuse its path.
+        descriptor, path = tempfile.mkstemp(prefix='dialign-snapshot-', suffix='.pkl')
+        with os.fdopen(descriptor, 'wb') as file:
+            file.write(snapshot.state)
+        self._remove_state()
+        self._path = path
+        self._snapshot = snapshot
+
+    def _remove_state(self):
+        if self._path is not None:
+            os.remove(self._path)
+            self._path = None
+            self._snapshot = None
+
+    def close(self):
+        """
+        Stop the worker processes and remove the state of the last snapshot.
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        self._remove_state()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,310 @@
+from collections import OrderedDict
+from collections.abc import Sequence
+from datetime import datetime
+import pickle
+import sqlite3
+from typing import Iterable, List
+
+from dialign_python.history import History, Turn, Vocabulary
+from dialign_python.person import Person
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tokens (id INTEGER PRIMARY KEY, token TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS speakers (id INTEGER PRIMARY KEY, speaker TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS turns (turn INTEGER PRIMARY KEY, timestamp TEXT, time TEXT, speaker INTEGER NOT NULL,
+                                  tokens BLOB NOT NULL, signature INTEGER NOT NULL);
+CREATE INDEX IF NOT EXISTS turns_by_speaker ON turns (speaker, turn);
+CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value BLOB);
+"""
+
+
+class TurnTable(Sequence):
+    def __init__(self, connection: sqlite3.Connection, cache_size: int, page_size: int = 256):
+        """
+        The turns of a SQLiteHistory. It reads like the list of turns of a History: turns are loaded by pages of
+        consecutive turns and the most recently used ones are kept in memory.
+
+        Args:
+            connection (sqlite3.Connection): the database
+            cache_size (int): the number of turns kept in memory
+            page_size (int, optional): the number of turns loaded at once. Defaults to 256.
+        """
+        self._connection = connection
+        self.cache_size = cache_size
+        self.page_size = min(page_size, cache_size)
+        # Turn numbers are kept across evictions: turn i of the table is turn self._first + i of the database.
+        first, end = connection.execute("SELECT MIN(turn), MAX(turn) + 1 FROM turns").fetchone()
+        self._first = first if first is not None else 0
+        self._end = end if end is not None else 0
+        self._cache: OrderedDict[int, Turn] = OrderedDict()
+        # The number of times all the turns were replaced (see __setitem__)
+        self.rewrites = 0
+
+    def __len__(self) -> int:
+        return self._end - self._first
+
+    def _load(self, number: int):
+        page = number - (number - self._first) % self.page_size
+        rows = self._connection.execute(
+            "SELECT turn, timestamp, time, speaker, tokens, signature FROM turns WHERE turn >= ? AND turn < ?",
+            (page, min(page + self.page_size, self._end)))
+        cache = self._cache
+        for turn_number, timestamp, time, speaker, tokens, signature in rows:
+            if turn_number not in cache:
+                cache[turn_number] = self._make_turn(timestamp, time, speaker, tokens, signature)
+        while len(cache) > self.cache_size:
+            cache.popitem(last=False)
+
+    def _turn(self, number: int) -> Turn:
+        cache = self._cache
+        turn = cache.get(number)
+        if turn is None:
+            self._load(number)
+            turn = cache[number]
+        else:
+            cache.move_to_end(number)
+        return turn
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._turn(self._first + i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("turn index out of range")
+        return self._turn(self._first + index)
+
+    def __iter__(self):
+        # Scans read the turns in one query and do not replace the turns in memory.
+        cache = self._cache
+        rows = self._connection.execute(
+            "SELECT turn, timestamp, time, speaker, tokens, signature FROM turns WHERE turn >= ? AND turn < ? "
+            "ORDER BY turn", (self._first, self._end))
+        for turn_number, timestamp, time, speaker, tokens, signature in rows:
+            turn = cache.get(turn_number)
+            yield turn if turn is not None else self._make_turn(timestamp, time, speaker, tokens, signature)
+
+    @staticmethod
+    def _make_turn(timestamp, time, speaker, tokens, signature) -> Turn:
+        return Turn(timestamp, datetime.fromisoformat(time) if time is not None else None, speaker, tokens,
+                    signature & 0xFFFFFFFFFFFFFFFF)
+
+    def append(self, turn: Turn):
+        signature = turn.signature
+        self._connection.execute(
+            "INSERT INTO turns (turn, timestamp, time, speaker, tokens, signature) VALUES (?, ?, ?, ?, ?, ?)",
+            (self._end, turn.timestamp if turn.timestamp is None else str(turn.timestamp),
+             turn.time.isoformat() if turn.time is not None else None, turn.speaker_id, turn.tokens,
+             signature - (1 << 64) if signature >= 1 << 63 else signature))
+        self._cache[self._end] = turn
+        self._end += 1
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def extend(self, turns: Iterable[Turn]):
+        for turn in turns:
+            self.append(turn)
+
+    def __delitem__(self, index):
+        # Only the oldest turns are removed (see History.evict)
+        if not isinstance(index, slice) or index.start not in (None, 0) or index.step not in (None, 1):
+            raise ValueError("Only the oldest turns can be removed from a TurnTable.")
+        first = self._first + len(range(*index.indices(len(self))))
+        self._connection.execute("DELETE FROM turns WHERE turn < ?", (first,))
+        for number in range(self._first, first):
+            self._cache.pop(number, None)
+        self._first = first
+
+    def __setitem__(self, index, turns: List[Turn]):
+        # Only the whole table is replaced, e.g., by the turns left in a time window when the timestamps are out of
+        # order. Turns read by a scan are new objects unless they are in memory, so replacing the table with its
+        # newest turns is only detected for the turns in memory: Conversation evicts the oldest turns instead.
+        if not isinstance(index, slice) or index != slice(None):
+            raise ValueError("Only all the turns of a TurnTable can be replaced.")
+        turns = list(turns)
+        count = len(self) - len(turns)
+        if count >= 0 and all(turn is kept for turn, kept in zip(self[count:], turns)):
+            # The turns left are the newest ones
+            del self[:count]
+            return
+        self.rewrites += 1
+        self._connection.execute("DELETE FROM turns")
+        self._cache.clear()
+        self._first = self._end
+        self.extend(turns)
+
+    def cached(self) -> List[Turn]:
+        """
+        The turns kept in memory.
+        """
+        return list(self._cache.values())
+
+
+class SQLiteHistory(History):
+    resident = False
+
+    def __init__(self, path: str, time_format: str = "%Y-%m-%d %H:%M:%S", parse_times: bool = True,
+                 cache_size: int = 4096, commit_every: int = 1):
+        """
+        A conversation history stored in a SQLite database, for sessions that do not fit in memory or that must be
+        reopened. The turns are stored with their speaker and their token ids, indexed by turn and by speaker, and only
+        the vocabulary, the speakers, and the last cache_size turns used are kept in memory. Pass it to Conversation as
+        history_store. The n-gram caches of the conversation are then bounded by the turns in memory instead of the
+        whole history, so memory stays bounded, but each message is compared with past turns read from the database.
+
+        Opening an existing database restores its history without reading the turns (see open_conversation to restore
+        the conversation too).
+
+        Args:
+            path (str): the database file, or ":memory:"
+            time_format (str, optional): format of the timestamps. Defaults to "%Y-%m-%d %H:%M:%S".
+            parse_times (bool, optional): see History. Defaults to True.
+            cache_size (int, optional): the number of turns kept in memory. Defaults to 4096.
+            commit_every (int, optional): the number of appended turns that triggers a commit. Call commit to commit
+            earlier. Defaults to 1 (every turn is committed).
+        """
+        self.path = path
+        self.commit_every = commit_every
+        self._uncommitted = 0
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(_SCHEMA)
+        super().__init__(time_format=time_format, vocabulary=Vocabulary(), parse_times=parse_times)
+        for (token,) in self._connection.execute("SELECT token FROM tokens ORDER BY id"):
+            self.vocabulary._add_token(token)
+        for (speaker,) in self._connection.execute("SELECT speaker FROM speakers ORDER BY id"):
+            self.speaker_id(speaker)
+        self._saved_tokens = len(self.vocabulary)
+        self._saved_speakers = len(self.speakers)
+        self._table = TurnTable(self._connection, cache_size)
+
+    @property
+    def turns(self) -> TurnTable:
+        return self._table
+
+    @turns.setter
+    def turns(self, turns: List[Turn]):
+        # History.__init__ sets an empty list before the table exists.
+        if hasattr(self, '_table'):
+            self._table[:] = turns
+
+    def append(self, turn: Turn | tuple[str, str, str]) -> Turn:
+        turn = super().append(turn)
+        self._save_names()
+        self._uncommitted += 1
+        if self._uncommitted >= self.commit_every:
+            self.commit()
+        return turn
+
+    def _save_names(self):
+        tokens = self.vocabulary.tokens
+        if len(tokens) > self._saved_tokens:
+            self._connection.executemany("INSERT INTO tokens (id, token) VALUES (?, ?)",
+                                         enumerate(tokens[self._saved_tokens:], start=self._saved_tokens))
+            self._saved_tokens = len(tokens)
+        if len(self.speakers) > self._saved_speakers:
+            self._connection.executemany("INSERT INTO speakers (id, speaker) VALUES (?, ?)",
+                                         enumerate(self.speakers[self._saved_speakers:], start=self._saved_speakers))
+            self._saved_speakers = len(self.speakers)
+
+    def evict(self, count: int):
+        super().evict(count)
+        self.commit()
+
+    def working_set(self) -> List[Turn]:
+        return self._table.cached()
+
+    def speaker_turns(self, speaker: str) -> List[int]:
+        """
+        The indexes of the turns of a speaker in the history, from the speaker index of the database.
+        """
+        speaker_id = self.speaker_ids.get(speaker)
+        if speaker_id is None:
+            return []
+        first = self._table._first
+        return [turn - first for (turn,) in self._connection.execute(
+            "SELECT turn FROM turns WHERE speaker = ? ORDER BY turn", (speaker_id,))]
+
+    def commit(self):
+        """
+        Commit the turns appended since the last commit.
+        """
+        self._save_names()
+        self._connection.commit()
+        self._uncommitted = 0
+
+    def save_state(self, conversation):
+        """
+        Save the state of a conversation that uses this history (its configuration, speakers, self-repetitions, and
+        shared expressions) so that open_conversation can restore it without replaying the history.
+        """
+        state = {'turns': len(self), 'window': conversation.window, 'persons': conversation.persons,
+                 'exception_tokens': conversation.exception_tokens, 'min_ngram': conversation.min_ngram,
+                 'max_ngram': conversation.max_ngram, 'shared_expressions': conversation.shared_expressions}
+        self._connection.execute("INSERT OR REPLACE INTO state (key, value) VALUES ('conversation', ?)",
+                                 (pickle.dumps(state),))
+        self.commit()
+
+    def load_state(self) -> dict | None:
+        """
+        The state saved by save_state, or None.
+        """
+        row = self._connection.execute("SELECT value FROM state WHERE key = 'conversation'").fetchone()
+        return pickle.loads(row[0]) if row is not None else None
+
+    def close(self):
+        self.commit()
+        self._connection.close()
+
+    def to_memory(self) -> History:
+        """
+        A History that holds all the turns in memory.
+        """
+        history = History(time_format=self.time_format, vocabulary=self.vocabulary, parse_times=self.parse_times)
+        for speaker in self.speakers:
+            history.speaker_id(speaker)
+        history.turns = list(self._table)
+        return history
+
+    def __reduce_ex__(self, protocol):
+        # Connections cannot be pickled, so copies (e.g., snapshots) hold their turns in memory.
+        return self.to_memory().__reduce_ex__(protocol)
+
+
+def open_conversation(path: str, cache_size: int = 4096, **options):
+    """
+    Open a conversation stored in a SQLite database (see SQLiteHistory). If a state was saved with
+    SQLiteHistory.save_state after the last turn, the configuration, the speakers, the self-repetitions, and the
+    shared expressions are restored from it without reading the turns. Otherwise, they are rebuilt by analyzing every
+    turn of the history.
+
+    Args:
+        path (str): the database file
+        cache_size (int, optional): the number of turns kept in memory. Defaults to 4096.
+        options: keyword arguments of Conversation for a new database or a database without a saved state
+
+    Returns:
+        Conversation: the conversation
+    """
+    from dialign_python.conversation import Conversation
+
+    history = SQLiteHistory(path, time_format=options.pop('time_format', "%Y-%m-%d %H:%M:%S"), cache_size=cache_size)
+    state = history.load_state()
+    if state is not None and state['turns'] == len(history):
+        conversation = Conversation(window=state['window'], persons=state['persons'],
+                                    exception_tokens=state['exception_tokens'], min_ngram=state['min_ngram'],
+                                    max_ngram=state['max_ngram'], time_format=history.time_format,
+                                    history_store=history)
+        conversation.shared_expressions = state['shared_expressions']
+        return conversation
+
+    conversation = Conversation(time_format=history.time_format, history_store=history, **options)
+    for speaker in history.speakers:
+        if speaker not in conversation.persons:
+            conversation.persons[speaker] = Person(speaker)
+    turns = history.turns
+    for count in range(1, len(turns)):
+        turn = turns[count]
+        conversation._analyze_turns(history.speaker(turn), turn.tokens, turns, count, indexed=True)
+    return conversation
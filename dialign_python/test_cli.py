@@ -0,0 +1,36 @@
+import json
+import shutil
+from dialign_python.cli import main
+from dialign_python.dialign_python_offline import dialign
+
+input_file = "./dialign_python/sample_offline_input.csv"
+valid_speakers = ["Emma", "Student A", "Student B"]
+
+
+def test_cli_writes_jsonl_per_dialogue(tmp_path):
+    (tmp_path / "inputs" / "day2").mkdir(parents=True)
+    shutil.copy(input_file, tmp_path / "inputs" / "day1.csv")
+    shutil.copy(input_file, tmp_path / "inputs" / "day2" / "session.csv")
+    output = tmp_path / "scores.jsonl"
+
+    status = main([str(tmp_path / "inputs"), "-o", str(output), "--jobs", "2", "--tokenizer", "whitespace",
+                   "--timestamp-col", "Timestamp", "--time-format", "%H:%M:%S.%f", "--valid-speakers", *valid_speakers,
+                   "--filter", "Receiver=" + ",".join(valid_speakers), "--window", "5", "--include",
+                   "shared_expressions", "-q"])
+    assert status == 0
+
+    records = [json.loads(line) for line in output.read_text().splitlines()]
+    assert sorted(record['file'] for record in records) == [str(tmp_path / "inputs" / "day1.csv"),
+                                                            str(tmp_path / "inputs" / "day2" / "session.csv")]
+    speaker_independent, speaker_dependent, shared_expressions, self_repetitions, _ = dialign(
+        input_file, "Speaker", "Utterance", "Timestamp", valid_speakers, filters={'Receiver': valid_speakers},
+        window=5, time_format="%H:%M:%S.%f", tokenizer=str.split)
+    for record in records:
+        assert record['speaker_independent'] == speaker_independent
+        assert record['speaker_dependent'] == speaker_dependent
+        assert record['self_repetitions'] == self_repetitions
+        assert record['shared_expressions'] == shared_expressions
+
+
+def test_cli_reports_failures(tmp_path):
+    assert main([str(tmp_path / "missing.csv"), "-o", str(tmp_path / "scores.jsonl"), "-q"]) == 1
@@ -0,0 +1,433 @@
+import copy
+from datetime import datetime, timedelta
+import random
+import time
+from dialign_python.conversation import Conversation
+from dialign_python.coverage import CoverageMatcher
+from dialign_python.history import History
+from dialign_python.person import Person
+from dialign_python.sketch import synthetic_session
+
+
+def _random_dialogue(seed, n_turns=30, speakers=('a', 'b', 'c')):
+    rng = random.Random(seed)
+    vocabulary = "so we have two over three . i think you ' re right ,".split()
+    start = datetime(2025, 1, 1)
+    rows = []
+    for turn in range(n_turns):
+        timestamp = (start + timedelta(seconds=7 * turn)).strftime("%Y-%m-%d %H:%M:%S")
+        message = ' '.join(rng.choice(vocabulary) for _ in range(rng.randint(1, 10)))
+        rows.append((timestamp, rng.choice(speakers), message))
+    return rows
+
+
+def _state(conversation):
+    return (conversation.history, conversation.shared_expressions,
+            {speaker: sorted(person.repetitions) for speaker, person in conversation.persons.items()})
+
+
+def test_load_history_matches_sequential_scoring():
+    for window in [None, 5, timedelta(seconds=40)]:
+        for seed in range(5):
+            rows = _random_dialogue(seed)
+            sequential = Conversation(persons=['a', 'b', 'c'], window=window)
+            for timestamp, speaker, message in rows:
+                sequential.score_message(speaker, message, timestamp)
+            sequential.analyze_conversation()
+
+            bulk = Conversation(persons=['a', 'b', 'c'], window=window)
+            bulk.load_history(rows)
+            assert _state(bulk) == _state(sequential)
+
+
+def test_load_history_from_saved_transcript(tmp_path):
+    rows = _random_dialogue(0, n_turns=10)
+    conversation = Conversation()
+    assert conversation.output_file == "conversation_output.txt"
+    conversation.output_file = str(tmp_path / "conversation.tsv")
+    for i, row in enumerate(rows):
+        conversation.save_conversation_message_to_file(*row)
+        # The base class writes every message through
+        assert len((tmp_path / "conversation.tsv").read_text().splitlines()) == i + 1
+    conversation.flush()
+
+    restored = Conversation()
+    restored.load_conversation_from_file(conversation.output_file)
+    assert restored.history == rows
+    assert restored.length == 10
+
+
+def test_overlapping_expressions_tie_in_message_order():
+    # Expressions added by the same turn cover the message in the order they occur in it, whatever the hash seed:
+    # the first bigram covers the first two words, and the overlapping second one cannot cover the third.
+    for words in ['a b c', 'so we have', 'c b a', 'two over three']:
+        first, second = [' '.join(words.split()[i:i + 2]) for i in range(2)]
+        conversation = Conversation(persons=['x', 'y'], max_ngram=2)
+        conversation.score_message('x', words)
+        der, _, dee, established, repeated, _ = conversation.score_message('y', words)
+        assert (der, dee, established, repeated) == (2 / 3, 2 / 3, [first, second], [first, second])
+        _, dser, _, _, _, personal = conversation.score_message('x', words)
+        assert (dser, personal) == (2 / 3, [first, second])
+
+
+def test_person_repetitions_and_coverage():
+    person = Person('a')
+    for n_gram in ['we', 'two over three', 'over', 'so we']:
+        person.add_repetition(n_gram)
+    person.add_repetition('we')
+    person.remove_repetition('over')
+    assert person.repetitions == ['two over three', 'so we', 'we']
+    assert person.has_repetition('so we') and not person.has_repetition('over')
+    message = 'so we have two over three and we know'
+    assert person.repetition_coverage(message) == CoverageMatcher(person.repetitions).fraction(message) == 6 / 9
+    assert CoverageMatcher(['we']).fraction(message, count_once=True) == 1 / 9
+
+
+def test_shared_expression_records_and_rollback():
+    conversation = Conversation(persons=['a', 'b'])
+    conversation.load_history([(None, 'a', 'so we have two'), (None, 'b', 'we have three')])
+    record = conversation.shared_expressions['we have']
+    assert record == {'initiator': 'a', 'establisher': 'b', 'establishmemt turn': 1, 'turns': [0, 1]}
+    before = conversation.shared_expressions.as_dict()
+
+    result = conversation.score_message('a', 'so we have three', add_message_to_history=False)
+    assert result[3] == ['we have three']
+    assert conversation.shared_expressions.as_dict() == before
+    assert conversation.persons['a'].repetitions == []
+
+
+def test_history_turns_read_like_tuples():
+    history = History([('t0', 'a', 'so  we have'), ('t1', 'b', 'we have')], parse_times=False)
+    assert history[0] == ('t0', 'a', 'so we have')
+    assert history[-1:] == [('t1', 'b', 'we have')]
+    assert history == [('t0', 'a', 'so we have'), ('t1', 'b', 'we have')]
+    turn = history.turns[1]
+    assert (turn.speaker_id, history.vocabulary.decode(turn.tokens)) == (1, ['we', 'have'])
+    assert turn.tokens == history.turns[0].tokens[:1] + history.turns[0].tokens[3:]
+
+
+def test_toggling_exception_tokens_keeps_caches():
+    rows = _random_dialogue(1)
+    probes = _random_dialogue(2, n_turns=10)
+    toggled = Conversation(persons=['a', 'b', 'c'])
+    fixed = Conversation(persons=['a', 'b', 'c'], exception_tokens=['so', 'two over'])
+    for timestamp, speaker, message in rows:
+        toggled.add_message(speaker, message, timestamp)
+        fixed.add_message(speaker, message, timestamp)
+    for _, speaker, message in probes:
+        toggled.score_message(speaker, message, add_message_to_history=False)
+
+    caches = toggled._ngram_artifact_cache
+    toggled.except_token('so')
+    toggled.except_token('two over')
+    assert toggled._ngram_artifact_cache is caches
+    for _, speaker, message in probes:
+        assert toggled.score_message(speaker, message, add_message_to_history=False) == \
+            fixed.score_message(speaker, message, add_message_to_history=False)
+    assert toggled.create_n_grams('so we have') == ['so we', 'so we have', 'we', 'we have', 'have']
+    toggled.include_token('so')
+    assert 'so' in toggled.create_n_grams('so we have')
+
+
+def test_self_repetitions_with_speaker_index():
+    rows = _random_dialogue(3, n_turns=40, speakers=('a', 'b', 'c', 'd', 'e'))
+    conversation = Conversation(persons=['a', 'b', 'c', 'd', 'e'], window=12)
+    for timestamp, speaker, message in rows:
+        indexed = copy.deepcopy(conversation)
+        scanned = copy.deepcopy(conversation)
+        additions, repetitions, expressions, pending = indexed.analyze_message(speaker, message)
+        # An explicit window is not covered by the index, so every turn is compared.
+        expected = scanned.analyze_message(speaker, message, list(scanned.history))
+        assert (additions, repetitions, expressions, list(pending)) == expected[:3] + (list(expected[3]),)
+        assert _state(indexed) == _state(scanned)
+        conversation.score_message(speaker, message, timestamp)
+
+
+def test_stats_report_skipped_turns():
+    conversation = Conversation(persons=['a', 'b'])
+    conversation.score_message('a', 'so we have two')
+    conversation.score_message('b', 'okay')
+    conversation.reset_stats()
+    conversation.score_message('b', 'we have')
+    stats = conversation.stats()
+    # 'okay' shares no token with 'we have' (the signatures of these token ids do not collide)
+    assert stats == {'turns': 2, 'skipped_by_signature': 1, 'skipped_by_speaker_index': 0, 'compared': 1,
+                     'skip_ratio': 0.5}
+
+
+def test_events_report_establishments_and_evictions(capsys):
+    conversation = Conversation(persons=['a', 'b'], window=2)
+    events = []
+    for event in conversation.events.EVENTS:
+        conversation.events.subscribe(event, lambda event=event, **data: events.append((event, data)))
+
+    conversation.score_message('a', 'the red box', '2025-01-01 00:00:00')
+    conversation.score_message('b', 'a red box', '2025-01-01 00:00:01')
+    conversation.score_message('a', 'red box again', '2025-01-01 00:00:02')
+    conversation.request('s', 'b', 'red box', add_message_to_history=False)
+
+    names = [event for event, _ in events]
+    assert names.count('score') == 4
+    establishment = next(data for event, data in events if event == 'establishment')
+    assert establishment['speaker'] == 'b' and 'red box' in establishment['expressions']
+    eviction = next(data for event, data in events if event == 'eviction')
+    assert eviction['turns'] == [('2025-01-01 00:00:00', 'a', 'the red box')]
+    assert capsys.readouterr().out == ''
+
+    copied = copy.deepcopy(conversation)
+    assert not copied.events
+    conversation.events.unsubscribe('score', conversation.events._subscribers['score'][0])
+    assert 'score' not in conversation.events
+
+
+def test_windowed_session_memory_is_bounded():
+    import tracemalloc
+
+    rows = list(synthetic_session(0, hours=2, seconds_per_turn=10, speakers=('a', 'b', 'c')))
+    conversation = Conversation(persons=['a', 'b', 'c'], window=timedelta(seconds=60))
+    # Prune as soon as the caches hold a few windows, so that a short session exercises it
+    conversation._cache_min_size = 128
+    warm_up = len(rows) // 3
+    tracemalloc.start()
+    try:
+        for count, (timestamp, speaker, message) in enumerate(rows):
+            conversation.score_message(speaker, message, timestamp)
+            if count == warm_up:
+                _, warm_up_peak = tracemalloc.get_traced_memory()
+                tracemalloc.reset_peak()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    # Twice as many turns after the warm-up, but no more memory than a fraction more
+    assert peak < 1.5 * warm_up_peak
+
+    stats = conversation.memory_stats()
+    assert stats['total'] == sum(size for name, size in stats.items() if name not in ('total', 'repetitions')) + \
+        sum(stats['repetitions'].values())
+    assert len(conversation._ngram_artifact_cache[(1, None)]) <= 128
+
+
+def test_snapshots_score_while_the_writer_appends():
+    import pickle
+    import threading
+    from dialign_python.snapshot import SharedConversation
+
+    rows = _random_dialogue(0, n_turns=60)
+    candidates = [(speaker, message) for _, speaker, message in _random_dialogue(1, n_turns=20)] + \
+        [('d', 'so we have two')]
+    shared = SharedConversation(Conversation(persons=['a', 'b', 'c'], window=8))
+    reference = Conversation(persons=['a', 'b', 'c'], window=8)
+    for timestamp, speaker, message in rows[:30]:
+        shared.score_message(speaker, message, timestamp)
+        reference.score_message(speaker, message, timestamp)
+    expected = [reference.score_message(speaker, message, add_message_to_history=False)
+                for speaker, message in candidates]
+
+    snapshot = shared.snapshot()
+    assert snapshot.version == 30 and shared.snapshot() is snapshot
+    results = {}
+
+    def read(reader):
+        results[reader] = [snapshot.score_message(speaker, message) for speaker, message in candidates * 2]
+
+    def write():
+        for timestamp, speaker, message in rows[30:]:
+            shared.score_message(speaker, message, timestamp)
+
+    threads = [threading.Thread(target=write)] + [threading.Thread(target=read, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert all(result == expected * 2 for result in results.values())
+    assert pickle.loads(pickle.dumps(snapshot)).score_message(*candidates[0]) == expected[0]
+    assert shared.version == 60 and shared.snapshot().version == 60
+
+
+def test_snapshot_pool_scores_in_processes():
+    import os
+    from dialign_python.snapshot import SharedConversation, SnapshotPool
+
+    rows = _random_dialogue(2, n_turns=40)
+    candidates = [(speaker, message) for _, speaker, message in _random_dialogue(3, n_turns=15)]
+    shared = SharedConversation(Conversation(persons=['a', 'b', 'c'], window=6))
+    with SnapshotPool(n_jobs=2) as pool:
+        for start, end in [(0, 20), (20, 40)]:
+            for timestamp, speaker, message in rows[start:end]:
+                shared.score_message(speaker, message, timestamp)
+            snapshot = shared.snapshot()
+            expected = [snapshot.score_message(speaker, message) for speaker, message in candidates]
+            assert pool.score_messages(snapshot, candidates) == expected
+            assert pool.score_messages(snapshot, candidates[:3], focus_conversation=['a', 'b']) == \
+                [snapshot.score_message(speaker, message, ['a', 'b']) for speaker, message in candidates[:3]]
+            path = pool._path
+            assert os.path.exists(path)
+    assert not os.path.exists(path)
+
+
+def test_snapshot_workers_restore_a_reused_path_of_another_version(tmp_path):
+    import pickle
+    from dialign_python import snapshot as snapshot_module
+
+    path = str(tmp_path / "state.pkl")
+    conversation = Conversation(persons=['a', 'b'])
+    candidates = [('b', 'so we have two')]
+    try:
+        for version, (speaker, message) in enumerate([('a', 'so we'), ('a', 'we have two')]):
+            conversation.score_message(speaker, message)
+            with open(path, 'wb') as file:
+                pickle.dump(conversation, file)
+            expected = snapshot_module.ConversationSnapshot(version, pickle.dumps(conversation)).score_message(
+                *candidates[0])
+            assert snapshot_module._score_candidates(path, version, candidates, None) == [expected]
+    finally:
+        snapshot_module._worker_snapshot = None
+
+
+def test_conversations_share_n_grams_through_a_store():
+    import gc
+    from dialign_python.ngrams import NGramStore
+
+    store = NGramStore()
+    rows = _random_dialogue(2)
+    private = Conversation(persons=['a', 'b', 'c'], window=5)
+    sessions = [Conversation(persons=['a', 'b', 'c'], window=5, ngram_store=store) for _ in range(3)]
+    for timestamp, speaker, message in rows:
+        expected = private.score_message(speaker, message, timestamp)
+        for session in sessions:
+            assert session.score_message(speaker, message, timestamp) == expected
+
+    message = sessions[0].history.turns[-1].tokens
+    assert sessions[0]._get_n_gram_artifacts(message) is sessions[2]._get_n_gram_artifacts(message)
+    assert 0 < len(store) <= len(rows)
+    del sessions, session
+    gc.collect()
+    assert len(store) == 0
+
+
+def test_n_gram_store_survives_finalizers_during_acquire():
+    import gc
+    import threading
+    from collections import Counter
+    from dialign_python.ngrams import NGramStore
+
+    store = NGramStore()
+    collected = Conversation(persons=['a', 'b'], ngram_store=store)
+    collected.score_message('a', 'so we have two')
+    # A cycle, so that only a garbage collection frees the conversation and runs its finalizer
+    collected.cycle = collected
+    del collected
+
+    def build():
+        gc.collect()
+        return ['x'], {'x'}, Counter(['x'])
+
+    thread = threading.Thread(target=store.acquire, args=(('key',), build), daemon=True)
+    thread.start()
+    thread.join(timeout=10)
+    assert not thread.is_alive()
+    assert len(store) == 1
+
+
+def test_sketch_conversation_approximates_scores():
+    from dialign_python.sketch import SketchConversation
+
+    rows = list(synthetic_session(0, hours=2, seconds_per_turn=10))
+    exact = Conversation(persons=['a', 'b'])
+    approximate = SketchConversation(persons=['a', 'b'])
+    errors = []
+    for timestamp, speaker, message in rows:
+        expected = exact.score_message(speaker, message, timestamp)
+        scores = approximate.score_message(speaker, message, timestamp)
+        errors.append([abs(a - b) for a, b in zip(expected[:3], scores[:3])])
+    der_error, dser_error, dee_error = (sum(error) / len(errors) for error in zip(*errors))
+    assert der_error < 0.01 and dser_error < 0.01 and dee_error < 0.01
+    assert len(approximate.history) == 0 and approximate.length == len(rows)
+
+
+def test_sketch_benchmark_reports_the_differences(capsys):
+    from dialign_python.sketch import benchmark_sketch, main
+
+    result = benchmark_sketch(0.5, width=1 << 12, depth=4)
+    assert result['turns'] == 180 and all(0 <= result[score] < 1 for score in ('DER', 'DSER', 'DEE'))
+    assert main(['--hours', '0.5', '--width', '4096', '--depth', '4']) == 0
+    assert capsys.readouterr().out == (f"0.5 hours, width 4096, depth 4, 180 turns: DER {result['DER']:.4f}, "
+                                       f"DSER {result['DSER']:.4f}, DEE {result['DEE']:.4f}\n")
+
+
+def test_sqlite_history_matches_memory_and_reopens(tmp_path):
+    from dialign_python.sqlite_history import SQLiteHistory, open_conversation
+
+    rows = list(synthetic_session(1, hours=0.5, seconds_per_turn=10, speakers=('a', 'b', 'c')))
+    path = str(tmp_path / "session.db")
+    history = SQLiteHistory(path, cache_size=50)
+    stored = Conversation(history_store=history)
+    in_memory = Conversation()
+    for timestamp, speaker, message in rows:
+        assert stored.score_message(speaker, message, timestamp) == in_memory.score_message(speaker, message,
+                                                                                            timestamp)
+    assert len(history.working_set()) == 50 and history == in_memory.history
+    history.save_state(stored)
+    history.close()
+
+    reopened = open_conversation(path)
+    assert len(reopened.history) == len(rows)
+    assert dict(reopened.shared_expressions.items()) == dict(in_memory.shared_expressions.items())
+    timestamp, speaker, message = rows[7]
+    assert reopened.score_message(speaker, message, timestamp) == in_memory.score_message(speaker, message, timestamp)
+    reopened.history.close()
+
+
+def test_score_message_degrades_past_budget():
+    words = ' '.join(f"w{i % 7}" for i in range(60))
+    conversation = Conversation()
+    conversation.score_message('robot', words)
+
+    exact = conversation.score_message('student', words, add_message_to_history=False)
+    assert not exact.degraded
+    within_budget = conversation.score_message('student', words, add_message_to_history=False, budget=60)
+    assert within_budget == exact and not within_budget.degraded
+
+    degraded = conversation.score_message('student', words, add_message_to_history=False, budget=0)
+    der, dser, dee, established_expressions, _, _ = degraded
+    assert degraded.degraded and 0 < der <= exact.der
+    assert established_expressions and all(len(n_gram.split()) <= conversation.degraded_max_ngram
+                                           for n_gram in established_expressions)
+    assert len(conversation.shared_expressions) == 0
+
+
+def test_score_message_budget_bounds_the_n_grams_of_long_messages():
+    rng = random.Random(0)
+    vocabulary = [f"w{i}" for i in range(60)]
+    conversation = Conversation()
+    conversation.score_message('robot', ' '.join(rng.choice(vocabulary) for _ in range(20)))
+    conversation.score_message('student', ' '.join(rng.choice(vocabulary) for _ in range(20)))
+
+    long_message = ' '.join(rng.choice(vocabulary) for _ in range(800))
+    start = time.perf_counter()
+    result = conversation.score_message('robot', long_message, budget=0.05)
+    assert result.degraded and time.perf_counter() - start < 1
+
+    # The n-grams of the message were not built to index it, which does not hide the robot's self-repetitions.
+    repeated = ' '.join(long_message.split()[100:106])
+    assert repeated in conversation.score_message('robot', repeated).personal_repetitions
+
+
+def test_degraded_analysis_is_committed_to_the_lexicon():
+    exact = Conversation()
+    degraded = Conversation()
+    for conversation in (exact, degraded):
+        conversation.score_message('robot', 'the quick brown fox jumps')
+
+    assert exact.score_message('student', 'the quick brown fox jumps today').established_expressions == [
+        'the quick brown fox jumps']
+    result = degraded.score_message('student', 'the quick brown fox jumps today', budget=0)
+    assert result.degraded
+    assert sorted(result.established_expressions) == ['brown fox', 'fox jumps', 'quick brown', 'the quick']
+
+    # The lexicon keeps what the degraded analysis found, so later messages are scored against other expressions.
+    assert 'quick brown' in degraded.shared_expressions and 'quick brown' not in exact.shared_expressions
+    assert 'the quick brown fox jumps' not in degraded.shared_expressions
+    assert degraded.score_message('robot', 'quick brown').established_expressions == []
+    assert exact.score_message('robot', 'quick brown').established_expressions == ['quick brown']
@@ -0,0 +1,5 @@
+from dialign_python.differential import check_seeds
+
+
+def test_engines_match_the_reference():
+    assert check_seeds(range(40)) == {}
@@ -1,4 +1,6 @@
-from dialign_python.dialign_python_offline import dialign
+import itertools
+import pytest
+from dialign_python.dialign_python_offline import dialign, dialign_sweep
 
 input_file = "./dialign_python/sample_offline_input.csv"
 speaker_col = "Speaker"
@@ -29,3 +31,178 @@ def test_dialign_offline():
 
     assert speaker_independent == speaker_independent_expected
     assert speaker_dependent == speaker_dependent_expected
+
+
+def test_dialign_sweep_matches_dialign():
+    windows = [None, 3]
+    exception_tokens = [None, ['.', ',']]
+    min_ngrams = [1, 2]
+    max_ngrams = [None, 2]
+    sweep = dialign_sweep(input_file, speaker_col, message_col, timestamp_col, valid_speakers, filters=filters,
+                          windows=windows, exception_tokens=exception_tokens, min_ngrams=min_ngrams,
+                          max_ngrams=max_ngrams, time_format=time_format, tokenizer=str.split, n_jobs=2)
+    assert len(sweep) == 16
+
+    configs = itertools.product(min_ngrams, max_ngrams, windows, exception_tokens)
+    for (_, row), (min_ngram, max_ngram, window, exceptions) in zip(sweep.iterrows(), configs):
+        speaker_independent, speaker_dependent, _, self_repetitions, _ = dialign(
+            input_file, speaker_col, message_col, timestamp_col, valid_speakers, filters=filters, window=window,
+            exception_tokens=exceptions, min_ngram=min_ngram, max_ngram=max_ngram, time_format=time_format,
+            tokenizer=str.split)
+        assert row['min_ngram'] == min_ngram
+        for name, value in speaker_independent.items():
+            assert row[name] == value
+        for scores in (speaker_dependent, self_repetitions):
+            for speaker, data in scores.items():
+                for name, value in data.items():
+                    assert row[f'{name}_{speaker}'] == value
+
+
+def test_dialign_resumes_from_checkpoint(tmp_path):
+    import pandas as pd
+    from dialign_python.dialign_python_offline import DialignCheckpoint
+
+    df = pd.read_csv(input_file)
+    full = dialign(input_file, speaker_col, message_col, timestamp_col, valid_speakers, filters=filters, window=4,
+                   time_format=time_format, tokenizer=str.split)
+
+    checkpoint_file = str(tmp_path / "checkpoint.pkl")
+    for stop in [5, 12, len(df)]:
+        prefix_file = str(tmp_path / "prefix.csv")
+        df.iloc[:stop].to_csv(prefix_file, index=False)
+        checkpoint = DialignCheckpoint.load(checkpoint_file) if stop > 5 else None
+        *results, checkpoint = dialign(prefix_file, speaker_col, message_col, timestamp_col, valid_speakers,
+                                       filters=filters, window=4, time_format=time_format, tokenizer=str.split,
+                                       checkpoint=checkpoint, return_checkpoint=True)
+        checkpoint.save(checkpoint_file)
+    assert tuple(results) == full
+
+    with pytest.raises(ValueError):
+        dialign(input_file, speaker_col, message_col, timestamp_col, valid_speakers, filters=filters, window=5,
+                time_format=time_format, tokenizer=str.split, checkpoint=checkpoint)
+    # The tokenizer and the filters decide the rows and the tokens, so they must match too
+    with pytest.raises(ValueError):
+        dialign(input_file, speaker_col, message_col, timestamp_col, valid_speakers, filters=filters, window=4,
+                time_format=time_format, tokenizer=lambda text: text.split(), checkpoint=checkpoint)
+    with pytest.raises(ValueError):
+        dialign(input_file, speaker_col, message_col, timestamp_col, valid_speakers, window=4,
+                time_format=time_format, tokenizer=str.split, checkpoint=checkpoint)
+
+
+def test_read_transcript_columnar_formats(tmp_path):
+    import pandas as pd
+    from dialign_python.dialign_python_offline import read_transcript
+
+    expected = read_transcript(input_file, speaker_col, message_col, valid_speakers=valid_speakers, filters=filters,
+                               columns=[timestamp_col])
+    assert list(expected.columns) == [speaker_col, message_col, timestamp_col, 'Receiver']
+
+    df = pd.read_csv(input_file)
+    df.loc[0, speaker_col] = 'Emma:'
+    paths = [str(tmp_path / "transcript.jsonl"), str(tmp_path / "transcript.csv")]
+    df.to_json(paths[0], orient='records', lines=True)
+    df.to_csv(paths[1], index=False)
+    try:
+        import pyarrow  # noqa: F401
+        paths += [str(tmp_path / "transcript.parquet"), str(tmp_path / "transcript.feather")]
+        df.to_parquet(paths[2])
+        df.to_feather(paths[3])
+    except ImportError:
+        pass
+    for path in paths:
+        transcript = read_transcript(path, speaker_col, message_col, valid_speakers=valid_speakers, filters=filters,
+                                     columns=[timestamp_col], chunksize=3)
+        pd.testing.assert_frame_equal(transcript, expected)
+
+
+def test_dialign_parallel_matches_sequential(tmp_path):
+    from datetime import timedelta
+    import random
+    import pandas as pd
+
+    rng = random.Random(0)
+    words = "the red box is on a big table near blue chair we can see it now".split()
+    speakers = ["A", "B", "C"]
+    rows = [{'Timestamp': f"00:{i // 6:02d}:{i * 10 % 60:02d}.000000", 'Speaker': speakers[rng.randrange(3)],
+             'Utterance': ' '.join(rng.choice(words) for _ in range(rng.randint(1, 8)))} for i in range(120)]
+    transcript = str(tmp_path / "transcript.csv")
+    pd.DataFrame(rows).to_csv(transcript, index=False)
+
+    for window in [None, 3, timedelta(seconds=30)]:
+        options = dict(window=window, time_format=time_format, tokenizer=str.split, exception_tokens=['the'])
+        sequential = dialign(transcript, speaker_col, message_col, timestamp_col, **options)
+        assert dialign(transcript, speaker_col, message_col, timestamp_col, n_jobs=2, **options) == sequential
+
+
+def test_iter_dialign_matches_dialign():
+    from dialign_python.dialign_python_offline import iter_dialign, read_transcript
+
+    df = read_transcript(input_file, speaker_col, message_col, valid_speakers=valid_speakers, filters=filters,
+                         columns=[timestamp_col])
+    *expected, online_metrics = dialign(input_file, speaker_col, message_col, timestamp_col, valid_speakers,
+                                        filters=filters, window=4, time_format=time_format, tokenizer=str.split)
+
+    rows = zip(df[speaker_col], df[message_col], df[timestamp_col])
+    metrics = []
+
+    def consume():
+        results = yield from iter_dialign(rows, valid_speakers, window=4, time_format=time_format,
+                                          tokenizer=str.split)
+        metrics.append(results)
+
+    assert list(consume()) == online_metrics
+    assert metrics == [tuple(expected)]
+
+
+def test_conversation_metrics_match_dialign():
+    *outputs, checkpoint = dialign(input_file, speaker_col, message_col, timestamp_col, valid_speakers,
+                                   filters=filters, time_format=time_format, tokenizer=str.split,
+                                   return_checkpoint=True)
+    speaker_independent, speaker_dependent, _, self_repetitions, _ = outputs
+    assert checkpoint.conversation.metrics() == (pytest.approx(speaker_independent),
+                                                 {speaker: pytest.approx(scores)
+                                                  for speaker, scores in speaker_dependent.items()},
+                                                 {speaker: pytest.approx(scores)
+                                                  for speaker, scores in self_repetitions.items()})
+
+
+def test_dialign_curves_match_dialign_on_each_window(tmp_path):
+    from datetime import datetime, timedelta
+    import random
+    import pandas as pd
+    from dialign_python.conversation import Conversation
+    from dialign_python.dialign_python_offline import DialignCheckpoint, dialign_curves, read_transcript
+    from dialign_python.pipeline import tokenize_texts
+    from dialign_python.person import Person
+
+    rng = random.Random(1)
+    words = "the red box is on a big table near blue chair we can see it now".split()
+    speakers = ["A", "B", "C"]
+    rows = [{'Timestamp': f"00:{i // 6:02d}:{i * 10 % 60:02d}.000000", 'Speaker': rng.choice(speakers),
+             'Utterance': ' '.join(rng.choice(words[:8]) for _ in range(rng.randint(1, 8)))} for i in range(60)]
+    transcript = str(tmp_path / "transcript.csv")
+    pd.DataFrame(rows).to_csv(transcript, index=False)
+    df = read_transcript(transcript, speaker_col, message_col, columns=[timestamp_col])
+    times = [datetime.strptime(timestamp, time_format) for timestamp in df[timestamp_col]]
+    tokenized = [(speaker, message, num_tokens, timestamp) for speaker, (message, num_tokens), timestamp
+                 in zip(df[speaker_col], tokenize_texts(list(df[message_col]), str.split), df[timestamp_col])]
+
+    for window in [None, 4, timedelta(seconds=45)]:
+        curves = dialign_curves(transcript, speaker_col, message_col, timestamp_col, speakers, window=window,
+                                exception_tokens=['the'], time_format=time_format, tokenizer=str.split)
+        assert len(curves['EV']) == len(rows)
+        for end in range(len(rows)):
+            start = curves['First turn'][end]
+            assert window is not None or start == 0
+            assert not isinstance(window, int) or start == max(0, end - window + 1)
+            assert not isinstance(window, timedelta) or times[end] - times[start] <= window
+            conversation = Conversation(persons={speaker: Person(speaker) for speaker in speakers},
+                                        exception_tokens=['the'], time_format=time_format)
+            checkpoint = DialignCheckpoint(conversation, speakers)
+            checkpoint.update(tokenized[start:end + 1])
+            tokens = checkpoint.total_tokens
+            assert curves['Total tokens'][end] == tokens
+            assert curves['Num. shared expressions'][end] == len(conversation.shared_expressions)
+            assert curves['EV'][end] == pytest.approx(len(conversation.shared_expressions) / tokens)
+            assert curves['ER'][end] == pytest.approx(checkpoint.repetition_num / tokens)
+            assert curves['EE'][end] == pytest.approx(checkpoint.establishment_num / tokens)
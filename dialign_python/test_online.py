@@ -0,0 +1,71 @@
+import csv
+from dialign_python.dialign_python_online import Conversation
+from dialign_python.transcript_writer import TranscriptWriter
+
+
+def _read_rows(path):
+    with open(path, newline='') as file:
+        return list(csv.reader(file, delimiter='\t'))
+
+
+def test_request_modes(tmp_path):
+    conversation = Conversation(suppress_debug=True, output_file=str(tmp_path / "out.tsv"))
+    conversation.request('a', 'Emma', 'hello human')
+    conversation.request('a', 'Human', 'hello emma')
+    der, dser, dee = conversation.request('s', 'Emma', 'hello again', 0)
+    assert (der, dser, dee) == (0.5, 0.5, 0.5)
+    assert conversation.length == 2
+    assert conversation.shared_expressions == {}
+
+    der, dser, dee = conversation.request('s', 'Emma', 'hello again', 1)
+    assert (der, dser, dee) == (0.5, 0.5, 0.5)
+    assert conversation.length == 3
+    assert list(conversation.shared_expressions) == ['hello']
+    assert conversation.lexicon_of_shared_expressions == {'hello': ['human', 2, 1]}
+
+    conversation.request('e', ['hello'])
+    assert sorted(conversation.create_n_grams('hello again')) == ['again', 'hello again']
+    conversation.request('i', ['hello'])
+    conversation.request('n', 1, 2)
+    assert (conversation.min_ngram, conversation.max_ngram) == (1, 2)
+
+    conversation.close()
+    assert [row[1:] for row in _read_rows(tmp_path / "out.tsv")] == [
+        ['emma', 'hello human'], ['human', 'hello emma'], ['emma', 'hello again']]
+
+
+def test_scoring_is_silent_by_default(tmp_path, capsys):
+    conversation = Conversation(output_file=str(tmp_path / "out.tsv"))
+    scores = []
+    conversation.events.subscribe('score', lambda speaker, message, der, dser, dee: scores.append(der))
+    conversation.request('a', 'Emma', 'hello human')
+    conversation.request('s', 'Human', 'hello emma', 1)
+    conversation.close()
+    assert capsys.readouterr().out == ''
+    assert scores == [0.5]
+
+
+def test_writer_flush_policy(tmp_path):
+    path = tmp_path / "out.tsv"
+    with TranscriptWriter(str(path), flush_every=3) as writer:
+        writer.write('t1', 'a', 'one')
+        writer.write('t2', 'b', 'two')
+        assert not path.exists()
+        writer.write('t3', 'a', 'three\tfour')
+        assert len(_read_rows(path)) == 3
+        writer.write('t4', 'b', 'five')
+    assert _read_rows(path)[-2:] == [['t3', 'a', 'three\tfour'], ['t4', 'b', 'five']]
+
+
+def test_unclosed_writer_is_freed_and_flushed(tmp_path):
+    import gc
+    import weakref
+
+    path = tmp_path / "out.tsv"
+    writer = TranscriptWriter(str(path), flush_every=10)
+    writer.write('t1', 'a', 'one')
+    reference = weakref.ref(writer)
+    del writer
+    gc.collect()
+    assert reference() is None
+    assert _read_rows(path) == [['t1', 'a', 'one']]
@@ -0,0 +1,53 @@
+from datetime import datetime
+import pytest
+from dialign_python.conversation import Conversation
+from dialign_python.dialign_python_online import Conversation as OnlineConversation
+from dialign_python.trace import TraceRecorder, read_trace, replay_trace
+
+
+def test_trace_record_and_replay(tmp_path):
+    conversation = Conversation(window=3)
+    conversation.add_message('emma', 'hello human', '2025-02-25 22:27:10')
+    path = tmp_path / "session.jsonl"
+    with TraceRecorder(conversation, str(path)):
+        conversation.score_message('human', 'hello emma', '2025-02-25 22:27:21')
+        conversation.score_message('emma', 'hello again', add_message_to_history=False)
+        conversation.score_message('emma', 'hello human', focus_conversation=['human'])
+        conversation.request('a', 'human', 'bye emma')
+        conversation.request('s', 'emma', 'bye human')
+    assert 'score_message' not in vars(conversation)
+
+    header, calls = read_trace(str(path))
+    calls = list(calls)
+    assert header['history'] == [['2025-02-25 22:27:10', 'emma', 'hello human']] and header['window'] == 3
+    assert [call['call'] for call in calls] == ['score_message'] * 3 + ['request'] * 2
+    # Only the arguments that were passed are recorded, so traces replay on versions with other defaults
+    assert calls[0]['args'] == {'speaker': 'human', 'message': 'hello emma', 'timestamp': '2025-02-25 22:27:21'}
+    assert calls[3]['args'] == {'mode': 'a', 'speaker': 'human', 'message': 'bye emma'}
+
+    report = replay_trace(str(path), repeat=2)
+    assert {kind: stats['calls'] for kind, stats in report.items()} == {
+        'score_message': 2, 'score_message without history': 2, 'score_message with focus': 2, 'request a': 2,
+        'request s': 2, 'all': 10}
+    assert report['all']['p50_ms'] <= report['all']['p95_ms'] <= report['all']['p99_ms']
+
+
+def test_trace_encodes_datetimes_and_rejects_other_values(tmp_path):
+    conversation = Conversation(window=3)
+    path = tmp_path / "session.jsonl"
+    with TraceRecorder(conversation, str(path)):
+        conversation.add_message('human', 'see you', datetime(2025, 2, 25, 22, 28))
+        with pytest.raises(TypeError):
+            conversation.score_message('emma', 'see you', object())
+    assert [call['args'] for call in read_trace(str(path))[1]] == [
+        {'speaker': 'human', 'message': 'see you', 'timestamp': datetime(2025, 2, 25, 22, 28)}]
+
+
+def test_trace_replays_the_online_conversation(tmp_path):
+    path = tmp_path / "session.jsonl"
+    online = OnlineConversation(output_file=str(tmp_path / "out.tsv"))
+    with TraceRecorder(online, str(path)):
+        online.request('a', 'Emma', 'hello human')
+        online.request('s', 'Human', 'hello emma', 1)
+    online.close()
+    assert set(replay_trace(str(path))) == {'request a', 'request s', 'all'}
@@ -0,0 +1,306 @@
+import argparse
+import functools
+import importlib
+import inspect
+import json
+import math
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterator, List
+
+from dialign_python.conversation import Conversation
+
+TRACE_VERSION = 1
+TRACED_METHODS = ('add_message', 'score_message', 'request')
+
+
+def _encode(value):
+    """
+    Encode the values JSON has no type for. Datetimes (e.g., timestamps) are tagged so that replays restore them.
+    Other values cannot be replayed faithfully, so they are rejected instead of being recorded as strings.
+    """
+    if isinstance(value, datetime):
+        return {'$datetime': value.isoformat()}
+    raise TypeError(f"Cannot record a value of type {type(value).__name__} in a trace.")
+
+
+def _decode(value: dict):
+    if value.keys() == {'$datetime'}:
+        return datetime.fromisoformat(value['$datetime'])
+    return value
+
+
+class TraceRecorder:
+    def __init__(self, conversation: Conversation, path: str):
+        """
+        Records the calls of a conversation to add_message, score_message, and request to a trace file, so that the
+        session can be replayed against other versions of the code (see replay_trace). The trace is a JSON lines
+        file: a header with the configuration and the history of the conversation when recording starts, then one
+        line per call with its kind (see call_kind), the arguments that were passed, and its latency. Only the
+        calls made by the application are recorded, not the calls the conversation makes to itself (e.g.,
+        score_message adding the message). Defaults are not recorded, so that traces replay on versions whose
+        methods have other parameters. Arguments that JSON cannot represent, except datetimes, raise a TypeError
+        before the call is made.
+
+        Use the recorder as a context manager, or call start and stop.
+
+        Args:
+            conversation (Conversation): the conversation to record
+            path (str): the trace file. It is overwritten.
+        """
+        self.conversation = conversation
+        self.path = path
+        self._file = None
+        self._depth = 0
+
+    def __enter__(self) -> 'TraceRecorder':
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        conversation = self.conversation
+        if self._file is not None:
+            raise ValueError("The recorder is already started.")
+        if any(name in vars(conversation) for name in TRACED_METHODS):
+            raise ValueError("The conversation is already being recorded.")
+        window = conversation.window
+        header = {'trace': TRACE_VERSION,
+                  'conversation': f'{type(conversation).__module__}:{type(conversation).__qualname__}',
+                  'window': window if isinstance(window, int) else None,
+                  'window_seconds': window.total_seconds() if isinstance(window, timedelta) else None,
+                  'min_ngram': conversation.min_ngram, 'max_ngram': conversation.max_ngram,
+                  'exception_tokens': list(conversation.exception_tokens), 'time_format': conversation.time_format,
+                  'persons': list(conversation.persons), 'history': [list(turn) for turn in conversation.history]}
+        self._file = open(self.path, 'w', encoding='utf-8')
+        self._file.write(json.dumps(header, default=_encode) + '\n')
+        # The wrappers shadow the methods on the instance (see Conversation.__getstate__).
+        for name in TRACED_METHODS:
+            setattr(conversation, name, self._wrap(name, getattr(conversation, name)))
+
+    def stop(self):
+        if self._file is None:
+            return
+        for name in TRACED_METHODS:
+            vars(self.conversation).pop(name, None)
+        self._file.close()
+        self._file = None
+
+    def _wrap(self, name: str, method: Callable) -> Callable:
+        signature = inspect.signature(method)
+
+        @functools.wraps(method)
+        def traced(*args, **kwargs):
+            if self._depth:
+                return method(*args, **kwargs)
+            bound = signature.bind(*args, **kwargs)
+            arguments = json.dumps(bound.arguments, default=_encode)
+            # The kind depends on the defaults of the recorded version, so it is resolved now.
+            bound.apply_defaults()
+            kind = call_kind({'call': name, 'args': bound.arguments})
+            self._depth += 1
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                self._depth -= 1
+                self._file.write(f'{{"call": {json.dumps(name)}, "kind": {json.dumps(kind)}, '
+                                 f'"args": {arguments}, "elapsed": {json.dumps(elapsed)}}}\n')
+        return traced
+
+
+def read_trace(path: str) -> tuple[dict, Iterator[dict]]:
+    """
+    Read a trace written by TraceRecorder.
+
+    Args:
+        path (str): the trace file
+
+    Returns:
+        tuple: the header and the calls, each a dictionary with call, kind, args, and elapsed (the recorded latency
+        in seconds)
+    """
+    with open(path, encoding='utf-8') as file:
+        lines = [json.loads(line, object_hook=_decode) for line in file if line.strip()]
+    if not lines or lines[0].get('trace') != TRACE_VERSION:
+        raise ValueError(f"{path} is not a trace of version {TRACE_VERSION}.")
+    return lines[0], iter(lines[1:])
+
+
+def call_kind(call: dict) -> str:
+    """
+    The kind latencies are reported by: the method, its mode for request, and whether the message was scored
+    without being added or against a focus conversation. Calls read from a trace have their kind recorded, the kind
+    of other calls is computed from all their arguments, defaults included.
+    """
+    if 'kind' in call:
+        return call['kind']
+    args = call['args']
+    kind = call['call'] if call['call'] != 'request' else f"request {args.get('mode')}"
+    if call['call'] == 'score_message' or args.get('mode') == 's':
+        # The online conversation adds scored messages if scoring_condition is 1.
+        if not args.get('add_message_to_history', args.get('scoring_condition') == 1):
+            kind += ' without history'
+        if args.get('focus_conversation') is not None:
+            kind += ' with focus'
+    return kind
+
+
+def restore_conversation(header: dict, conversation_factory: Callable[..., Conversation] | None = None) -> Conversation:
+    """
+    The conversation of a trace when recording started. The history is ingested with load_history, so the shared
+    expressions and the self-repetitions are rebuilt from it. Conversations that log messages (see
+    dialign_python_online.Conversation) log them to os.devnull, without printing scores.
+
+    Args:
+        header (dict): the header of the trace
+        conversation_factory (function, optional): called with the configuration as keyword arguments (window,
+        persons, exception_tokens, min_ngram, max_ngram, and time_format), without those it does not accept. Defaults
+        to the class of the recorded conversation.
+
+    Returns:
+        Conversation: the conversation
+    """
+    if conversation_factory is None:
+        module, _, name = header['conversation'].partition(':')
+        conversation_factory = getattr(importlib.import_module(module), name)
+    window = header['window']
+    if header['window_seconds'] is not None:
+        window = timedelta(seconds=header['window_seconds'])
+    options = {'window': window, 'persons': list(header['persons']),
+               'exception_tokens': list(header['exception_tokens']), 'min_ngram': header['min_ngram'],
+               'max_ngram': header['max_ngram'], 'time_format': header['time_format'], 'output_file': os.devnull,
+               'suppress_debug': True}
+    parameters = inspect.signature(conversation_factory).parameters
+    if not any(parameter.kind == parameter.VAR_KEYWORD for parameter in parameters.values()):
+        options = {key: value for key, value in options.items() if key in parameters}
+    conversation = conversation_factory(**options)
+    if header['history']:
+        conversation.load_history([tuple(turn) for turn in header['history']])
+    return conversation
+
+
+def percentile(latencies: List[float], q: float) -> float:
+    """
+    The nearest-rank percentile q (between 0 and 100) of sorted latencies.
+    """
+    return latencies[max(0, math.ceil(q / 100 * len(latencies)) - 1)]
+
+
+def summarize_latencies(latencies: Dict[str, List[float]]) -> Dict[str, Dict[str, float]]:
+    """
+    Per kind of call and for all the calls ('all'), the number of calls, the p50, p95, p99, and mean latencies in
+    milliseconds, and the throughput in calls per second.
+
+    Args:
+        latencies (dict): the latencies in seconds of each kind of call
+
+    Returns:
+        dict: the statistics of each kind of call
+    """
+    latencies = dict(latencies)
+    latencies['all'] = [latency for kind_latencies in latencies.values() for latency in kind_latencies]
+    report = {}
+    for kind, kind_latencies in latencies.items():
+        if not kind_latencies:
+            continue
+        kind_latencies = sorted(kind_latencies)
+        total = sum(kind_latencies)
+        report[kind] = {'calls': len(kind_latencies),
+                        'p50_ms': percentile(kind_latencies, 50) * 1000,
+                        'p95_ms': percentile(kind_latencies, 95) * 1000,
+                        'p99_ms': percentile(kind_latencies, 99) * 1000,
+                        'mean_ms': total / len(kind_latencies) * 1000,
+                        'calls_per_s': len(kind_latencies) / total if total else math.inf}
+    return report
+
+
+def recorded_latencies(path: str) -> Dict[str, Dict[str, float]]:
+    """
+    The latencies recorded in a trace, summarized like replay_trace.
+    """
+    _, calls = read_trace(path)
+    latencies = {}
+    for call in calls:
+        latencies.setdefault(call_kind(call), []).append(call['elapsed'])
+    return summarize_latencies(latencies)
+
+
+def replay_trace(path: str, repeat: int = 1,
+                 conversation_factory: Callable[..., Conversation] | None = None) -> Dict[str, Dict[str, float]]:
+    """
+    Replay the calls of a trace against the current code and measure their latencies. Each repetition restores the
+    conversation of the trace (see restore_conversation), which is not timed, and makes the calls in order.
+
+    Args:
+        path (str): the trace file
+        repeat (int, optional): number of replays. Defaults to 1.
+        conversation_factory (function, optional): see restore_conversation. Defaults to the class of the recorded
+        conversation.
+
+    Returns:
+        dict: the statistics of each kind of call (see summarize_latencies)
+    """
+    header, calls = read_trace(path)
+    calls = list(calls)
+    latencies = {}
+    for _ in range(repeat):
+        conversation = restore_conversation(header, conversation_factory)
+        for call in calls:
+            method = getattr(conversation, call['call'])
+            start = time.perf_counter()
+            method(**call['args'])
+            latencies.setdefault(call_kind(call), []).append(time.perf_counter() - start)
+    return summarize_latencies(latencies)
+
+
+def format_report(report: Dict[str, Dict[str, float]]) -> str:
+    """
+    A table of the statistics returned by replay_trace or recorded_latencies.
+    """
+    columns = ['calls', 'p50_ms', 'p95_ms', 'p99_ms', 'mean_ms', 'calls_per_s']
+    width = max(len('kind'), *(len(kind) for kind in report))
+    lines = ['kind'.ljust(width) + ''.join(column.rjust(12) for column in columns)]
+    for kind, stats in report.items():
+        lines.append(kind.ljust(width) + f"{stats['calls']:12d}" +
+                     ''.join(f"{stats[column]:12.3f}" for column in columns[1:]))
+    return '\n'.join(lines)
+
+
+def main(argv: List[str] | None = None) -> int:
+    """
+    Replay traces and print the latencies of each, e.g., python -m dialign_python.trace session.jsonl --repeat 5.
+
+    Returns:
+        int: the exit status
+    """
+    parser = argparse.ArgumentParser(prog='python -m dialign_python.trace',
+                                     description="Replay traces recorded with TraceRecorder and report latencies.")
+    parser.add_argument('traces', nargs='+', help="trace files")
+    parser.add_argument('--repeat', type=int, default=1, help="number of replays of each trace")
+    parser.add_argument('--recorded', action='store_true', help="also report the latencies recorded in the trace")
+    parser.add_argument('--json', action='store_true', help="print the reports as JSON")
+    args = parser.parse_args(argv)
+
+    reports = {}
+    for path in args.traces:
+        reports[path] = {'replayed': replay_trace(path, repeat=args.repeat)}
+        if args.recorded:
+            reports[path]['recorded'] = recorded_latencies(path)
+    if args.json:
+        print(json.dumps(reports))
+    else:
+        for path, path_reports in reports.items():
+            for name, report in path_reports.items():
+                print(f"{path} ({name})")
+                print(format_report(report))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,88 @@
+import csv
+import time
+import weakref
+from typing import List
+
+
+def _write_rows(output_file: str, delimiter: str, rows: List[tuple[str, str, str]]):
+    """
+    Append rows to a delimited file and empty the list of rows.
+    """
+    if not rows:
+        return
+    with open(output_file, 'a', newline='') as file:
+        write_csv = csv.writer(file, delimiter=delimiter)
+        write_csv.writerows(rows)
+    rows.clear()
+
+
+class TranscriptWriter:
+    def __init__(self,
+                 output_file: str,
+                 flush_every: int = 32,
+                 flush_interval: float | None = None,
+                 delimiter: str = '\t'
+                 ):
+        """
+        Buffers conversation messages and appends them to a tab separated file in batches.
+
+        Args:
+            output_file (str): path of the file the messages are appended to.
+            flush_every (int, optional): number of buffered messages that triggers a flush. 1 writes every message
+            immediately. Defaults to 32.
+            flush_interval (float, optional): number of seconds after which a buffered message is flushed with the next
+            write, regardless of flush_every. Defaults to None (no time-based flushing).
+            delimiter (str, optional): column delimiter. Defaults to a tab.
+        """
+        if flush_every < 1:
+            raise ValueError("flush_every must be a positive integer.")
+        self.output_file = output_file
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.delimiter = delimiter
+        self._buffer: List[tuple[str, str, str]] = []
+        self._last_flush = time.monotonic()
+        self._closed = False
+        # Buffered rows must not be lost when the writer is garbage collected or the interpreter exits without an
+        # explicit close(). The finalizer only references the buffer, so writers that are never closed can be freed.
+        self._finalizer = weakref.finalize(self, _write_rows, output_file, delimiter, self._buffer)
+
+    def write(self, timestamp: str, speaker: str, message: str):
+        """
+        Buffer a message and flush the buffer if the flush policy says so.
+
+        Args:
+            timestamp (str): the string representation of the timestamp of the message
+            speaker (str): the speaker of the message
+            message (str): the utterance
+        """
+        if self._closed:
+            raise ValueError("Cannot write to a closed TranscriptWriter.")
+        self._buffer.append((timestamp, speaker, message))
+        if len(self._buffer) >= self.flush_every:
+            self.flush()
+        elif self.flush_interval is not None and time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """
+        Append all buffered messages to the output file.
+        """
+        self._last_flush = time.monotonic()
+        _write_rows(self.output_file, self.delimiter, self._buffer)
+
+    def close(self):
+        """
+        Flush the remaining messages. Further writes raise a ValueError.
+        """
+        if self._closed:
+            return
+        self.flush()
+        self._closed = True
+        self._finalizer.detach()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
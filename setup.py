@@ -7,6 +7,7 @@ setup(
     name='dialign_python',
     packages=find_packages(),
     install_requires = requirements,
+    entry_points={'console_scripts': ['dialign=dialign_python.cli:main']},
     version='0.1.1',
     description='Python implementation of Dialign',
     author='Yuya Asano, Paras Sharma, and Daniel Fritsch',